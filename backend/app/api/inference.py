@@ -235,7 +235,7 @@ async def verify_proof(job_id: str, verify_on_chain: bool = True):
     if not proof:
         raise HTTPException(status_code=404, detail="No proof found for this job")
     
-    # Local verification first
+    # Local verification first (memoized server-side)
     is_valid, message, verification_details = inference_engine.zkml.verify_proof(proof)
     
     # ON-CHAIN VERIFICATION (Decentralized!)
@@ -288,6 +288,35 @@ async def verify_proof(job_id: str, verify_on_chain: bool = True):
     )
 
 
+@router.post("/reverify", response_model=APIResponse)
+async def reverify_proofs(background_tasks: BackgroundTasks, model_id: str = None, force: bool = False):
+    """
+    Verify every stored proof (optionally for one model). Proofs with a
+    stored verification result are skipped unless force=True.
+    Runs in the background; poll /reverify/status.
+    """
+    if not inference_engine.zkml.start_reverify(model_id):
+        raise HTTPException(status_code=409, detail="A re-verification job is already running")
+    
+    background_tasks.add_task(inference_engine.zkml.reverify_all, model_id, force)
+    
+    return APIResponse(
+        success=True,
+        message="Re-verification started",
+        data={"model_id": model_id}
+    )
+
+
+@router.get("/reverify/status", response_model=APIResponse)
+async def reverify_status():
+    """Get the result of the last bulk re-verification"""
+    return APIResponse(
+        success=True,
+        message="Re-verification status",
+        data=inference_engine.zkml.last_reverify
+    )
+
+
 @router.post("/verify-on-chain/{job_id}", response_model=APIResponse)
 async def verify_on_chain_only(job_id: str):
     """
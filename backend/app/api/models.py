@@ -6,13 +6,14 @@ Now with IPFS decentralized storage support!
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
 from typing import Optional, List
 import os
-import shutil
 import tempfile
 from pathlib import Path
 
 from ..core.database import db
 from ..models.schemas import AIModel, AIModelCreate, APIResponse
 from ..services.ipfs_service import ipfs_service
+from ..services.pin_queue import pin_queue
+from ..services.blob_store import blob_store
 
 router = APIRouter(prefix="/models", tags=["Models"])
 
@@ -68,12 +69,13 @@ async def upload_model(
         
         model = db.create_model(model_data)
         
-        # Save file locally first (temp or permanent)
-        local_file_path = MODELS_STORAGE_PATH / f"{model['id']}{file_ext}"
-        with open(local_file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        file_size = os.path.getsize(local_file_path)
+        # Store content-addressed: identical uploads share one blob on disk
+        blob = blob_store.put_stream(file.file, file_ext)
+        blob_store.acquire(blob["content_hash"], blob["path"], blob["size_bytes"])
+        local_file_path = blob["path"]
+        file_size = blob["size_bytes"]
+        if blob["deduplicated"]:
+            print(f"[INFO] Model content already stored, reusing blob {blob['content_hash'][:12]}")
         
         # IPFS Upload
         ipfs_result = None
@@ -90,12 +92,20 @@ async def upload_model(
             
             if ipfs_result.get("success"):
                 print(f"✅ Model uploaded to IPFS: {ipfs_result.get('cid')}")
+                # The queue pins (or confirms the provider's upload pin) with
+                # retries, and registers the CID for the reconciler
+                pin_queue.enqueue(
+                    ipfs_result.get("cid"),
+                    name=name,
+                    metadata={"model_id": model['id'], "source": "upload"}
+                )
             else:
                 print(f"⚠️ IPFS upload failed, using local storage: {ipfs_result.get('error')}")
         
         # Update model with file info and IPFS data
         update_data = {
             "file_path": str(local_file_path),
+            "content_hash": blob["content_hash"],
             "metadata": {
                 **model['metadata'],
                 "file_size": file_size,
@@ -217,10 +227,17 @@ async def delete_model(model_id: str, owner_id: str):
     if model.get("owner_id") != owner_id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this model")
     
-    # Delete the file if it exists
-    if model.get("file_path") and os.path.exists(model["file_path"]):
+    # Drop our reference to the blob; the file goes when no model uses it
+    if model.get("content_hash"):
+        blob_store.release(model["content_hash"])
+    elif model.get("file_path") and os.path.exists(model["file_path"]):
         os.remove(model["file_path"])
     
+    # Uncache the CID once no other model points at it
+    cid = model.get("ipfs_cid")
+    if cid and not any(m.get("ipfs_cid") == cid for m in db.get_all_models() if m["id"] != model_id):
+        ipfs_service.release_cached(cid)
+    
     db.delete_model(model_id)
     
     return APIResponse(
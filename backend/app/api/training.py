@@ -1,9 +1,12 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Response
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 import uuid
+import asyncio
 from datetime import datetime
 from app.core.database import db
+from app.services.shard_planner import shard_planner
+from app.services.shard_scheduler import shard_scheduler
 
 router = APIRouter(tags=["training"])
 
@@ -17,24 +20,33 @@ class TrainingJobCreate(BaseModel):
     reward: float
     is_confidential: bool = False
     encrypted_threshold: Optional[str] = None
+    requires_proof: bool = False  # proof-heavy: only zk_capable workers get its shards
 
 @router.post("/training/jobs")
 async def create_training_job(job: TrainingJobCreate):
     """
-    Create a new training job and automatically shard it into 10 tasks.
+    Create a new training job and shard it by rows of its dataset.
+    
+    The shard count follows the dataset's size and the number of live
+    workers; each shard records its row range and, for OBDS datasets,
+    the byte ranges and chunk hashes workers fetch and verify.
     """
     job_id = str(uuid.uuid4())
     
-    # Create 10 shards
+    workers = db._read_file(db.workers_file)
+    live_workers = sum(1 for w in workers if w.get("is_live"))
+    plan = await asyncio.to_thread(shard_planner.plan, job.dataset_url, live_workers)
+    
     shards = []
-    for i in range(10):
+    for i, ranges in enumerate(plan["shards"]):
         shard = {
             "shard_id": f"{job_id}-shard-{i}",
             "shard_index": i,
             "status": "pending",
             "worker_id": None,
             "progress": 0,
-            "result_url": None
+            "result_url": None,
+            **ranges
         }
         shards.append(shard)
     
@@ -44,15 +56,17 @@ async def create_training_job(job: TrainingJobCreate):
         **job.dict(),
         "status": "sharding",
         "created_at": datetime.now().isoformat(),
+        "dataset": plan["dataset"],
         "shards": shards,
-        "total_shards": 10,
+        "total_shards": len(shards),
         "completed_shards": 0
     }
     
     # Persist to database
     db.create_job(job_data)
+    shard_scheduler.add_job(job_data)
     
-    return {"message": "Job created and sharded", "job_id": job_id, "shards_count": 10}
+    return {"message": "Job created and sharded", "job_id": job_id, "shards_count": len(shards)}
 
 @router.get("/training/jobs")
 async def list_training_jobs():
@@ -69,29 +83,47 @@ async def get_training_job(job_id: str):
         raise HTTPException(status_code=404, detail="Job not found")
     return job
 
+@router.get("/training/next-shard")
+async def next_shard(worker_id: str, wait: float = 30):
+    """
+    Lease the next available shard, long-polling up to `wait` seconds.
+    
+    Returns the lease (job_id, shard, dataset, lease_expires_at), or
+    204 No Content when no shard became available in time.
+    """
+    lease = await shard_scheduler.next_shard(worker_id, wait)
+    if lease is None:
+        return Response(status_code=204)
+    return lease
+
+@router.get("/training/scheduler")
+async def scheduler_status():
+    """Shard queue and lease counts"""
+    return shard_scheduler.get_status()
+
 @router.post("/training/claim-shard")
 async def claim_shard(job_id: str, shard_index: int, worker_id: str):
     """Worker claims a specific shard of a training job"""
-    job = db.get_job(job_id)
-    if not job:
-        raise HTTPException(status_code=404, detail="Job not found")
-    
-    if shard_index >= len(job["shards"]):
-        raise HTTPException(status_code=400, detail="Invalid shard index")
-    
-    shard = job["shards"][shard_index]
-    if shard["status"] != "pending":
+    lease = shard_scheduler.claim(job_id, shard_index, worker_id)
+    if lease is None:
         raise HTTPException(status_code=400, detail="Shard already claimed or completed")
-    
-    shard["status"] = "processing"
-    shard["worker_id"] = worker_id
-    
-    # If all shards are claimed, update job status
-    if all(s["status"] != "pending" for s in job["shards"]):
-        job["status"] = "processing"
-        
-    db.update_job(job_id, {"shards": job["shards"], "status": job["status"]})
-    return {"message": "Shard claimed successfully", "shard_id": shard["shard_id"]}
+    return {"message": "Shard claimed successfully", "shard_id": lease["shard"]["shard_id"], "lease_expires_at": lease["lease_expires_at"]}
+
+@router.post("/training/heartbeat")
+async def shard_heartbeat(
+    job_id: str,
+    shard_index: int,
+    worker_id: str,
+    progress: float = 0,
+    checkpoint_url: Optional[str] = None
+):
+    """
+    Renew a shard lease. cancelled=True tells the worker to stop: the
+    shard was finished elsewhere or its lease already expired.
+    checkpoint_url is the worker's latest training checkpoint; a shard
+    that is reassigned is leased with it so training resumes there.
+    """
+    return shard_scheduler.heartbeat(job_id, shard_index, worker_id, progress, checkpoint_url)
 
 @router.post("/training/submit-shard")
 async def submit_shard(job_id: str, shard_index: int, worker_id: str, result_url: str):
@@ -102,12 +134,21 @@ async def submit_shard(job_id: str, shard_index: int, worker_id: str, result_url
     
     shard = job["shards"][shard_index]
     
-    if shard["worker_id"] != worker_id:
+    # Any worker that held a lease (including speculative copies) may submit
+    if shard["worker_id"] != worker_id and not shard_scheduler.may_submit(job_id, shard_index, worker_id):
         raise HTTPException(status_code=403, detail="Not authorized for this shard")
+    if not result_url:
+        raise HTTPException(status_code=400, detail="Missing result_url")
+    if shard["status"] == "completed":
+        # First valid result wins; later copies are discarded
+        shard_scheduler.discard_duplicate()
+        return {"message": "Shard already completed by another worker", "accepted": False, "job_status": job["status"]}
     
     shard["status"] = "completed"
+    shard["worker_id"] = worker_id
     shard["result_url"] = result_url
     shard["progress"] = 100
+    shard.pop("checkpoint", None)
     
     job["completed_shards"] += 1
     
@@ -122,4 +163,5 @@ async def submit_shard(job_id: str, shard_index: int, worker_id: str, result_url
         "completed_shards": job["completed_shards"],
         "completed_at": job.get("completed_at")
     })
-    return {"message": "Shard result submitted", "job_status": job["status"]}
+    shard_scheduler.complete(job_id, shard_index, worker_id)
+    return {"message": "Shard result submitted", "accepted": True, "job_status": job["status"]}
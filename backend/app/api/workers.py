@@ -108,6 +108,12 @@ async def verify_worker_liveness(node_id: str) -> bool:
                 # Fetch capabilities too
                 cap_res = requests.get(f"{public_url}/capabilities", timeout=5)
                 capabilities = cap_res.json() if cap_res.status_code == 200 else {}
+                # Relative speed used to size shard leases until real shard timings exist
+                try:
+                    bench_res = requests.get(f"{public_url}/benchmark", timeout=10)
+                    benchmark_score = bench_res.json().get("benchmark_score") if bench_res.status_code == 200 else None
+                except Exception:
+                    benchmark_score = None
                 
                 # Update status in DB
                 for w in workers:
@@ -116,6 +122,8 @@ async def verify_worker_liveness(node_id: str) -> bool:
                         w["last_seen"] = datetime.now().isoformat()
                         if capabilities:
                             w["hardware_info"] = capabilities
+                        if benchmark_score:
+                            w["benchmark_score"] = benchmark_score
                         break
                 db._write_file(db.workers_file, workers)
                 return True
@@ -0,0 +1,18 @@
+"""
+V-Inference Backend - Canonical Binary Encoding
+Deterministic, type-tagged serialization used for hashing proofs and inputs
+
+Proof hashes must match between the backend and the workers, so the
+encoding is not duplicated here: this module re-exports
+worker/canonical.py, loaded through the shared worker module loader.
+"""
+from .worker_modules import load_worker_module
+
+_shared = load_worker_module("canonical")
+
+encode = _shared.encode
+hash_into = _shared.hash_into
+canonical_hash = _shared.canonical_hash
+FORMAT_VERSION = _shared.FORMAT_VERSION
+
+__all__ = ['encode', 'hash_into', 'canonical_hash', 'FORMAT_VERSION']
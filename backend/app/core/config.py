@@ -208,3 +208,16 @@ CONTRACT_ABI = [
 
 # Shardeum Block Explorer
 SHARDEUM_EXPLORER = "https://explorer-mezame.shardeum.org"
+
+# ============ Proof Verification ============
+# Verification results kept in memory by the verifiers; older ones are
+# evicted first
+VERIFICATION_CACHE_SIZE = int(os.getenv("VERIFICATION_CACHE_SIZE", "4096"))
+
+# ============ Shared Worker Modules ============
+# Modules shared with the worker (circuit registry, canonical encoding) are
+# loaded from this directory so both sides run the same code
+WORKER_MODULES_PATH = os.getenv(
+    "WORKER_MODULES_PATH",
+    os.path.join(os.path.dirname(__file__), "..", "..", "..", "worker")
+)
@@ -5,7 +5,7 @@ JSON-based file storage simulating a database
 import json
 import os
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from datetime import datetime
 import uuid
 
@@ -25,6 +25,9 @@ class Database:
         self.purchases_file = self.storage_path / "purchases.json"
         self.proofs_file = self.storage_path / "proofs.json"
         self.workers_file = self.storage_path / "workers.json"
+        self.blobs_file = self.storage_path / "blobs.json"
+        self.aggregates_file = self.storage_path / "aggregates.json"
+        self.verifications_file = self.storage_path / "verifications.json"
         
         # Initialize files if they don't exist
         self._init_file(self.users_file, [])
@@ -34,6 +37,9 @@ class Database:
         self._init_file(self.purchases_file, [])
         self._init_file(self.proofs_file, [])
         self._init_file(self.workers_file, [])
+        self._init_file(self.blobs_file, [])
+        self._init_file(self.aggregates_file, [])
+        self._init_file(self.verifications_file, [])
     
     def _init_file(self, file_path: Path, default_data: Any):
         if not file_path.exists():
@@ -133,6 +139,50 @@ class Database:
             return True
         return False
     
+    # Blob operations (content-addressed model files)
+    def get_blob(self, content_hash: str) -> Optional[Dict]:
+        blobs = self._read_file(self.blobs_file)
+        for blob in blobs:
+            if blob['content_hash'] == content_hash:
+                return blob
+        return None
+    
+    def acquire_blob(self, content_hash: str, path: str, size_bytes: int) -> int:
+        blobs = self._read_file(self.blobs_file)
+        for blob in blobs:
+            if blob['content_hash'] == content_hash:
+                blob['ref_count'] = blob.get('ref_count', 0) + 1
+                # The same bytes may be stored under several extensions
+                paths = blob.get('paths') or ([blob['path']] if blob.get('path') else [])
+                if path not in paths:
+                    paths.append(path)
+                blob['paths'] = paths
+                blob['path'] = path
+                self._write_file(self.blobs_file, blobs)
+                return blob['ref_count']
+        blobs.append({
+            'content_hash': content_hash,
+            'path': path,
+            'paths': [path],
+            'size_bytes': size_bytes,
+            'ref_count': 1,
+            'created_at': datetime.utcnow().isoformat()
+        })
+        self._write_file(self.blobs_file, blobs)
+        return 1
+    
+    def release_blob(self, content_hash: str) -> Tuple[int, List[str]]:
+        """Decrement a blob's ref count. Returns (remaining, every path of the blob)."""
+        blobs = self._read_file(self.blobs_file)
+        for blob in blobs:
+            if blob['content_hash'] == content_hash:
+                blob['ref_count'] = max(blob.get('ref_count', 1) - 1, 0)
+                if blob['ref_count'] == 0:
+                    blobs.remove(blob)
+                self._write_file(self.blobs_file, blobs)
+                return blob['ref_count'], blob.get('paths') or ([blob['path']] if blob.get('path') else [])
+        return 0, []
+    
     # Job operations
     def create_job(self, job_data: Dict) -> Dict:
         jobs = self._read_file(self.jobs_file)
@@ -264,6 +314,80 @@ class Database:
             if proof.get('job_id') == job_id:
                 return proof
         return None
+    
+    def update_proof_by_job(self, job_id: str, updates: Dict) -> Optional[Dict]:
+        proofs = self._read_file(self.proofs_file)
+        for proof in proofs:
+            if proof.get('job_id') == job_id:
+                proof.update(updates)
+                self._write_file(self.proofs_file, proofs)
+                return proof
+        return None
+    
+    def update_proofs_by_job(self, updates_by_job: Dict[str, Dict]) -> int:
+        """Apply updates to many proofs with a single write"""
+        proofs = self._read_file(self.proofs_file)
+        updated = 0
+        for proof in proofs:
+            updates = updates_by_job.get(proof.get('job_id'))
+            if updates:
+                proof.update(updates)
+                updated += 1
+        if updated:
+            self._write_file(self.proofs_file, proofs)
+        return updated
+    
+    # Verification results (written only by the proof verifier)
+    def get_verification(self, key: str) -> Optional[Dict]:
+        for entry in self._read_file(self.verifications_file):
+            if entry.get('key') == key:
+                return entry
+        return None
+    
+    def save_verifications(self, entries: List[Dict]) -> int:
+        """Store verification results with a single write; a proof keeps only its newest"""
+        proof_hashes = {e.get('proof_hash') for e in entries}
+        stored = [
+            e for e in self._read_file(self.verifications_file)
+            if e.get('proof_hash') not in proof_hashes
+        ]
+        stored.extend(entries)
+        self._write_file(self.verifications_file, stored)
+        return len(entries)
+    
+    # Proof aggregate operations
+    def create_aggregate(self, aggregate_data: Dict) -> Dict:
+        aggregates = self._read_file(self.aggregates_file)
+        if 'id' not in aggregate_data:
+            aggregate_data['id'] = str(uuid.uuid4())
+        aggregate_data['created_at'] = datetime.utcnow().isoformat()
+        aggregates.append(aggregate_data)
+        self._write_file(self.aggregates_file, aggregates)
+        return aggregate_data
+    
+    def get_aggregate(self, aggregate_id: str) -> Optional[Dict]:
+        aggregates = self._read_file(self.aggregates_file)
+        for aggregate in aggregates:
+            if aggregate['id'] == aggregate_id:
+                return aggregate
+        return None
+    
+    def get_aggregates(self, model_id: Optional[str] = None, status: Optional[str] = None) -> List[Dict]:
+        aggregates = self._read_file(self.aggregates_file)
+        if model_id:
+            aggregates = [a for a in aggregates if a.get('model_id') == model_id]
+        if status:
+            aggregates = [a for a in aggregates if a.get('status') == status]
+        return aggregates
+    
+    def update_aggregate(self, aggregate_id: str, updates: Dict) -> Optional[Dict]:
+        aggregates = self._read_file(self.aggregates_file)
+        for aggregate in aggregates:
+            if aggregate['id'] == aggregate_id:
+                aggregate.update(updates)
+                self._write_file(self.aggregates_file, aggregates)
+                return aggregate
+        return None
 
 
 # Global database instance
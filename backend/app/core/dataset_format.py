@@ -0,0 +1,84 @@
+"""
+V-Inference Backend - Columnar Dataset Headers
+Pure-Python reader for OBDS dataset headers
+
+The backend never maps dataset columns itself; it only needs the header
+to plan shards: row counts, per-column byte offsets and the chunk hashes
+that cover a row range. Parsing needs only the first few kilobytes of
+the file, so it works on a ranged download as well as a full one.
+
+The layout must stay in sync with worker/dataset_format.py.
+"""
+
+import json
+import struct
+from typing import Any, BinaryIO, Dict, List, Tuple
+
+DATASET_MAGIC = b"OBDS"
+DATASET_FORMAT_VERSION = 1
+
+_PREFIX = struct.Struct("<4sBI")
+
+
+def is_dataset(prefix: bytes) -> bool:
+    """True if the bytes start with the dataset magic."""
+    return prefix[:4] == DATASET_MAGIC
+
+
+def header_size(prefix: bytes) -> int:
+    """Bytes needed to parse the header, from the first 9 bytes of the file."""
+    magic, _, header_len = _PREFIX.unpack(prefix[:_PREFIX.size])
+    if magic != DATASET_MAGIC:
+        raise ValueError("Not an OBDS dataset")
+    return _PREFIX.size + header_len
+
+
+def parse_header(data: bytes) -> Dict[str, Any]:
+    """
+    Parse a header from the leading bytes of a dataset.
+
+    Args:
+        data: At least header_size(data) bytes from the start of the file
+
+    Returns:
+        Header dict
+    """
+    magic, version, header_len = _PREFIX.unpack(data[:_PREFIX.size])
+    if magic != DATASET_MAGIC:
+        raise ValueError("Not an OBDS dataset")
+    if version > DATASET_FORMAT_VERSION:
+        raise ValueError(f"Unsupported dataset format version {version}")
+    if len(data) < _PREFIX.size + header_len:
+        raise ValueError("Truncated dataset header")
+    return json.loads(data[_PREFIX.size:_PREFIX.size + header_len].decode("utf-8"))
+
+
+def read_header(stream: BinaryIO) -> Dict[str, Any]:
+    """Read a header from a binary stream positioned at offset 0."""
+    prefix = stream.read(_PREFIX.size)
+    return parse_header(prefix + stream.read(header_size(prefix) - _PREFIX.size))
+
+
+def row_nbytes(column: Dict[str, Any]) -> int:
+    """Bytes per row of a column (dtype strings look like '<f4')."""
+    size = int(column["dtype"][2:])
+    for dim in column["shape"]:
+        size *= int(dim)
+    return size
+
+
+def row_byte_ranges(header: Dict[str, Any], start: int, end: int) -> Dict[str, Tuple[int, int]]:
+    """Absolute [first, last) byte range of rows [start, end) in each column."""
+    ranges = {}
+    for column in header["columns"]:
+        size = row_nbytes(column)
+        ranges[column["name"]] = (column["offset"] + start * size, column["offset"] + end * size)
+    return ranges
+
+
+def chunks_for_rows(header: Dict[str, Any], start: int, end: int) -> List[Dict[str, Any]]:
+    """Chunks overlapping rows [start, end), with their hashes."""
+    return [
+        chunk for chunk in header["chunks"]
+        if chunk["row_start"] < end and chunk["row_end"] > start
+    ]
@@ -0,0 +1,46 @@
+"""
+V-Inference Backend - Shared Worker Modules
+Loads modules that the backend and the worker must run identically
+
+Some code (the circuit registry, the canonical encoding) has to behave
+the same on both sides. It lives once, in the worker directory, and the
+backend loads those files directly instead of keeping a copy. Modules are
+registered under a "worker_shared." prefix so they never shadow backend
+modules, and sys.path is left untouched.
+"""
+import sys
+import importlib.util
+from pathlib import Path
+from types import ModuleType
+
+from .config import WORKER_MODULES_PATH
+
+
+def load_worker_module(name: str) -> ModuleType:
+    """
+    Load worker/<name>.py (once per process)
+
+    Args:
+        name: Module name without the .py suffix
+
+    Returns:
+        The loaded module
+    """
+    qualified = f"worker_shared.{name}"
+    module = sys.modules.get(qualified)
+    if module is not None:
+        return module
+
+    path = Path(WORKER_MODULES_PATH).resolve() / f"{name}.py"
+    if not path.exists():
+        raise ImportError(f"Shared worker module not found: {path}")
+
+    spec = importlib.util.spec_from_file_location(qualified, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[qualified] = module
+    try:
+        spec.loader.exec_module(module)
+    except Exception:
+        del sys.modules[qualified]
+        raise
+    return module
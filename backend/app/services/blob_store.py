@@ -0,0 +1,136 @@
+"""
+V-Inference Backend - Content-Addressed Blob Store
+Stores model files once per SHA-256 content hash with reference counting
+
+Identical uploads from different owners resolve to the same blob on disk,
+and in-memory model caches key on the same hash so they also share one
+loaded instance.
+"""
+import os
+import hashlib
+import tempfile
+from pathlib import Path
+from typing import Dict, Any, Optional, BinaryIO, Tuple
+
+from ..core.database import db
+
+BLOB_STORAGE_PATH = Path("storage/blobs")
+BLOB_STORAGE_PATH.mkdir(parents=True, exist_ok=True)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class BlobStore:
+    """
+    Content-addressed file store
+
+    Layout: storage/blobs/<hash[:2]>/<hash><ext>
+    Reference counts live in the blobs table of the JSON database. Loaders
+    pick the format from the extension, so the same bytes uploaded as .pkl
+    and .onnx are two files under one blob record, deleted together.
+    """
+
+    def __init__(self, root: Path = BLOB_STORAGE_PATH):
+        self.root = root
+        # (path, size, mtime_ns) -> sha256, so legacy files are hashed once
+        self._path_hash_cache: Dict[Tuple[str, int, int], str] = {}
+
+    def blob_path(self, content_hash: str, ext: str = "") -> Path:
+        return self.root / content_hash[:2] / f"{content_hash}{ext}"
+
+    def put_stream(self, stream: BinaryIO, ext: str = "") -> Dict[str, Any]:
+        """
+        Store a stream, hashing it while it is written
+
+        Returns dict with content_hash, path, size_bytes and deduplicated
+        (True when an identical blob already existed).
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        hasher = hashlib.sha256()
+        size = 0
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                while True:
+                    chunk = stream.read(HASH_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+
+            content_hash = hasher.hexdigest()
+            final_path = self.blob_path(content_hash, ext)
+            deduplicated = final_path.exists()
+
+            if deduplicated:
+                os.remove(tmp_path)
+            else:
+                final_path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp_path, final_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return {
+            "content_hash": content_hash,
+            "path": str(final_path),
+            "size_bytes": size,
+            "deduplicated": deduplicated
+        }
+
+    def put_file(self, file_path: str, ext: Optional[str] = None) -> Dict[str, Any]:
+        """Store a copy of a local file"""
+        if ext is None:
+            ext = os.path.splitext(file_path)[1].lower()
+        with open(file_path, "rb") as f:
+            return self.put_stream(f, ext)
+
+    def acquire(self, content_hash: str, path: str, size_bytes: int) -> int:
+        """Add a reference to a blob. Returns the new reference count."""
+        return db.acquire_blob(content_hash, path, size_bytes)
+
+    def ref_count(self, content_hash: str) -> int:
+        """Current references to a blob (0 if unknown)"""
+        blob = db.get_blob(content_hash)
+        return blob.get('ref_count', 0) if blob else 0
+
+    def release(self, content_hash: str) -> int:
+        """
+        Drop a reference to a blob, deleting its files when none remain
+
+        Returns the remaining reference count.
+        """
+        remaining, paths = db.release_blob(content_hash)
+        if remaining == 0:
+            for path in paths:
+                if os.path.exists(path):
+                    os.remove(path)
+        return remaining
+
+    def hash_file(self, file_path: str) -> Optional[str]:
+        """SHA-256 of a file, memoized by path, size and mtime"""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+
+        key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+        cached = self._path_hash_cache.get(key)
+        if cached:
+            return cached
+
+        hasher = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                hasher.update(chunk)
+
+        content_hash = hasher.hexdigest()
+        self._path_hash_cache[key] = content_hash
+        return content_hash
+
+
+# Global instance
+blob_store = BlobStore()
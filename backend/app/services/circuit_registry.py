@@ -0,0 +1,36 @@
+"""
+V-Inference Backend - EZKL Circuit Registry
+Persistent cache of compiled circuits and keys keyed by model content
+
+The registry itself is worker/circuit_registry.py, shared with the worker
+so both build and lay out circuits the same way. This module configures
+the backend's instance: circuits live under CIRCUIT_REGISTRY_PATH (point
+it at shared storage to reuse keys across backend instances), settings
+are calibrated for resources, and ONNX hashes reuse the blob store's
+memoized file hashes.
+"""
+import os
+from pathlib import Path
+
+from ..core.worker_modules import load_worker_module
+from .blob_store import blob_store
+
+_shared = load_worker_module("circuit_registry")
+CircuitRegistry = _shared.CircuitRegistry
+EZKL_AVAILABLE = _shared.EZKL_AVAILABLE
+# A lock older than this is assumed to belong to a crashed build
+CIRCUIT_LOCK_STALE_SECONDS = _shared.CIRCUIT_LOCK_STALE_SECONDS
+
+CIRCUIT_REGISTRY_PATH = Path(os.getenv("CIRCUIT_REGISTRY_PATH", "storage/circuits"))
+CIRCUIT_REGISTRY_PATH.mkdir(parents=True, exist_ok=True)
+
+DEFAULT_RUN_ARGS = {"calibration_target": "resources"}
+
+
+# Global instance
+circuit_registry = CircuitRegistry(
+    CIRCUIT_REGISTRY_PATH,
+    DEFAULT_RUN_ARGS,
+    hash_file=blob_store.hash_file,
+    lock_stale_seconds=CIRCUIT_LOCK_STALE_SECONDS
+)
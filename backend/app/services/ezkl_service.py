@@ -2,14 +2,17 @@
 V-Inference Backend - EZKL Service for Real ZK Proof Generation
 Uses EZKL library to generate actual SNARK proofs for model inference
 """
-import os
-import json
-import asyncio
-import tempfile
+from collections import OrderedDict
 from pathlib import Path
 from typing import Dict, Any, Optional, Tuple
 from datetime import datetime
 
+from ..core.canonical import canonical_hash
+from ..core.config import VERIFICATION_CACHE_SIZE
+from .blob_store import blob_store
+from .circuit_registry import circuit_registry
+from .proving_scheduler import proving_scheduler
+
 # Try to import EZKL
 try:
     import ezkl
@@ -37,16 +40,16 @@ class EZKLService:
     
     Flow:
     1. Convert model to ONNX if needed
-    2. Generate witness from input/output
-    3. Setup ZK circuit (one-time per model)
-    4. Generate SNARK proof
-    5. Verify proof locally
-    6. Return proof for on-chain verification
+    2. Setup ZK circuit (one-time per model, via the circuit registry)
+    3. Generate witness and SNARK proof in the proving pool
+    4. Verify proof locally
+    5. Return proof for on-chain verification
     """
     
     def __init__(self):
         self.circuits_cache: Dict[str, Dict] = {}
         self.setup_complete: Dict[str, bool] = {}
+        self.verification_cache: "OrderedDict[Tuple[str, str], Tuple[bool, str]]" = OrderedDict()
     
     def get_model_artifact_path(self, model_id: str) -> Path:
         """Get the artifact directory for a model"""
@@ -61,76 +64,25 @@ class EZKLService:
     ) -> Dict[str, Any]:
         """
         One-time setup: Generate circuit and verification key for a model
-        This is computationally expensive, so cache the results
+        
+        Artifacts live in the circuit registry keyed by the ONNX file hash,
+        so setup runs once per distinct model and survives restarts.
         """
         if not EZKL_AVAILABLE:
             return {"success": False, "error": "EZKL not installed"}
         
-        artifacts_path = self.get_model_artifact_path(model_id)
-        
-        # Artifact file paths
-        compiled_model = str(artifacts_path / "network.compiled")
-        settings_path = str(artifacts_path / "settings.json")
-        vk_path = str(artifacts_path / "vk.key")
-        pk_path = str(artifacts_path / "pk.key")
-        srs_path = str(artifacts_path / "kzg.srs")
-        
-        # Check if already setup
-        if os.path.exists(vk_path) and os.path.exists(pk_path):
-            self.setup_complete[model_id] = True
-            return {
-                "success": True,
-                "message": "Circuit already setup",
-                "vk_path": vk_path,
-                "cached": True
-            }
-        
         try:
-            print(f"[INFO] Setting up ZK circuit for model {model_id}...")
-            
-            # Step 1: Generate settings
-            print("  1. Generating circuit settings...")
-            await ezkl.gen_settings(onnx_path, settings_path)
-            
-            # Step 2: Calibrate settings (optional but recommended)
-            print("  2. Calibrating settings...")
-            await ezkl.calibrate_settings(
-                onnx_path, 
-                settings_path, 
-                "resources"
-            )
-            
-            # Step 3: Compile the model to a circuit
-            print("  3. Compiling model to circuit...")
-            await ezkl.compile_circuit(
-                onnx_path,
-                compiled_model,
-                settings_path
-            )
-            
-            # Step 4: Download or use cached SRS (Structured Reference String)
-            print("  4. Getting SRS...")
-            if not os.path.exists(srs_path):
-                await ezkl.get_srs(settings_path, srs_path)
-            
-            # Step 5: Generate proving key and verification key
-            print("  5. Generating keys...")
-            await ezkl.setup(
-                compiled_model,
-                vk_path,
-                pk_path,
-                srs_path
-            )
-            
+            circuit = await circuit_registry.ensure(onnx_path, model_id=model_id)
+            self.circuits_cache[model_id] = circuit
             self.setup_complete[model_id] = True
-            print(f"[SUCCESS] Circuit setup complete for {model_id}")
             
             return {
                 "success": True,
-                "message": "Circuit setup complete",
-                "vk_path": vk_path,
-                "pk_path": pk_path,
-                "cached": False
+                "message": "Circuit already setup" if circuit["cached"] else "Circuit setup complete",
+                "circuit_key": circuit["key"],
+                "vk_path": circuit["vk_path"],
+                "pk_path": circuit["pk_path"],
+                "cached": circuit["cached"]
             }
             
         except Exception as e:
@@ -142,6 +94,15 @@ class EZKLService:
                 "error": str(e)
             }
     
+    def get_circuit(self, model_id: str) -> Optional[Dict[str, Any]]:
+        """Registry artifacts for a model that has been set up"""
+        circuit = self.circuits_cache.get(model_id)
+        if circuit is None:
+            circuit = circuit_registry.get_for_model(model_id)
+            if circuit:
+                self.circuits_cache[model_id] = circuit
+        return circuit
+    
     async def generate_proof(
         self,
         model_id: str,
@@ -155,8 +116,6 @@ class EZKLService:
         if not EZKL_AVAILABLE:
             return self._fallback_proof(model_id, input_data, output_data)
         
-        artifacts_path = self.get_model_artifact_path(model_id)
-        
         try:
             # Ensure circuit is setup
             if model_id not in self.setup_complete:
@@ -164,58 +123,17 @@ class EZKLService:
                 if not setup_result.get("success"):
                     return self._fallback_proof(model_id, input_data, output_data)
             
-            # Paths
-            compiled_model = str(artifacts_path / "network.compiled")
-            settings_path = str(artifacts_path / "settings.json")
-            witness_path = str(artifacts_path / "witness.json")
-            proof_path = str(artifacts_path / "proof.json")
-            pk_path = str(artifacts_path / "pk.key")
-            srs_path = str(artifacts_path / "kzg.srs")
+            circuit = self.circuits_cache[model_id]
             
-            # Step 1: Create input JSON file for witness generation
+            # Witness generation, proving and local verification run in the
+            # proving pool, each job in its own scratch directory
             print("[INFO] Generating ZK proof...")
-            input_file = str(artifacts_path / "input.json")
-            
-            # Format input for EZKL
             ezkl_input = self._format_input_for_ezkl(input_data)
-            with open(input_file, 'w') as f:
-                json.dump({"input_data": [ezkl_input]}, f)
-            
-            # Step 2: Generate witness
-            print("  1. Generating witness...")
-            await ezkl.gen_witness(
-                compiled_model,
-                input_file,
-                witness_path
-            )
+            result = await proving_scheduler.prove(circuit, ezkl_input)
             
-            # Step 3: Generate proof
-            print("  2. Generating SNARK proof...")
-            start_time = datetime.utcnow()
-            
-            await ezkl.prove(
-                witness_path,
-                compiled_model,
-                pk_path,
-                proof_path,
-                srs_path,
-                "single"  # proof type
-            )
-            
-            prove_time = (datetime.utcnow() - start_time).total_seconds()
-            
-            # Step 4: Load and parse proof
-            with open(proof_path, 'r') as f:
-                proof_data = json.load(f)
-            
-            # Step 5: Verify locally
-            vk_path = str(artifacts_path / "vk.key")
-            is_valid = await ezkl.verify(
-                proof_path,
-                settings_path,
-                vk_path,
-                srs_path
-            )
+            proof_data = result["proof"]
+            is_valid = result["is_valid"]
+            prove_time = result["proving_time_seconds"]
             
             print(f"[SUCCESS] Proof generated in {prove_time:.2f}s, Valid: {is_valid}")
             
@@ -227,8 +145,11 @@ class EZKLService:
                 "proof_hash": self._hash_proof(proof_data),
                 "is_valid": is_valid,
                 "proving_time_seconds": prove_time,
+                "witness_time_seconds": result["witness_time_seconds"],
                 "circuit_info": {
                     "model_id": model_id,
+                    "circuit_key": circuit["key"],
+                    "vk_hash": circuit["vk_hash"],
                     "type": "ezkl-groth16",
                     "real_zkml": True
                 }
@@ -243,29 +164,45 @@ class EZKLService:
     async def verify_proof(
         self,
         model_id: str,
-        proof_path: str
+        proof_path: str,
+        force: bool = False
     ) -> Tuple[bool, str]:
-        """Verify a proof locally before on-chain submission"""
+        """
+        Verify a proof locally before on-chain submission
+        
+        Results are memoized by (proof file hash, vk hash), so an unchanged
+        proof is only SNARK-verified once per verifying key.
+        """
         if not EZKL_AVAILABLE:
             return True, "Simulated verification"
         
         try:
-            artifacts_path = self.get_model_artifact_path(model_id)
-            settings_path = str(artifacts_path / "settings.json")
-            vk_path = str(artifacts_path / "vk.key")
-            srs_path = str(artifacts_path / "kzg.srs")
+            circuit = self.get_circuit(model_id)
+            if circuit is None:
+                return False, "Circuit not set up for this model"
+            
+            key = (blob_store.hash_file(proof_path), circuit["vk_hash"])
+            if not force and key in self.verification_cache:
+                self.verification_cache.move_to_end(key)
+                return self.verification_cache[key]
             
             is_valid = await ezkl.verify(
                 proof_path,
-                settings_path,
-                vk_path,
-                srs_path
+                circuit["settings_path"],
+                circuit["vk_path"],
+                circuit["srs_path"]
             )
             
             if is_valid:
-                return True, "Proof verified successfully"
+                result = (True, "Proof verified successfully")
             else:
-                return False, "Proof verification failed"
+                result = (False, "Proof verification failed")
+            
+            self.verification_cache[key] = result
+            self.verification_cache.move_to_end(key)
+            if len(self.verification_cache) > VERIFICATION_CACHE_SIZE:
+                self.verification_cache.popitem(last=False)
+            return result
                 
         except Exception as e:
             return False, f"Verification error: {e}"
@@ -277,16 +214,18 @@ class EZKLService:
         if not EZKL_AVAILABLE:
             return None
         
+        circuit = self.get_circuit(model_id)
+        if circuit is None:
+            return None
+        
         artifacts_path = self.get_model_artifact_path(model_id)
-        vk_path = str(artifacts_path / "vk.key")
-        srs_path = str(artifacts_path / "kzg.srs")
         sol_path = str(artifacts_path / "Verifier.sol")
         
         try:
             # Generate Solidity verifier
             ezkl.create_evm_verifier(
-                vk_path,
-                srs_path,
+                circuit["vk_path"],
+                circuit["srs_path"],
                 sol_path,
                 "abi"
             )
@@ -319,9 +258,7 @@ class EZKLService:
     
     def _hash_proof(self, proof_data: Dict) -> str:
         """Generate a hash of the proof for reference"""
-        import hashlib
-        proof_str = json.dumps(proof_data, sort_keys=True)
-        return "0x" + hashlib.sha256(proof_str.encode()).hexdigest()
+        return "0x" + canonical_hash(proof_data)
     
     def _fallback_proof(
         self,
@@ -330,16 +267,12 @@ class EZKLService:
         output_data: Dict
     ) -> Dict[str, Any]:
         """Fallback to simulated proof when EZKL is unavailable"""
-        import hashlib
-        
         # Create deterministic hash from input/output
-        combined = json.dumps({
+        proof_hash = "0x" + canonical_hash({
             "model": model_id,
             "input": input_data,
             "output": output_data
-        }, sort_keys=True)
-        
-        proof_hash = "0x" + hashlib.sha256(combined.encode()).hexdigest()
+        })
         
         return {
             "success": True,
@@ -5,13 +5,14 @@ Supports multiple providers: Local IPFS node, Pinata, Infura, Web3.Storage
 """
 import os
 import json
-import hashlib
 import aiohttp
 import asyncio
 from typing import Dict, Any, Optional, Tuple
 from pathlib import Path
 from datetime import datetime
 
+from .blob_store import blob_store
+
 # Configuration - Use environment variables in production
 IPFS_PROVIDER = os.getenv("IPFS_PROVIDER", "pinata")  # local, pinata, infura, web3storage
 PINATA_API_KEY = os.getenv("PINATA_API_KEY", "")
@@ -32,6 +33,7 @@ IPFS_GATEWAYS = [
 # Local cache for downloaded models
 IPFS_CACHE_PATH = Path("storage/ipfs_cache")
 IPFS_CACHE_PATH.mkdir(parents=True, exist_ok=True)
+IPFS_CACHE_INDEX = IPFS_CACHE_PATH / "index.json"
 
 
 class IPFSService:
@@ -79,8 +81,7 @@ class IPFSService:
     
     def generate_local_cid(self, file_path: str) -> str:
         """Generate a simulated CID based on file hash (for simulation mode)"""
-        with open(file_path, 'rb') as f:
-            file_hash = hashlib.sha256(f.read()).hexdigest()
+        file_hash = blob_store.hash_file(file_path)
         # Create a CID-like string (v1 CID format simulation)
         return f"bafybeig{file_hash[:50]}"
     
@@ -115,13 +116,8 @@ class IPFSService:
         # Simulation mode - generate local CID
         cid = self.generate_local_cid(file_path)
         
-        # Copy to local cache as "IPFS storage"
-        cache_path = IPFS_CACHE_PATH / cid
-        cache_path.mkdir(parents=True, exist_ok=True)
-        
-        import shutil
-        cached_file = cache_path / filename
-        shutil.copy2(file_path, cached_file)
+        # Keep in the blob store as "IPFS storage"
+        cached_file = self._cache_file(cid, file_path)
         
         return {
             "success": True,
@@ -345,25 +341,75 @@ class IPFSService:
             "cid": cid
         }
     
+    def _load_cache_index(self) -> Dict[str, Dict]:
+        if not IPFS_CACHE_INDEX.exists():
+            return {}
+        try:
+            with open(IPFS_CACHE_INDEX, 'r') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError):
+            return {}
+    
+    def _save_cache_index(self, index: Dict[str, Dict]):
+        tmp_path = IPFS_CACHE_INDEX.with_suffix(".json.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_path, IPFS_CACHE_INDEX)
+    
     def _check_cache(self, cid: str) -> Optional[str]:
         """Check if file exists in local cache"""
+        entry = self._load_cache_index().get(cid)
+        if entry and os.path.exists(entry["path"]):
+            return entry["path"]
+        
+        # Legacy per-CID cache directories
         cache_dir = IPFS_CACHE_PATH / cid
-        if cache_dir.exists():
+        if cache_dir.is_dir():
             # Return first file in cache directory
             files = list(cache_dir.iterdir())
             if files:
                 return str(files[0])
         return None
     
-    def _cache_file(self, cid: str, file_path: str):
-        """Cache a downloaded file"""
-        cache_dir = IPFS_CACHE_PATH / cid
-        cache_dir.mkdir(parents=True, exist_ok=True)
+    def _cache_file(self, cid: str, file_path: str) -> str:
+        """
+        Cache a file under its CID
         
-        import shutil
-        filename = os.path.basename(file_path)
-        cached_path = cache_dir / filename
-        shutil.copy2(file_path, cached_path)
+        Content goes into the blob store, so a CID whose bytes are already
+        held (e.g. the model upload it came from) costs no extra disk and
+        no extra reference: the holder's reference covers the cache too.
+        Content only the cache holds (gateway downloads) gets its own
+        reference, dropped by release_cached().
+        """
+        index = self._load_cache_index()
+        entry = index.get(cid)
+        if entry and os.path.exists(entry["path"]):
+            return entry["path"]
+        
+        blob = blob_store.put_file(file_path)
+        owns_ref = blob_store.ref_count(blob["content_hash"]) == 0
+        if owns_ref:
+            blob_store.acquire(blob["content_hash"], blob["path"], blob["size_bytes"])
+        index[cid] = {
+            "content_hash": blob["content_hash"],
+            "path": blob["path"],
+            "filename": os.path.basename(file_path),
+            "owns_ref": owns_ref,
+            "cached_at": datetime.utcnow().isoformat()
+        }
+        self._save_cache_index(index)
+        return blob["path"]
+    
+    def release_cached(self, cid: str):
+        """Drop a CID from the local cache, releasing the cache's own blob reference"""
+        index = self._load_cache_index()
+        entry = index.pop(cid, None)
+        if entry is None:
+            return
+        self._save_cache_index(index)
+        # Entries written before owns_ref existed always took a reference
+        if entry.get("owns_ref", True):
+            blob_store.release(entry["content_hash"])
     
     async def _download_from_gateway(self, cid: str, output_path: str, gateway: str) -> Dict[str, Any]:
         """Download file from a specific IPFS gateway"""
@@ -404,10 +450,21 @@ class IPFSService:
                 "error": str(e)
             }
     
-    async def pin_file(self, cid: str) -> Dict[str, Any]:
-        """Pin a file to ensure it stays available"""
+    async def pin_file(
+        self,
+        cid: str,
+        name: Optional[str] = None,
+        metadata: Optional[Dict] = None,
+        session: Optional[aiohttp.ClientSession] = None
+    ) -> Dict[str, Any]:
+        """
+        Pin a file to ensure it stays available
+        
+        This is a single synchronous round-trip; bulk pinning should go
+        through pin_queue, which batches calls over a shared session.
+        """
         if self.provider == "pinata" and self.connected:
-            return await self._pin_to_pinata(cid)
+            return await self._pin_to_pinata(cid, name, metadata, session)
         
         return {
             "success": True,
@@ -417,44 +474,110 @@ class IPFSService:
             "note": "Pinning simulated - configure Pinata for real pinning"
         }
     
-    async def _pin_to_pinata(self, cid: str) -> Dict[str, Any]:
+    async def _pin_to_pinata(
+        self,
+        cid: str,
+        name: Optional[str] = None,
+        metadata: Optional[Dict] = None,
+        session: Optional[aiohttp.ClientSession] = None
+    ) -> Dict[str, Any]:
         """Pin an existing IPFS hash to Pinata"""
         url = "https://api.pinata.cloud/pinning/pinByHash"
         
+        headers = {
+            "pinata_api_key": PINATA_API_KEY,
+            "pinata_secret_api_key": PINATA_SECRET_KEY,
+            "Content-Type": "application/json"
+        }
+        
+        data = {
+            "hashToPin": cid
+        }
+        if name or metadata:
+            data["pinataMetadata"] = {
+                "name": name or cid,
+                "keyvalues": metadata or {}
+            }
+        
+        owns_session = session is None
         try:
-            async with aiohttp.ClientSession() as session:
-                headers = {
-                    "pinata_api_key": PINATA_API_KEY,
-                    "pinata_secret_api_key": PINATA_SECRET_KEY,
-                    "Content-Type": "application/json"
-                }
-                
-                data = {
-                    "hashToPin": cid
+            if owns_session:
+                session = aiohttp.ClientSession()
+            
+            async with session.post(url, json=data, headers=headers) as response:
+                if response.status == 200:
+                    result = await response.json()
+                    return {
+                        "success": True,
+                        "cid": cid,
+                        "pinned": True,
+                        "pin_id": result.get("id"),
+                        "simulated": False
+                    }
+                error = await response.text()
+                if "DUPLICATE" in error.upper() or "already pinned" in error.lower():
+                    # Uploads are pinned by Pinata itself; confirming one is not a failure
+                    return {
+                        "success": True,
+                        "cid": cid,
+                        "pinned": True,
+                        "already_pinned": True,
+                        "simulated": False
+                    }
+                return {
+                    "success": False,
+                    "status": response.status,
+                    "error": f"Pinning failed: {error}"
                 }
-                
-                async with session.post(url, json=data, headers=headers) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        return {
-                            "success": True,
-                            "cid": cid,
-                            "pinned": True,
-                            "pin_id": result.get("id"),
-                            "simulated": False
-                        }
-                    else:
-                        error = await response.text()
-                        return {
-                            "success": False,
-                            "error": f"Pinning failed: {error}"
-                        }
-                        
+                    
         except Exception as e:
             return {
                 "success": False,
                 "error": str(e)
             }
+        finally:
+            if owns_session and session is not None:
+                await session.close()
+    
+    async def list_pins(self, page_limit: int = 1000) -> Optional[set]:
+        """
+        List CIDs currently pinned with the provider
+        
+        Returns None when the provider cannot be queried (simulation mode or
+        an API error), so callers can tell "unknown" apart from "nothing".
+        """
+        if not (self.provider == "pinata" and self.connected):
+            return None
+        
+        url = "https://api.pinata.cloud/data/pinList"
+        headers = {
+            "pinata_api_key": PINATA_API_KEY,
+            "pinata_secret_api_key": PINATA_SECRET_KEY
+        }
+        
+        pinned = set()
+        offset = 0
+        try:
+            async with aiohttp.ClientSession() as session:
+                while True:
+                    params = {"status": "pinned", "pageLimit": page_limit, "pageOffset": offset}
+                    async with session.get(url, params=params, headers=headers) as response:
+                        if response.status != 200:
+                            print(f"WARN Pinata pinList failed: {await response.text()}")
+                            return None
+                        result = await response.json()
+                    
+                    rows = result.get("rows", [])
+                    pinned.update(r.get("ipfs_pin_hash") for r in rows if r.get("ipfs_pin_hash"))
+                    
+                    if len(rows) < page_limit:
+                        break
+                    offset += page_limit
+        except Exception as e:
+            print(f"WARN Pinata pinList error: {e}")
+            return None
+        
+        return pinned
     
     async def unpin_file(self, cid: str) -> Dict[str, Any]:
         """Unpin a file (remove from pinning service)"""
@@ -0,0 +1,335 @@
+"""
+V-Inference Backend - IPFS Pin Queue
+Batched, retrying pin requests with a background reconciler
+
+Pin requests (including every model upload's CID) are persisted to
+storage/pin_queue.json so pending work survives restarts. A drain loop
+pins them in batches over one shared HTTP session with bounded
+concurrency, and a reconciler periodically compares what we have pinned
+against the CIDs referenced by models and jobs.
+"""
+import os
+import json
+import random
+import asyncio
+import aiohttp
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Set
+from datetime import datetime
+
+from .ipfs_service import ipfs_service
+from ..core.database import db
+
+# Queue configuration
+PIN_QUEUE_PATH = Path("storage/pin_queue.json")
+PIN_BATCH_SIZE = int(os.getenv("PIN_BATCH_SIZE", "20"))
+PIN_CONCURRENCY = int(os.getenv("PIN_CONCURRENCY", "4"))
+PIN_MAX_ATTEMPTS = int(os.getenv("PIN_MAX_ATTEMPTS", "6"))
+PIN_BACKOFF_BASE_SECONDS = float(os.getenv("PIN_BACKOFF_BASE_SECONDS", "2"))
+PIN_BACKOFF_MAX_SECONDS = float(os.getenv("PIN_BACKOFF_MAX_SECONDS", "300"))
+PIN_DRAIN_INTERVAL_SECONDS = float(os.getenv("PIN_DRAIN_INTERVAL_SECONDS", "2"))
+
+# Reconciler configuration
+PIN_RECONCILE_INTERVAL_SECONDS = float(os.getenv("PIN_RECONCILE_INTERVAL_SECONDS", "900"))
+# Content pinned more recently than this is never treated as orphaned, so an
+# upload whose model record has not been written yet is not unpinned under it
+PIN_ORPHAN_GRACE_SECONDS = float(os.getenv("PIN_ORPHAN_GRACE_SECONDS", "3600"))
+
+
+def _now() -> float:
+    return datetime.utcnow().timestamp()
+
+
+def _cid_from_ref(value: Any) -> Optional[str]:
+    """Extract a CID from a bare CID or an ipfs:// / gateway URL"""
+    if not isinstance(value, str) or not value:
+        return None
+    if value.startswith("ipfs://"):
+        return value[len("ipfs://"):].split("/")[0] or None
+    if "/ipfs/" in value:
+        return value.split("/ipfs/", 1)[1].split("/")[0] or None
+    if value.startswith(("Qm", "bafy")):
+        return value
+    return None
+
+
+class PinQueue:
+    """
+    Persistent queue of IPFS pin requests
+
+    Features:
+    - Deduplicated, persisted pending pins (survive restarts)
+    - Batched draining with bounded concurrency over one HTTP session
+    - Exponential backoff with jitter on failure
+    - Registry of content pinned by this backend
+    - Reconciler that re-pins referenced content and unpins orphans
+    """
+
+    def __init__(self, path: Path = PIN_QUEUE_PATH):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = asyncio.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self.last_reconcile: Optional[Dict[str, Any]] = None
+
+        state = self._load()
+        self.pending: Dict[str, Dict] = state.get("pending", {})
+        self.pins: Dict[str, Dict] = state.get("pins", {})
+        self.failed: Dict[str, Dict] = state.get("failed", {})
+
+    # ============ Persistence ============
+
+    def _load(self) -> Dict[str, Any]:
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"[WARNING] Pin queue state unreadable, starting empty: {e}")
+            return {}
+
+    def _save(self):
+        tmp_path = self.path.with_suffix(".json.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                "pending": self.pending,
+                "pins": self.pins,
+                "failed": self.failed
+            }, f, indent=2, default=str)
+        os.replace(tmp_path, self.path)
+
+    # ============ Public API ============
+
+    def enqueue(self, cid: str, name: Optional[str] = None, metadata: Optional[Dict] = None) -> Dict[str, Any]:
+        """Queue a CID for pinning. Returns immediately."""
+        if cid in self.pins:
+            return {"success": True, "cid": cid, "queued": False, "pinned": True}
+
+        entry = self.pending.get(cid) or {
+            "cid": cid,
+            "attempts": 0,
+            "enqueued_at": _now(),
+            "next_attempt_at": 0.0
+        }
+        if name:
+            entry["name"] = name
+        if metadata:
+            entry["metadata"] = {**entry.get("metadata", {}), **metadata}
+
+        self.pending[cid] = entry
+        self.failed.pop(cid, None)
+        self._save()
+
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+        return {"success": True, "cid": cid, "queued": True, "pending": len(self.pending)}
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self.pending),
+            "pinned": len(self.pins),
+            "failed": len(self.failed),
+            "running": bool(self._tasks),
+            "batch_size": PIN_BATCH_SIZE,
+            "concurrency": PIN_CONCURRENCY,
+            "last_reconcile": self.last_reconcile
+        }
+
+    # ============ Lifecycle ============
+
+    def start(self):
+        """Start the drain loop and reconciler on the running event loop"""
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._drain_loop()),
+            asyncio.create_task(self._reconcile_loop())
+        ]
+        print(f"[SUCCESS] Pin queue started ({len(self.pending)} pending)")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    # ============ Draining ============
+
+    async def _drain_loop(self):
+        while True:
+            try:
+                await self.drain_once()
+            except Exception as e:
+                print(f"[ERROR] Pin queue drain failed: {e}")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=PIN_DRAIN_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def drain_once(self) -> int:
+        """Pin one batch of due entries. Returns the number attempted."""
+        async with self._lock:
+            now = _now()
+            due = sorted(
+                (e for e in self.pending.values() if e.get("next_attempt_at", 0) <= now),
+                key=lambda e: e.get("enqueued_at", 0)
+            )[:PIN_BATCH_SIZE]
+
+            if not due:
+                return 0
+
+            semaphore = asyncio.Semaphore(PIN_CONCURRENCY)
+
+            async with aiohttp.ClientSession() as session:
+                async def pin_one(entry: Dict) -> Dict[str, Any]:
+                    async with semaphore:
+                        return await ipfs_service.pin_file(
+                            entry["cid"],
+                            name=entry.get("name"),
+                            metadata=entry.get("metadata"),
+                            session=session
+                        )
+
+                results = await asyncio.gather(
+                    *(pin_one(e) for e in due),
+                    return_exceptions=True
+                )
+
+            for entry, result in zip(due, results):
+                if isinstance(result, Exception):
+                    result = {"success": False, "error": str(result)}
+                self._apply_result(entry, result)
+
+            self._save()
+            return len(due)
+
+    def _apply_result(self, entry: Dict, result: Dict[str, Any]):
+        cid = entry["cid"]
+        if result.get("success"):
+            self.pending.pop(cid, None)
+            self.pins[cid] = {
+                "pinned_at": _now(),
+                "provider": "simulation" if result.get("simulated") else ipfs_service.provider,
+                "name": entry.get("name"),
+                "pin_id": result.get("pin_id")
+            }
+            return
+
+        entry["attempts"] = entry.get("attempts", 0) + 1
+        entry["last_error"] = result.get("error")
+
+        if entry["attempts"] >= PIN_MAX_ATTEMPTS:
+            print(f"[ERROR] Giving up pinning {cid} after {entry['attempts']} attempts: {entry['last_error']}")
+            self.pending.pop(cid, None)
+            self.failed[cid] = {**entry, "failed_at": _now()}
+            return
+
+        delay = min(PIN_BACKOFF_BASE_SECONDS * (2 ** (entry["attempts"] - 1)), PIN_BACKOFF_MAX_SECONDS)
+        entry["next_attempt_at"] = _now() + delay * random.uniform(0.5, 1.0)
+
+    # ============ Reconciliation ============
+
+    def referenced_cids(self) -> Set[str]:
+        """All CIDs referenced by model and job records"""
+        referenced = set()
+
+        for model in db.get_all_models():
+            for ref in (model.get("ipfs_cid"), model.get("metadata", {}).get("ipfs", {}).get("cid")):
+                cid = _cid_from_ref(ref)
+                if cid:
+                    referenced.add(cid)
+
+        for job in db._read_file(db.jobs_file):
+            for key in ("ipfs_cid", "result_cid", "result_url", "dataset_url", "script_url"):
+                cid = _cid_from_ref(job.get(key))
+                if cid:
+                    referenced.add(cid)
+            for shard in job.get("shards", []) or []:
+                cid = _cid_from_ref(shard.get("result_url"))
+                if cid:
+                    referenced.add(cid)
+
+        return referenced
+
+    async def _reconcile_loop(self):
+        while True:
+            await asyncio.sleep(PIN_RECONCILE_INTERVAL_SECONDS)
+            try:
+                await self.reconcile()
+            except Exception as e:
+                print(f"[ERROR] Pin reconciliation failed: {e}")
+
+    async def reconcile(self, dry_run: bool = False) -> Dict[str, Any]:
+        """
+        Compare pin state with referenced content
+
+        - Referenced CIDs we do not have pinned are queued for pinning
+        - CIDs we pinned that are no longer referenced (and are past the
+          grace period) are unpinned
+        - Registry entries the provider no longer reports are dropped
+
+        Only content recorded in our own registry is ever unpinned, so pins
+        made by other applications on the same account are left alone.
+        """
+        referenced = self.referenced_cids()
+        remote_pins = await ipfs_service.list_pins()
+
+        async with self._lock:
+            if remote_pins is not None:
+                for cid in [c for c in self.pins if c not in remote_pins]:
+                    self.pins.pop(cid, None)
+
+            missing = referenced - set(self.pins) - set(self.pending)
+            now = _now()
+            orphans = [
+                cid for cid, info in self.pins.items()
+                if cid not in referenced
+                and cid not in self.pending
+                and now - info.get("pinned_at", now) > PIN_ORPHAN_GRACE_SECONDS
+            ]
+
+        unpinned = []
+        if not dry_run:
+            for cid in missing:
+                self.enqueue(cid, metadata={"source": "reconciler"})
+
+            for cid in orphans:
+                result = await ipfs_service.unpin_file(cid)
+                if result.get("success"):
+                    async with self._lock:
+                        self.pins.pop(cid, None)
+                    unpinned.append(cid)
+                else:
+                    print(f"[WARNING] Failed to unpin orphan {cid}: {result.get('error')}")
+
+            async with self._lock:
+                self._save()
+
+        self.last_reconcile = {
+            "at": datetime.utcnow().isoformat(),
+            "referenced": len(referenced),
+            "pinned": len(self.pins),
+            "queued_missing": sorted(missing),
+            "orphans": sorted(orphans),
+            "unpinned": unpinned,
+            "dry_run": dry_run
+        }
+
+        if missing or unpinned:
+            print(f"[INFO] Pin reconcile: queued {len(missing)} missing, unpinned {len(unpinned)} orphans")
+
+        return self.last_reconcile
+
+
+# Global instance
+pin_queue = PinQueue()
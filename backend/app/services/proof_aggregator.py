@@ -0,0 +1,435 @@
+"""
+V-Inference Backend - Proof Aggregator
+Batches inference proofs per model and commits to them once per window
+
+Proofs for the same model are collected into a window. When the window is
+full (or old enough) it is sealed into one aggregate:
+- a Merkle root over the proof hashes, hash-chained to the previous
+  aggregate of the same model, anchored on-chain in a single transaction
+- an EZKL aggregate (accumulated) proof as well, when every proof in the
+  window is a real EZKL proof for the same circuit
+
+Each proof record then links to its aggregate with a leaf index and Merkle
+path, so verification checks a short path plus one on-chain lookup per
+batch instead of one anchor per inference.
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import inspect
+import threading
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime
+
+from ..core.blockchain import blockchain_service
+from ..core.database import db
+from .circuit_registry import circuit_registry
+
+try:
+    import ezkl
+    EZKL_AVAILABLE = True
+except ImportError:
+    EZKL_AVAILABLE = False
+
+PROOF_AGGREGATION_ENABLED = os.getenv("PROOF_AGGREGATION_ENABLED", "false").lower() == "true"
+PROOF_AGGREGATION_WINDOW_SIZE = int(os.getenv("PROOF_AGGREGATION_WINDOW_SIZE", "16"))
+PROOF_AGGREGATION_WINDOW_SECONDS = float(os.getenv("PROOF_AGGREGATION_WINDOW_SECONDS", "60"))
+PROOF_AGGREGATION_LOGROWS = int(os.getenv("PROOF_AGGREGATION_LOGROWS", "23"))
+
+AGGREGATE_ARTIFACTS_PATH = Path("storage/aggregates")
+AGGREGATE_ARTIFACTS_PATH.mkdir(parents=True, exist_ok=True)
+
+GENESIS_COMMITMENT = "0x" + "00" * 32
+
+
+# ============ Merkle commitment ============
+
+def _hash_bytes(hex_hash: str) -> bytes:
+    return bytes.fromhex(hex_hash[2:] if hex_hash.startswith("0x") else hex_hash)
+
+
+def merkle_leaf(proof_hash: str) -> bytes:
+    return hashlib.sha256(b"\x00" + _hash_bytes(proof_hash)).digest()
+
+
+def _merkle_node(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+
+def build_merkle_tree(proof_hashes: List[str]) -> Tuple[str, List[List[Dict[str, str]]]]:
+    """
+    Merkle root and per-leaf inclusion paths
+
+    Odd nodes are paired with themselves. Each path step records the
+    sibling hash and which side it sits on.
+    """
+    level = [merkle_leaf(h) for h in proof_hashes]
+    positions = list(range(len(level)))
+    paths: List[List[Dict[str, str]]] = [[] for _ in level]
+
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        for leaf, pos in enumerate(positions):
+            sibling = pos ^ 1
+            paths[leaf].append({
+                "sibling": "0x" + level[sibling].hex(),
+                "side": "left" if sibling < pos else "right"
+            })
+            positions[leaf] = pos // 2
+        level = [_merkle_node(level[i], level[i + 1]) for i in range(0, len(level), 2)]
+
+    return "0x" + level[0].hex(), paths
+
+
+def verify_merkle_path(proof_hash: str, path: List[Dict[str, str]], root: str) -> bool:
+    node = merkle_leaf(proof_hash)
+    for step in path:
+        sibling = _hash_bytes(step["sibling"])
+        node = _merkle_node(sibling, node) if step["side"] == "left" else _merkle_node(node, sibling)
+    return "0x" + node.hex() == root
+
+
+def chain_commitment(previous_commitment: str, merkle_root: str) -> str:
+    return "0x" + hashlib.sha256(_hash_bytes(previous_commitment) + _hash_bytes(merkle_root)).hexdigest()
+
+
+def _call_ezkl(result):
+    """Resolve an EZKL call that may be sync or a coroutine (worker thread)"""
+    if inspect.isawaitable(result):
+        async def _wait():
+            return await result
+        return asyncio.run(_wait())
+    return result
+
+
+class ProofAggregator:
+    """
+    Windowed per-model proof aggregation
+
+    Features:
+    - Open windows persisted in the aggregates table (survive restarts)
+    - Sealing on size or age, off the request path
+    - One on-chain anchor per aggregate, chained per model
+    - EZKL aggregate proof when the whole window is real EZKL proofs
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._chain_checks: Dict[str, Dict[str, Any]] = {}
+
+        # One window per model collects proofs; windows taken for sealing
+        # stay in _sealing until their seal succeeds, and are retried
+        self._open: Dict[str, Dict] = {}
+        self._sealing: Dict[str, Dict] = {}
+        for aggregate in sorted(db.get_aggregates(status="open"), key=lambda a: a.get("opened_at", 0)):
+            earlier = self._open.get(aggregate["model_id"])
+            if earlier is not None:
+                self._sealing[earlier["id"]] = earlier
+            self._open[aggregate["model_id"]] = aggregate
+
+    @property
+    def enabled(self) -> bool:
+        return PROOF_AGGREGATION_ENABLED
+
+    # ============ Collection ============
+
+    def add(self, proof: Dict[str, Any]) -> Dict[str, Any]:
+        """Add a proof to its model's open window. Returns the pending link."""
+        model_id = proof.get("model_id") or proof.get("circuit_info", {}).get("model_id")
+
+        with self._lock:
+            window = self._open.get(model_id)
+            if window is None:
+                window = db.create_aggregate({
+                    "model_id": model_id,
+                    "status": "open",
+                    "opened_at": time.time(),
+                    "members": []
+                })
+                self._open[model_id] = window
+
+            member = {"job_id": proof.get("job_id"), "proof_hash": proof["proof_hash"]}
+            snark = proof.get("proof")
+            circuit_info = proof.get("circuit_info", {})
+            if circuit_info.get("real_zkml") and isinstance(snark, dict):
+                snark_dir = AGGREGATE_ARTIFACTS_PATH / window["id"]
+                snark_dir.mkdir(parents=True, exist_ok=True)
+                snark_path = snark_dir / f"{len(window['members'])}.json"
+                with open(snark_path, 'w') as f:
+                    json.dump(snark, f)
+                member["snark_path"] = str(snark_path)
+                member["circuit_key"] = circuit_info.get("circuit_key")
+
+            leaf_index = len(window["members"])
+            window["members"].append(member)
+            db.update_aggregate(window["id"], {"members": window["members"]})
+            full = len(window["members"]) >= PROOF_AGGREGATION_WINDOW_SIZE
+
+        if full and self._wakeup is not None:
+            self._wakeup.set()
+
+        return {
+            "aggregate_id": window["id"],
+            "leaf_index": leaf_index,
+            "status": "pending",
+            "window_size": PROOF_AGGREGATION_WINDOW_SIZE
+        }
+
+    # ============ Lifecycle ============
+
+    def start(self):
+        if self._task is not None or not self.enabled:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._seal_loop())
+        print(f"[SUCCESS] Proof aggregation enabled (window {PROOF_AGGREGATION_WINDOW_SIZE} proofs / {PROOF_AGGREGATION_WINDOW_SECONDS:.0f}s)")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _seal_loop(self):
+        while True:
+            try:
+                await self.seal_due()
+            except Exception as e:
+                print(f"[ERROR] Proof aggregation failed: {e}")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=min(PROOF_AGGREGATION_WINDOW_SECONDS, 5))
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def seal_due(self, force: bool = False) -> List[Dict]:
+        """
+        Seal every window that is full or has been open long enough
+
+        A due window stops taking proofs (the next proof opens a new one)
+        but is only dropped once its seal succeeds; a window whose seal
+        failed is retried on the next pass.
+        """
+        now = time.time()
+        with self._lock:
+            for window in list(self._open.values()):
+                if window["members"] and (
+                    force
+                    or len(window["members"]) >= PROOF_AGGREGATION_WINDOW_SIZE
+                    or now - window["opened_at"] >= PROOF_AGGREGATION_WINDOW_SECONDS
+                ):
+                    del self._open[window["model_id"]]
+                    self._sealing[window["id"]] = window
+            due = sorted(self._sealing.values(), key=lambda w: w["opened_at"])
+
+        sealed = []
+        for window in due:
+            try:
+                aggregate = await asyncio.to_thread(self._seal, window)
+            except Exception as e:
+                print(f"[ERROR] Sealing proof aggregate {window['id']} failed, will retry: {e}")
+                continue
+            with self._lock:
+                self._sealing.pop(window["id"], None)
+            sealed.append(aggregate)
+        return sealed
+
+    # ============ Sealing ============
+
+    def _seal(self, window: Dict) -> Dict:
+        members = window["members"]
+        merkle_root, paths = build_merkle_tree([m["proof_hash"] for m in members])
+
+        previous = sorted(
+            db.get_aggregates(model_id=window["model_id"], status="sealed"),
+            key=lambda a: a.get("sealed_at", "")
+        )
+        previous_commitment = previous[-1]["commitment"] if previous else GENESIS_COMMITMENT
+        commitment = chain_commitment(previous_commitment, merkle_root)
+
+        accumulator = {"type": "merkle-sha256"}
+        circuit_keys = {m.get("circuit_key") for m in members}
+        if EZKL_AVAILABLE and all(m.get("snark_path") for m in members) and len(circuit_keys) == 1:
+            ezkl_aggregate = self._ezkl_aggregate(window, circuit_keys.pop())
+            if ezkl_aggregate:
+                accumulator = ezkl_aggregate
+
+        on_chain = self._anchor(window["id"], commitment)
+
+        for member, path in zip(members, paths):
+            member["merkle_path"] = path
+
+        updates = {
+            "status": "sealed",
+            "size": len(members),
+            "merkle_root": merkle_root,
+            "previous_commitment": previous_commitment,
+            "commitment": commitment,
+            "accumulator": accumulator,
+            "on_chain": on_chain,
+            "members": members,
+            "sealed_at": datetime.utcnow().isoformat()
+        }
+        aggregate = db.update_aggregate(window["id"], updates) or {**window, **updates}
+
+        for leaf_index, member in enumerate(members):
+            if member.get("job_id"):
+                db.update_proof_by_job(member["job_id"], {
+                    "aggregation": {
+                        "aggregate_id": window["id"],
+                        "leaf_index": leaf_index,
+                        "merkle_path": member["merkle_path"],
+                        "merkle_root": merkle_root,
+                        "commitment": commitment,
+                        "status": "sealed"
+                    }
+                })
+
+        print(f"[SUCCESS] Sealed proof aggregate {window['id']} ({len(members)} proofs, {accumulator['type']})")
+        return aggregate
+
+    def _anchor(self, aggregate_id: str, commitment: str) -> Dict[str, Any]:
+        if not blockchain_service.connected:
+            return {"anchored": False, "error": "Blockchain not connected", "chain": "Shardeum"}
+
+        result = blockchain_service.anchor_proof(f"aggregate-{aggregate_id}", commitment)
+        if result.get("success"):
+            return {
+                "anchored": True,
+                "audit_id": f"aggregate-{aggregate_id}",
+                "transaction_hash": result.get("transaction_hash"),
+                "block_number": result.get("block_number"),
+                "gas_used": result.get("gas_used"),
+                "explorer_url": result.get("explorer_url"),
+                "chain": "Shardeum"
+            }
+
+        print(f"[WARNING] Aggregate anchoring failed: {result.get('error')}")
+        return {"anchored": False, "error": result.get("error"), "chain": "Shardeum"}
+
+    def _ezkl_aggregate(self, window: Dict, circuit_key: str) -> Optional[Dict[str, Any]]:
+        """Accumulate the window's EZKL proofs into one aggregate proof"""
+        snarks = [m["snark_path"] for m in window["members"]]
+        logrows = PROOF_AGGREGATION_LOGROWS
+
+        try:
+            srs_path = circuit_registry.srs_path(logrows)
+            if not srs_path.exists():
+                _call_ezkl(ezkl.get_srs(srs_path=str(srs_path), logrows=logrows))
+
+            # Aggregation keys depend on the inner circuit and batch size only
+            keys_dir = AGGREGATE_ARTIFACTS_PATH / "keys" / f"{circuit_key}-{len(snarks)}-{logrows}"
+            keys_dir.mkdir(parents=True, exist_ok=True)
+            vk_path = str(keys_dir / "aggr_vk.key")
+            pk_path = str(keys_dir / "aggr_pk.key")
+            if not (os.path.exists(vk_path) and os.path.exists(pk_path)):
+                _call_ezkl(ezkl.setup_aggregate(
+                    sample_snarks=snarks,
+                    vk_path=vk_path,
+                    pk_path=pk_path,
+                    logrows=logrows,
+                    srs_path=str(srs_path)
+                ))
+
+            proof_path = str(AGGREGATE_ARTIFACTS_PATH / window["id"] / "aggregate_proof.json")
+            _call_ezkl(ezkl.aggregate(
+                aggregation_snarks=snarks,
+                proof_path=proof_path,
+                vk_path=pk_path,
+                logrows=logrows,
+                srs_path=str(srs_path)
+            ))
+            is_valid = _call_ezkl(ezkl.verify_aggr(
+                proof_path=proof_path,
+                vk_path=vk_path,
+                logrows=logrows,
+                srs_path=str(srs_path)
+            ))
+
+            return {
+                "type": "ezkl-aggregate",
+                "proof_path": proof_path,
+                "vk_path": vk_path,
+                "logrows": logrows,
+                "is_valid": bool(is_valid)
+            }
+        except Exception as e:
+            print(f"[WARNING] EZKL aggregation failed, using Merkle commitment only: {e}")
+            return None
+
+    # ============ Verification ============
+
+    def verify_membership(self, proof: Dict[str, Any]) -> Tuple[bool, str, Dict[str, Any]]:
+        """
+        Check a proof's inclusion in its aggregate
+
+        The on-chain lookup is done once per aggregate and reused for every
+        member proof.
+        """
+        link = proof.get("aggregation") or {}
+        aggregate = db.get_aggregate(link.get("aggregate_id", ""))
+        details = {"aggregate_id": link.get("aggregate_id")}
+
+        if aggregate is None:
+            return False, "Aggregate not found", details
+        if aggregate.get("status") != "sealed":
+            # Not verified yet: the proof has no Merkle path or commitment
+            details["status"] = "pending"
+            return False, "Proof pending aggregation", details
+
+        leaf_index = link.get("leaf_index", 0)
+        members = aggregate["members"]
+        if not isinstance(leaf_index, int) or not 0 <= leaf_index < len(members):
+            details.update({"status": "sealed", "included": False, "leaf_index": leaf_index})
+            return False, "Invalid leaf index for aggregate", details
+        member = members[leaf_index]
+        included = (
+            member["proof_hash"] == proof.get("proof_hash")
+            and verify_merkle_path(proof["proof_hash"], member["merkle_path"], aggregate["merkle_root"])
+            and chain_commitment(aggregate["previous_commitment"], aggregate["merkle_root"]) == aggregate["commitment"]
+        )
+        details.update({"status": "sealed", "included": included, "merkle_root": aggregate["merkle_root"]})
+        if not included:
+            return False, "Proof not included in aggregate", details
+
+        if aggregate.get("on_chain", {}).get("anchored") and blockchain_service.connected:
+            check = self._chain_checks.get(aggregate["id"])
+            if check is None:
+                check = blockchain_service.verify_on_chain(f"aggregate-{aggregate['id']}", aggregate["commitment"])
+                self._chain_checks[aggregate["id"]] = check
+            details["on_chain"] = check
+            if not check.get("verified"):
+                return False, "On-chain aggregate commitment mismatch", details
+            return True, "Proof verified via on-chain aggregate OK", details
+
+        return True, "Proof verified via aggregate", details
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            open_windows = {
+                model_id: len(window["members"]) for model_id, window in self._open.items()
+            }
+            sealing = len(self._sealing)
+        return {
+            "enabled": self.enabled,
+            "window_size": PROOF_AGGREGATION_WINDOW_SIZE,
+            "window_seconds": PROOF_AGGREGATION_WINDOW_SECONDS,
+            "open_windows": open_windows,
+            "sealing": sealing,
+            "sealed": len(db.get_aggregates(status="sealed"))
+        }
+
+
+# Global instance
+proof_aggregator = ProofAggregator()
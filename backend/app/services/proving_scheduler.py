@@ -0,0 +1,173 @@
+"""
+V-Inference Backend - Proving Scheduler
+Runs EZKL witness generation and proving in a process pool
+
+Each job gets its own scratch directory for input/witness/proof files, so
+concurrent proofs for the same model never share paths. Compiled circuits,
+proving keys and the SRS are read-only registry files that every job
+reads in place.
+"""
+import os
+import json
+import time
+import asyncio
+import inspect
+import tempfile
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional
+
+PROVING_WORKERS = int(os.getenv("PROVING_WORKERS", str(os.cpu_count() or 1)))
+
+# Upper bounds (seconds) of the proving-time histogram buckets
+PROVING_TIME_BUCKETS = [0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600]
+
+
+def _run(result):
+    """Resolve an EZKL call that may be sync or a coroutine (child process)"""
+    if inspect.isawaitable(result):
+        return asyncio.run(_await(result))
+    return result
+
+
+async def _await(awaitable):
+    return await awaitable
+
+
+def _prove_job(circuit: Dict[str, Any], ezkl_input: List) -> Dict[str, Any]:
+    """
+    Generate and verify one proof in an isolated scratch directory
+
+    Runs in a pool process, so it only takes plain paths and data.
+    """
+    import ezkl
+
+    with tempfile.TemporaryDirectory(prefix="vinf-prove-") as scratch:
+        input_path = os.path.join(scratch, "input.json")
+        witness_path = os.path.join(scratch, "witness.json")
+        proof_path = os.path.join(scratch, "proof.json")
+
+        with open(input_path, 'w') as f:
+            json.dump({"input_data": [ezkl_input]}, f)
+
+        witness_start = time.perf_counter()
+        _run(ezkl.gen_witness(input_path, circuit["compiled_path"], witness_path))
+        witness_time = time.perf_counter() - witness_start
+
+        prove_start = time.perf_counter()
+        _run(ezkl.prove(
+            witness_path,
+            circuit["compiled_path"],
+            circuit["pk_path"],
+            proof_path,
+            "single",
+            circuit["srs_path"]
+        ))
+        prove_time = time.perf_counter() - prove_start
+
+        is_valid = _run(ezkl.verify(
+            proof_path,
+            circuit["settings_path"],
+            circuit["vk_path"],
+            circuit["srs_path"]
+        ))
+
+        with open(proof_path, 'r') as f:
+            proof_data = json.load(f)
+
+    return {
+        "proof": proof_data,
+        "is_valid": bool(is_valid),
+        "witness_time_seconds": witness_time,
+        "proving_time_seconds": prove_time
+    }
+
+
+class ProvingScheduler:
+    """
+    Bounded process pool for SNARK proving
+
+    Features:
+    - Pool sized to the available cores (PROVING_WORKERS)
+    - Per-job scratch directories, no shared mutable paths
+    - Queue depth / in-flight gauges and a proving-time histogram
+    """
+
+    def __init__(self, max_workers: int = PROVING_WORKERS):
+        self.max_workers = max(1, max_workers)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+        self.queued = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self._histogram = [0] * (len(PROVING_TIME_BUCKETS) + 1)
+        self._time_sum = 0.0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            self._slots = asyncio.Semaphore(self.max_workers)
+        return self._executor
+
+    async def prove(self, circuit: Dict[str, Any], ezkl_input: List) -> Dict[str, Any]:
+        """Queue a proof and wait for its result"""
+        executor = self._get_executor()
+        loop = asyncio.get_running_loop()
+
+        self.queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+
+        self.in_flight += 1
+        start = time.perf_counter()
+        try:
+            result = await loop.run_in_executor(executor, _prove_job, circuit, ezkl_input)
+            self.completed += 1
+            return result
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self._observe(time.perf_counter() - start)
+            self.in_flight -= 1
+            self._slots.release()
+
+    def _observe(self, seconds: float):
+        self._histogram[bisect_left(PROVING_TIME_BUCKETS, seconds)] += 1
+        self._time_sum += seconds
+
+    def get_metrics(self) -> Dict[str, Any]:
+        buckets = {}
+        cumulative = 0
+        for bound, count in zip(PROVING_TIME_BUCKETS, self._histogram):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        buckets["+Inf"] = cumulative + self._histogram[-1]
+
+        observed = buckets["+Inf"]
+        return {
+            "workers": self.max_workers,
+            "queue_depth": self.queued,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "proving_time_seconds": {
+                "buckets": buckets,
+                "count": observed,
+                "sum": round(self._time_sum, 3),
+                "avg": round(self._time_sum / observed, 3) if observed else None
+            }
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Global instance
+proving_scheduler = ProvingScheduler()
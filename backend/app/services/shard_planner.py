@@ -0,0 +1,234 @@
+"""
+V-Inference Backend - Training Shard Planner
+Splits a training dataset into row-range shards sized by data volume and fleet
+
+For OBDS datasets only the header is fetched (two HTTP Range requests).
+Shards are runs of whole dataset chunks, so each shard carries the byte
+range of its rows in every column plus the hashes of its chunks, and a
+worker downloads and verifies exactly its own partition. Legacy JSON
+datasets ({"X": [...], "y": [...]}) are read once to count rows; their
+shards are row ranges of the whole file.
+"""
+import os
+import json
+import math
+import hashlib
+from typing import Dict, Any, List, Optional, Tuple
+
+import requests
+
+from ..core.config import IPFS_GATEWAYS
+from ..core.dataset_format import (
+    is_dataset,
+    header_size,
+    parse_header,
+    row_nbytes,
+    row_byte_ranges,
+    chunks_for_rows
+)
+
+# Target bytes of training data per shard
+SHARD_TARGET_BYTES = int(os.getenv("SHARD_TARGET_BYTES", str(16 * 1024 * 1024)))
+# Shards per live worker, so fast workers can take more than one
+SHARDS_PER_WORKER = int(os.getenv("SHARDS_PER_WORKER", "2"))
+SHARD_MIN_ROWS = int(os.getenv("SHARD_MIN_ROWS", "256"))
+SHARD_MAX_COUNT = int(os.getenv("SHARD_MAX_COUNT", "256"))
+# Layout used when the dataset cannot be read (demo jobs without real data)
+FALLBACK_SHARD_COUNT = 10
+
+DATASET_FETCH_TIMEOUT = 30
+
+
+def resolve_dataset_url(dataset_url: str) -> str:
+    """HTTP URL for a dataset given as a URL, ipfs:// URI or bare CID"""
+    if dataset_url.startswith(("http://", "https://")):
+        return dataset_url
+    cid = dataset_url[len("ipfs://"):] if dataset_url.startswith("ipfs://") else dataset_url
+    return f"{IPFS_GATEWAYS[0]}{cid}"
+
+
+def fetch_range(url: str, start: int, end: int) -> bytes:
+    """Bytes [start, end) of a URL via an HTTP Range request"""
+    response = requests.get(
+        url,
+        headers={"Range": f"bytes={start}-{end - 1}"},
+        timeout=DATASET_FETCH_TIMEOUT
+    )
+    response.raise_for_status()
+    if response.status_code == 206:
+        return response.content
+    # Server ignored the Range header and sent the whole file
+    return response.content[start:end]
+
+
+class ShardPlanner:
+    """
+    Plans data-partitioned shards for training jobs
+
+    A plan is {"dataset": {...}, "shards": [...]} where each shard has
+    row_start/row_end and, for OBDS datasets, byte_ranges, chunks and a
+    checksum over its chunk hashes.
+    """
+
+    def __init__(
+        self,
+        target_bytes: int = SHARD_TARGET_BYTES,
+        shards_per_worker: int = SHARDS_PER_WORKER,
+        min_rows: int = SHARD_MIN_ROWS,
+        max_shards: int = SHARD_MAX_COUNT
+    ):
+        self.target_bytes = target_bytes
+        self.shards_per_worker = shards_per_worker
+        self.min_rows = min_rows
+        self.max_shards = max_shards
+
+    def choose_shard_count(self, rows: int, total_bytes: int, live_workers: int, max_count: Optional[int] = None) -> int:
+        """
+        Enough shards to keep each under target_bytes and every live worker
+        busy, but none smaller than min_rows
+
+        Args:
+            rows: Dataset rows
+            total_bytes: Dataset bytes across all columns
+            live_workers: Workers currently online
+            max_count: Extra cap (e.g. the number of chunks)
+
+        Returns:
+            Shard count (at least 1)
+        """
+        by_volume = math.ceil(total_bytes / max(1, self.target_bytes))
+        by_workers = max(1, live_workers) * self.shards_per_worker
+        count = max(by_volume, by_workers)
+        count = min(count, max(1, rows // max(1, self.min_rows)), self.max_shards)
+        if max_count is not None:
+            count = min(count, max_count)
+        return max(1, count)
+
+    @staticmethod
+    def split(total: int, parts: int) -> List[Tuple[int, int]]:
+        """Split [0, total) into `parts` contiguous ranges differing by at most one"""
+        base, extra = divmod(total, parts)
+        ranges = []
+        start = 0
+        for i in range(parts):
+            end = start + base + (1 if i < extra else 0)
+            ranges.append((start, end))
+            start = end
+        return ranges
+
+    def plan_obds(self, header: Dict[str, Any], live_workers: int) -> List[Dict[str, Any]]:
+        """Chunk-aligned shards of an OBDS dataset (none for an empty one)"""
+        rows = header["rows"]
+        chunks = header["chunks"]
+        if rows == 0 or not chunks:
+            return []
+        total_bytes = sum(row_nbytes(c) for c in header["columns"]) * rows
+        count = self.choose_shard_count(rows, total_bytes, live_workers, max_count=len(chunks))
+
+        shards = []
+        for chunk_start, chunk_end in self.split(len(chunks), count):
+            row_start = chunks[chunk_start]["row_start"]
+            row_end = chunks[chunk_end - 1]["row_end"]
+            shard_chunks = chunks_for_rows(header, row_start, row_end)
+            checksum = hashlib.sha256(b"".join(bytes.fromhex(c["sha256"]) for c in shard_chunks)).hexdigest()
+            shards.append({
+                "row_start": row_start,
+                "row_end": row_end,
+                "byte_ranges": {name: list(r) for name, r in row_byte_ranges(header, row_start, row_end).items()},
+                "chunks": shard_chunks,
+                "checksum": checksum
+            })
+        return shards
+
+    def plan_rows(self, rows: int, total_bytes: int, live_workers: int) -> List[Dict[str, Any]]:
+        """Row-range shards of a dataset without a byte layout (none for an empty one)"""
+        if rows == 0:
+            return []
+        count = self.choose_shard_count(rows, total_bytes, live_workers)
+        return [
+            {"row_start": start, "row_end": end, "byte_ranges": None, "chunks": None, "checksum": None}
+            for start, end in self.split(rows, count)
+        ]
+
+    def inspect(self, dataset_url: str) -> Dict[str, Any]:
+        """
+        Read a dataset's layout
+
+        Returns:
+            Dict with format ("obds" or "json"), url, rows, total_bytes and
+            either the OBDS header or the sha256 of the JSON file
+        """
+        url = resolve_dataset_url(dataset_url)
+        prefix = fetch_range(url, 0, 9)
+        if is_dataset(prefix):
+            header = parse_header(prefix + fetch_range(url, 9, header_size(prefix)))
+            return {
+                "format": "obds",
+                "url": url,
+                "rows": header["rows"],
+                "total_bytes": sum(row_nbytes(c) for c in header["columns"]) * header["rows"],
+                "content_hash": header["content_hash"],
+                "header": header
+            }
+
+        response = requests.get(url, timeout=DATASET_FETCH_TIMEOUT)
+        response.raise_for_status()
+        data = json.loads(response.content.decode("utf-8"))
+        if "X" not in data or "y" not in data or len(data["X"]) != len(data["y"]):
+            raise ValueError("JSON dataset needs X and y with the same number of rows")
+        return {
+            "format": "json",
+            "url": url,
+            "rows": len(data["X"]),
+            "total_bytes": len(response.content),
+            "content_hash": hashlib.sha256(response.content).hexdigest(),
+            "header": None
+        }
+
+    @staticmethod
+    def fallback_plan() -> Dict[str, Any]:
+        """FALLBACK_SHARD_COUNT shards without a dataset layout"""
+        return {
+            "dataset": None,
+            "shards": [
+                {"row_start": None, "row_end": None, "byte_ranges": None, "chunks": None, "checksum": None}
+                for _ in range(FALLBACK_SHARD_COUNT)
+            ]
+        }
+
+    def plan(self, dataset_url: str, live_workers: int) -> Dict[str, Any]:
+        """
+        Plan the shards of a training job
+
+        Args:
+            dataset_url: Dataset URL, ipfs:// URI or CID
+            live_workers: Workers currently online
+
+        Returns:
+            {"dataset": dataset info or None, "shards": [...]}; when the
+            dataset cannot be read, FALLBACK_SHARD_COUNT shards without
+            ranges are returned and workers train on synthetic data (as
+            for an empty dataset)
+        """
+        try:
+            info = self.inspect(dataset_url)
+        except Exception as e:
+            print(f"[WARNING] Could not read dataset {dataset_url}: {e}")
+            return self.fallback_plan()
+
+        if info["rows"] == 0:
+            print(f"[WARNING] Dataset {dataset_url} has no rows")
+            return self.fallback_plan()
+
+        if info["format"] == "obds":
+            shards = self.plan_obds(info["header"], live_workers)
+        else:
+            shards = self.plan_rows(info["rows"], info["total_bytes"], live_workers)
+
+        dataset = {key: info[key] for key in ("format", "url", "rows", "total_bytes", "content_hash")}
+        print(f"[INFO] Planned {len(shards)} shards over {info['rows']} rows ({info['format']}, {live_workers} live workers)")
+        return {"dataset": dataset, "shards": shards}
+
+
+# Global instance
+shard_planner = ShardPlanner()
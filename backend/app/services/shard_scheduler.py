@@ -0,0 +1,599 @@
+"""
+V-Inference Backend - Training Shard Scheduler
+In-memory shard queues with leased, push-style assignment
+
+Pending shards of every training job sit in per-job queues held in
+memory, rebuilt from the jobs table on first use. Workers long-poll
+next_shard(): a free shard is leased immediately, otherwise the worker
+parks as a waiter and the next shard that is enqueued is handed straight
+to the oldest waiter. Every claim is a constant-time queue pop with no
+competing requests, so there are no lost races to reject; each granted
+lease costs one jobs-table write.
+
+Leases expire unless the worker renews them with heartbeats; a reaper
+returns expired shards to the front of their queue. Heartbeats also
+report the shard's latest training checkpoint, which is stored on the
+shard so whichever worker leases it next resumes from there. Once a job
+has no queued shards left, shards running much longer than the job's
+median shard time are offered to idle workers as speculative copies,
+and the first valid result for a shard wins.
+
+Assignment is sized by each worker's speed relative to the fleet median:
+measured rows/s from its recent shards, else its /benchmark score, else
+its core count. Faster workers get several shards per lease (bounded by
+the RAM they registered), workers well below the median sit out a job's
+last few shards while faster workers are active, and jobs that need
+proofs are only leased to zk_capable workers.
+"""
+import os
+import time
+import asyncio
+import statistics
+from collections import OrderedDict, deque
+from typing import Dict, Any, List, Optional, Tuple, Deque, Set
+
+from ..core.database import db
+
+SHARD_LEASE_SECONDS = float(os.getenv("SHARD_LEASE_SECONDS", "60"))
+NEXT_SHARD_MAX_WAIT_SECONDS = float(os.getenv("NEXT_SHARD_MAX_WAIT_SECONDS", "30"))
+SHARD_REAP_INTERVAL_SECONDS = float(os.getenv("SHARD_REAP_INTERVAL_SECONDS", "10"))
+
+# Speculate on a shard running longer than this multiple of the job's median
+SPECULATION_SLOWDOWN = float(os.getenv("SPECULATION_SLOWDOWN", "1.5"))
+# Fraction of a job's shards that must be done before its median is trusted
+SPECULATION_MIN_COMPLETED = float(os.getenv("SPECULATION_MIN_COMPLETED", "0.5"))
+SPECULATION_MAX_COPIES = int(os.getenv("SPECULATION_MAX_COPIES", "1"))
+
+# Most shards one lease may bundle for a fast worker
+MAX_SHARDS_PER_LEASE = int(os.getenv("MAX_SHARDS_PER_LEASE", "4"))
+# Share of a worker's registered RAM one lease's data may take
+LEASE_MEMORY_FRACTION = float(os.getenv("LEASE_MEMORY_FRACTION", "0.25"))
+# Workers slower than this fraction of the median skip a job's tail
+TAIL_SLOW_FACTOR = float(os.getenv("TAIL_SLOW_FACTOR", "0.5"))
+THROUGHPUT_EWMA_ALPHA = float(os.getenv("THROUGHPUT_EWMA_ALPHA", "0.3"))
+WORKER_PROFILE_REFRESH_SECONDS = 60
+
+# Job statuses whose shards can still be handed out
+SCHEDULABLE_STATUSES = ("sharding", "processing")
+
+
+class ShardScheduler:
+    """
+    Leases training shards to workers
+
+    Features:
+    - Per-job FIFO queues, served round-robin across jobs
+    - Long-poll waiters served in arrival order (no thundering herd)
+    - Heartbeat-renewed leases; expired shards are requeued
+    - Speculative copies of straggling shards, first result wins
+    - Throughput-sized leases and zk_capable routing
+    """
+
+    def __init__(self, lease_seconds: float = SHARD_LEASE_SECONDS):
+        self.lease_seconds = lease_seconds
+        self._queues: "OrderedDict[str, Deque[int]]" = OrderedDict()
+        # Queue entries whose shard was claimed directly are skipped lazily
+        self._pending: Dict[str, Set[int]] = {}
+        # (job_id, shard_index) -> {worker_id: lease}
+        self._leases: Dict[Tuple[str, int], Dict[str, Dict[str, Any]]] = {}
+        # Workers that held a lease on a shard and may still submit it
+        self._holders: Dict[Tuple[str, int], Set[str]] = {}
+        self._speculative: Deque[Tuple[str, int]] = deque()
+        self._durations: Dict[str, List[float]] = {}
+        self._total_shards: Dict[str, int] = {}
+        # job_id -> {requires_zk, shard_rows, shard_bytes}
+        self._job_meta: Dict[str, Dict[str, Any]] = {}
+        # worker_id -> EWMA rows/s over its completed shards
+        self._throughput: Dict[str, float] = {}
+        self._last_done: Dict[str, float] = {}
+        self._profiles: Dict[str, Dict[str, Any]] = {}
+        self._profiles_loaded_at = 0.0
+        self._waiters: Deque[Tuple[str, asyncio.Future]] = deque()
+        self._task: Optional[asyncio.Task] = None
+        self._loaded = False
+        self.stats = {"leased": 0, "expired": 0, "speculated": 0, "duplicates_discarded": 0, "checkpoints": 0}
+
+    # ============ Queue State ============
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        for job in db._read_file(db.jobs_file):
+            if job.get("type") != "training" or job.get("status") not in SCHEDULABLE_STATUSES:
+                continue
+            self._track(job)
+        print(f"[INFO] Shard scheduler loaded {sum(len(p) for p in self._pending.values())} pending shards")
+
+    def _track(self, job: Dict[str, Any]):
+        job_id = job["id"]
+        self._total_shards[job_id] = len(job.get("shards", []))
+        self._job_meta[job_id] = self._describe(job)
+        for shard in job.get("shards", []):
+            index = shard["shard_index"]
+            if shard["status"] == "pending":
+                self._queues.setdefault(job_id, deque()).append(index)
+                self._pending.setdefault(job_id, set()).add(index)
+            elif shard["status"] == "processing" and shard.get("worker_id"):
+                # Heartbeats are not persisted: running shards get a fresh lease
+                self._add_lease(job_id, index, shard["worker_id"], shard.get("leased_at") or time.time())
+                self._leases[(job_id, index)][shard["worker_id"]]["started_at"] = time.time()
+
+    def add_job(self, job: Dict[str, Any]):
+        """Queue a new job's pending shards and serve any waiting workers"""
+        self._ensure_loaded()
+        if job["id"] not in self._total_shards:
+            self._track(job)
+        self._dispatch()
+
+    def _requeue(self, job_id: str, index: int):
+        """Put a shard back at the front of its job's queue"""
+        queue = self._queues.get(job_id)
+        if queue is None:
+            queue = self._queues[job_id] = deque()
+        queue.appendleft(index)
+        self._pending.setdefault(job_id, set()).add(index)
+
+    @staticmethod
+    def _describe(job: Dict[str, Any]) -> Dict[str, Any]:
+        """Routing and sizing facts about a job's shards"""
+        dataset = job.get("dataset") or {}
+        bytes_per_row = dataset.get("total_bytes", 0) / max(1, dataset.get("rows", 1))
+        shard_rows, shard_bytes = {}, {}
+        for shard in job.get("shards", []):
+            rows = (shard.get("row_end") or 0) - (shard.get("row_start") or 0)
+            shard_rows[shard["shard_index"]] = rows
+            ranges = shard.get("byte_ranges")
+            shard_bytes[shard["shard_index"]] = (
+                sum(end - start for start, end in ranges.values()) if ranges else rows * bytes_per_row
+            )
+        return {
+            "requires_zk": bool(job.get("requires_proof")),
+            "shard_rows": shard_rows,
+            "shard_bytes": shard_bytes
+        }
+
+    def _pop_batch(self, worker_id: str) -> Optional[Tuple[str, List[int]]]:
+        """Next job this worker may run, and as many of its shards as it should take"""
+        profile = self._profile(worker_id)
+        speed = self._relative_speed(worker_id)
+        for job_id in list(self._queues):
+            queue = self._queues[job_id]
+            pending = self._pending.get(job_id, set())
+            while queue and queue[0] not in pending:
+                queue.popleft()
+            if not queue:
+                del self._queues[job_id]
+                continue
+            if self._job_meta.get(job_id, {}).get("requires_zk") and not profile.get("zk_capable"):
+                continue
+            if self._defer_tail(worker_id, speed, len(pending)):
+                continue
+
+            size = self._lease_size(worker_id, speed, job_id, len(pending))
+            indexes = []
+            while queue and len(indexes) < size:
+                index = queue.popleft()
+                if index in pending:
+                    pending.discard(index)
+                    indexes.append(index)
+            # Round-robin: the next lease comes from the next job
+            self._queues.move_to_end(job_id)
+            return job_id, indexes
+        return None
+
+    def _pop_speculative(self, worker_id: str) -> Optional[Tuple[str, int]]:
+        """Next straggler this worker is not already running"""
+        skipped = []
+        found = None
+        while self._speculative:
+            key = self._speculative.popleft()
+            leases = self._leases.get(key)
+            if not leases:
+                continue  # finished or requeued meanwhile
+            if worker_id in leases or not self._may_speculate(worker_id, key, leases):
+                skipped.append(key)
+                continue
+            found = key
+            break
+        self._speculative.extendleft(reversed(skipped))
+        return found
+
+    # ============ Fleet Model ============
+
+    def _profile(self, worker_id: str) -> Dict[str, Any]:
+        """Registered hardware (and benchmark score) of a worker"""
+        now = time.time()
+        stale = now - self._profiles_loaded_at > WORKER_PROFILE_REFRESH_SECONDS
+        if stale or (worker_id not in self._profiles and now - self._profiles_loaded_at > 5):
+            self._profiles_loaded_at = now
+            self._profiles = {
+                w["node_id"]: {**(w.get("hardware_info") or {}), "benchmark_score": w.get("benchmark_score")}
+                for w in db._read_file(db.workers_file) if w.get("node_id")
+            }
+        return self._profiles.get(worker_id, {})
+
+    def _relative_speed(self, worker_id: str) -> float:
+        """Worker speed over the fleet median (1.0 when nothing is known)"""
+        if worker_id in self._throughput:
+            return self._throughput[worker_id] / statistics.median(self._throughput.values())
+        profile = self._profile(worker_id)
+        for key in ("benchmark_score", "cpu_cores"):
+            values = [p[key] for p in self._profiles.values() if p.get(key)]
+            if profile.get(key) and values:
+                return profile[key] / statistics.median(values)
+        return 1.0
+
+    def _record_throughput(self, worker_id: str, rows: int, seconds: float):
+        if rows <= 0 or seconds <= 0:
+            return
+        rate = rows / seconds
+        previous = self._throughput.get(worker_id)
+        self._throughput[worker_id] = rate if previous is None else (
+            THROUGHPUT_EWMA_ALPHA * rate + (1 - THROUGHPUT_EWMA_ALPHA) * previous
+        )
+
+    def _active_workers(self) -> Set[str]:
+        active = {w for leases in self._leases.values() for w in leases}
+        active.update(w for w, f in self._waiters if not f.done())
+        return active
+
+    def _lease_size(self, worker_id: str, speed: float, job_id: str, queued: int) -> int:
+        """Shards per lease: proportional to speed, fair to other workers, within RAM"""
+        size = max(1, min(MAX_SHARDS_PER_LEASE, int(speed + 0.5)))
+        size = min(size, max(1, queued // len(self._active_workers() | {worker_id})))
+
+        ram_gb = self._profile(worker_id).get("total_ram_gb")
+        shard_bytes = list(self._job_meta.get(job_id, {}).get("shard_bytes", {}).values())
+        if ram_gb and shard_bytes:
+            per_shard = max(1.0, statistics.mean(shard_bytes))
+            size = min(size, max(1, int(ram_gb * 1024 ** 3 * LEASE_MEMORY_FRACTION // per_shard)))
+        return size
+
+    def _defer_tail(self, worker_id: str, speed: float, queued: int) -> bool:
+        """A slow worker leaves a job's last shards to faster active workers"""
+        if speed >= TAIL_SLOW_FACTOR:
+            return False
+        faster = sum(
+            1 for w in self._active_workers()
+            if w != worker_id and self._relative_speed(w) >= 1.0
+        )
+        return queued <= faster
+
+    def _may_speculate(self, worker_id: str, key: Tuple[str, int], leases: Dict[str, Dict]) -> bool:
+        """
+        Copies only go to eligible workers at least as fast as the current
+        holders (ties included: on a uniform fleet the straggler is slow
+        this time, not by design), and never to a worker that skips tails
+        """
+        if self._job_meta.get(key[0], {}).get("requires_zk") and not self._profile(worker_id).get("zk_capable"):
+            return False
+        speed = self._relative_speed(worker_id)
+        if speed < TAIL_SLOW_FACTOR:
+            return False
+        return speed >= max(self._relative_speed(w) for w in leases)
+
+    # ============ Leasing ============
+
+    def _add_lease(
+        self,
+        job_id: str,
+        index: int,
+        worker_id: str,
+        leased_at: float,
+        speculative: bool = False,
+        queued: bool = False
+    ):
+        self._leases.setdefault((job_id, index), {})[worker_id] = {
+            "leased_at": leased_at,
+            "expires_at": time.time() + self.lease_seconds,
+            "progress": 0,
+            "speculative": speculative,
+            # Later shards of a multi-shard lease wait for the earlier ones
+            "queued": queued
+        }
+        self._holders.setdefault((job_id, index), set()).add(worker_id)
+
+    def _grant(
+        self,
+        job_id: str,
+        indexes: List[int],
+        worker_id: str,
+        speculative: bool = False
+    ) -> Optional[Dict[str, Any]]:
+        """Record a lease on the shards; None if the job is gone"""
+        job = db.get_job(job_id)
+        if not job or job.get("status") not in SCHEDULABLE_STATUSES:
+            return None
+
+        shards = [job["shards"][index] for index in indexes]
+        now = time.time()
+        if speculative:
+            # The shard keeps its original owner; the copy lives in memory only
+            if any(shard["status"] != "processing" for shard in shards):
+                return None
+        else:
+            for shard in shards:
+                shard["status"] = "processing"
+                shard["worker_id"] = worker_id
+                shard["leased_at"] = now
+                shard["lease_expires_at"] = now + self.lease_seconds
+            if all(s["status"] != "pending" for s in job["shards"]):
+                job["status"] = "processing"
+            db.update_job(job_id, {"shards": job["shards"], "status": job["status"]})
+
+        for position, index in enumerate(indexes):
+            self._add_lease(job_id, index, worker_id, now, speculative, queued=position > 0)
+        self.stats["speculated" if speculative else "leased"] += len(indexes)
+        return {
+            "job_id": job_id,
+            "shard": shards[0],
+            "shards": shards,
+            "dataset": job.get("dataset"),
+            "script_url": job.get("script_url"),
+            "total_shards": job.get("total_shards"),
+            "lease_expires_at": now + self.lease_seconds,
+            "lease_seconds": self.lease_seconds,
+            "speculative": speculative
+        }
+
+    def _lease_next(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        while True:
+            batch = self._pop_batch(worker_id)
+            speculative = False
+            if batch is None:
+                entry = self._pop_speculative(worker_id)
+                batch = (entry[0], [entry[1]]) if entry else None
+                speculative = True
+            if batch is None:
+                return None
+            lease = self._grant(batch[0], batch[1], worker_id, speculative)
+            if lease is not None:
+                if speculative:
+                    print(f"[INFO] Speculative copy of shard {batch[1][0]} of job {batch[0]} leased to {worker_id}")
+                return lease
+
+    def _dispatch(self):
+        """Hand queued shards to parked workers, oldest first"""
+        still_waiting = deque()
+        while self._waiters:
+            worker_id, future = self._waiters.popleft()
+            if future.done():
+                continue
+            # Not every worker may run every job (zk routing, tail deferral)
+            lease = self._lease_next(worker_id) if self._queues or self._speculative else None
+            if lease is None:
+                still_waiting.append((worker_id, future))
+                continue
+            future.set_result(lease)
+        self._waiters = still_waiting
+
+    async def next_shard(self, worker_id: str, wait: float = NEXT_SHARD_MAX_WAIT_SECONDS) -> Optional[Dict[str, Any]]:
+        """
+        Lease the next shard for a worker, waiting up to `wait` seconds
+
+        Returns:
+            Lease dict (job_id, shard, dataset, lease_expires_at, ...) or
+            None if no shard became available in time
+        """
+        self._ensure_loaded()
+        lease = self._lease_next(worker_id)
+        if lease is not None or wait <= 0:
+            return lease
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((worker_id, future))
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout=min(wait, NEXT_SHARD_MAX_WAIT_SECONDS))
+        except asyncio.TimeoutError:
+            # A lease may have been handed over just as the wait expired
+            return future.result() if future.done() else None
+        finally:
+            if not future.done():
+                future.cancel()
+
+    def claim(self, job_id: str, index: int, worker_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Lease one specific shard (legacy claim-shard)
+
+        Returns:
+            Lease dict, or None if the shard is not pending
+        """
+        self._ensure_loaded()
+        pending = self._pending.get(job_id)
+        if not pending or index not in pending:
+            return None
+        pending.discard(index)
+        return self._grant(job_id, [index], worker_id)
+
+    def heartbeat(
+        self,
+        job_id: str,
+        index: int,
+        worker_id: str,
+        progress: float = 0,
+        checkpoint_url: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Renew a worker's lease, recording a newly published checkpoint
+
+        Returns:
+            {"renewed": bool, "cancelled": bool, "lease_expires_at"}; a
+            cancelled lease means the shard was finished by another worker
+            (or reassigned) and the worker should stop
+        """
+        self._ensure_loaded()
+        lease = self._leases.get((job_id, index), {}).get(worker_id)
+        if lease is None:
+            return {"renewed": False, "cancelled": True, "lease_expires_at": None}
+        expires_at = time.time() + self.lease_seconds
+        # Also renews the shards still waiting in the same multi-shard lease
+        for key, leases in self._leases.items():
+            if key[0] == job_id and worker_id in leases:
+                leases[worker_id]["expires_at"] = expires_at
+        if lease["queued"]:
+            lease["queued"] = False
+            lease["started_at"] = time.time()
+        lease["progress"] = progress
+        if checkpoint_url and checkpoint_url != lease.get("checkpoint_url"):
+            lease["checkpoint_url"] = checkpoint_url
+            self._persist_checkpoint(job_id, index, worker_id, checkpoint_url, progress)
+        return {"renewed": True, "cancelled": False, "lease_expires_at": expires_at}
+
+    def _persist_checkpoint(self, job_id: str, index: int, worker_id: str, url: str, progress: float):
+        job = db.get_job(job_id)
+        if not job or job["shards"][index]["status"] == "completed":
+            return
+        job["shards"][index]["checkpoint"] = {
+            "url": url,
+            "worker_id": worker_id,
+            "progress": progress,
+            "saved_at": time.time()
+        }
+        db.update_job(job_id, {"shards": job["shards"]})
+        self.stats["checkpoints"] += 1
+
+    def may_submit(self, job_id: str, index: int, worker_id: str) -> bool:
+        """True if the worker holds (or held) a lease on the shard"""
+        return worker_id in self._holders.get((job_id, index), set())
+
+    def complete(self, job_id: str, index: int, worker_id: Optional[str] = None):
+        """Record the winning result of a shard and cancel every other copy"""
+        leases = self._leases.pop((job_id, index), {})
+        self._holders.pop((job_id, index), None)
+        # A late result for a requeued shard still counts
+        self._pending.get(job_id, set()).discard(index)
+        winner = leases.get(worker_id)
+        if winner is not None:
+            now = time.time()
+            # Shards of one lease run back to back: time each from the previous finish
+            started = max(winner["leased_at"], self._last_done.get(worker_id, 0))
+            self._durations.setdefault(job_id, []).append(now - started)
+            self._record_throughput(worker_id, self._job_meta.get(job_id, {}).get("shard_rows", {}).get(index, 0), now - started)
+            self._last_done[worker_id] = now
+        losers = [w for w in leases if w != worker_id]
+        if losers:
+            print(f"[INFO] Shard {index} of job {job_id} won by {worker_id}, cancelling {len(losers)} copies")
+
+        if not self._pending.get(job_id) and not any(key[0] == job_id for key in self._leases):
+            self._pending.pop(job_id, None)
+            self._queues.pop(job_id, None)
+            self._durations.pop(job_id, None)
+            self._total_shards.pop(job_id, None)
+            self._job_meta.pop(job_id, None)
+
+    def discard_duplicate(self):
+        self.stats["duplicates_discarded"] += 1
+
+    # ============ Reaper / Speculation ============
+
+    def reap(self) -> Dict[str, int]:
+        """
+        Requeue shards whose every lease expired, and queue speculative
+        copies of stragglers
+
+        Returns:
+            Counts of requeued and speculated shards
+        """
+        self._ensure_loaded()
+        now = time.time()
+        requeued = []
+        for key, leases in list(self._leases.items()):
+            for worker_id in [w for w, lease in leases.items() if lease["expires_at"] < now]:
+                del leases[worker_id]
+                self.stats["expired"] += 1
+                print(f"[WARNING] Lease of {worker_id} on shard {key[1]} of job {key[0]} expired")
+            if not leases:
+                del self._leases[key]
+                requeued.append(key)
+
+        if requeued:
+            self._persist_requeue(requeued)
+            for job_id, index in requeued:
+                self._requeue(job_id, index)
+
+        speculated = self._plan_speculation(now)
+        if requeued or speculated:
+            self._dispatch()
+        return {"requeued": len(requeued), "speculated": speculated}
+
+    def _persist_requeue(self, keys: List[Tuple[str, int]]):
+        by_job: Dict[str, List[int]] = {}
+        for job_id, index in keys:
+            by_job.setdefault(job_id, []).append(index)
+        for job_id, indexes in by_job.items():
+            job = db.get_job(job_id)
+            if not job:
+                continue
+            for index in indexes:
+                shard = job["shards"][index]
+                if shard["status"] == "processing":
+                    shard["status"] = "pending"
+                    shard["worker_id"] = None
+                    shard["lease_expires_at"] = None
+            db.update_job(job_id, {"shards": job["shards"]})
+
+    def _plan_speculation(self, now: float) -> int:
+        """Queue copies of the slowest running shards of nearly finished jobs"""
+        queued = set(self._speculative)
+        candidates = []
+        for (job_id, index), leases in self._leases.items():
+            if self._pending.get(job_id) or (job_id, index) in queued:
+                continue
+            if len(leases) > SPECULATION_MAX_COPIES or any(l["queued"] for l in leases.values()):
+                continue
+            durations = self._durations.get(job_id) or []
+            total = self._total_shards.get(job_id) or 0
+            if not durations or len(durations) < SPECULATION_MIN_COMPLETED * total:
+                continue
+            elapsed = now - min(lease.get("started_at", lease["leased_at"]) for lease in leases.values())
+            threshold = SPECULATION_SLOWDOWN * statistics.median(durations)
+            if elapsed > threshold:
+                candidates.append((elapsed / threshold, (job_id, index)))
+
+        # Slowest first
+        for _, key in sorted(candidates, reverse=True):
+            self._speculative.append(key)
+        return len(candidates)
+
+    async def _reap_loop(self):
+        while True:
+            try:
+                self.reap()
+            except Exception as e:
+                print(f"[ERROR] Shard reaper failed: {e}")
+            await asyncio.sleep(SHARD_REAP_INTERVAL_SECONDS)
+
+    # ============ Lifecycle ============
+
+    def start(self):
+        """Start the lease reaper on the running event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._reap_loop())
+            print(f"[SUCCESS] Shard scheduler started (lease {self.lease_seconds:.0f}s)")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_status(self) -> Dict[str, Any]:
+        self._ensure_loaded()
+        return {
+            "queued_jobs": len(self._queues),
+            "pending_shards": sum(len(p) for p in self._pending.values()),
+            "active_leases": sum(len(l) for l in self._leases.values()),
+            "speculative_queue": len(self._speculative),
+            "waiting_workers": sum(1 for _, f in self._waiters if not f.done()),
+            "lease_seconds": self.lease_seconds,
+            "worker_throughput": {w: round(r, 2) for w, r in self._throughput.items()},
+            **self.stats
+        }
+
+
+# Global instance
+shard_scheduler = ShardScheduler()
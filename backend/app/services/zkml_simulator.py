@@ -9,12 +9,18 @@ import random
 import time
 import os
 import asyncio
+import threading
+from collections import OrderedDict
 from datetime import datetime
 from typing import Dict, Any, Tuple, Optional
 from pathlib import Path
 
 from ..core.blockchain import blockchain_service
 from ..core.database import db
+from ..core.canonical import canonical_hash
+from ..core.config import VERIFICATION_CACHE_SIZE
+from .blob_store import blob_store
+from .proof_aggregator import proof_aggregator
 
 # Try to import EZKL service for real ZK proofs
 try:
@@ -68,8 +74,24 @@ except ImportError:
 # Global sentiment analyzer (lazy loaded)
 _sentiment_analyzer = None
 
-# Cache for loaded models
+# Cache for loaded models, keyed by content hash so identical files
+# uploaded under different model ids share one loaded instance
 _model_cache = {}
+_onnx_session_cache = {}
+
+
+def _model_cache_key(file_path: str, content_hash: Optional[str] = None) -> str:
+    return content_hash or blob_store.hash_file(file_path) or file_path
+
+
+def get_onnx_session(file_path: str, content_hash: Optional[str] = None):
+    """Get a cached ONNX Runtime session for a model file"""
+    key = _model_cache_key(file_path, content_hash)
+    session = _onnx_session_cache.get(key)
+    if session is None:
+        session = ort.InferenceSession(file_path)
+        _onnx_session_cache[key] = session
+    return session
 
 
 def get_sentiment_analyzer():
@@ -86,17 +108,18 @@ def get_sentiment_analyzer():
     return _sentiment_analyzer
 
 
-def load_pkl_model(file_path: str):
+def load_pkl_model(file_path: str, content_hash: Optional[str] = None):
     """Load a PKL/pickle model file"""
     global _model_cache
     
-    if file_path in _model_cache:
-        return _model_cache[file_path]
-    
     if not os.path.exists(file_path):
         print(f"[WARNING] Model file not found: {file_path}")
         return None
     
+    cache_key = _model_cache_key(file_path, content_hash)
+    if cache_key in _model_cache:
+        return _model_cache[cache_key]
+    
     try:
         print(f"[INFO] Loading model from {file_path}...")
         
@@ -116,7 +139,7 @@ def load_pkl_model(file_path: str):
             with open(file_path, 'rb') as f:
                 model = pickle.load(f)
         
-        _model_cache[file_path] = model
+        _model_cache[cache_key] = model
         print(f"[SUCCESS] Model loaded successfully!")
         return model
     except Exception as e:
@@ -135,6 +158,9 @@ class ZKProofGenerator:
         self.proof_version = "zkml-v1.0"
         self.model_version = "v-inference-v1.0.0"
         self.blockchain = blockchain_service
+        self._verification_cache: "OrderedDict[str, Dict]" = OrderedDict()
+        self._reverify_lock = threading.Lock()
+        self.last_reverify: Optional[Dict[str, Any]] = None
     
     def generate_proof(
         self, 
@@ -192,7 +218,15 @@ class ZKProofGenerator:
             "generated_at": timestamp
         }
         
-        if anchor_on_chain:
+        if anchor_on_chain and proof_aggregator.enabled:
+            # Anchored once per batch when the aggregate is sealed
+            proof["aggregation"] = proof_aggregator.add(proof)
+            proof["on_chain"] = {
+                "anchored": False,
+                "reason": "Anchored with proof aggregate",
+                "aggregate_id": proof["aggregation"]["aggregate_id"]
+            }
+        elif anchor_on_chain:
             proof["on_chain"] = self._anchor_on_chain(job_id, proof_hash)
         else:
             proof["on_chain"] = {
@@ -203,12 +237,10 @@ class ZKProofGenerator:
         return proof
     
     def _hash_input(self, input_data: Dict[str, Any]) -> str:
-        sorted_data = json.dumps(input_data, sort_keys=True, default=str)
-        return "0x" + hashlib.sha256(sorted_data.encode()).hexdigest()
+        return "0x" + canonical_hash(input_data)
     
     def _hash_computation(self, output_data: Dict[str, Any]) -> str:
-        sorted_data = json.dumps(output_data, sort_keys=True, default=str)
-        return "0x" + hashlib.sha256(sorted_data.encode()).hexdigest()
+        return "0x" + canonical_hash(output_data)
     
     def _hash_model(self, model_id: str) -> str:
         model_data = f"{model_id}:{self.model_version}"
@@ -263,8 +295,176 @@ class ZKProofGenerator:
                 "chain": "Shardeum"
             }
     
-    def verify_proof(self, proof: Dict[str, Any]) -> Tuple[bool, str, Dict]:
-        """Verify a proof's integrity"""
+    def verifying_key_hash(self, proof: Dict[str, Any]) -> str:
+        """
+        Hash of the key material a proof is checked against
+        
+        Real EZKL proofs carry their circuit's vk hash; hash-based proofs are
+        checked against the proof/model version scheme.
+        """
+        vk_hash = proof.get("circuit_info", {}).get("vk_hash")
+        if vk_hash:
+            return vk_hash
+        scheme = f"{self.proof_version}:{self.model_version}"
+        return "0x" + hashlib.sha256(scheme.encode()).hexdigest()
+    
+    def verification_key(self, proof: Dict[str, Any]) -> str:
+        """
+        Cache key for a proof's verification result
+        
+        A digest of every field _verify_uncached() checks plus the verifying
+        key hash, so editing any of them (or rotating the key) misses.
+        """
+        return canonical_hash({
+            "proof_hash": proof.get("proof_hash"),
+            "components": proof.get("components", {}),
+            "job_id": proof.get("job_id", ""),
+            "timestamp": proof.get("timestamp", ""),
+            "aggregation": proof.get("aggregation"),
+            "on_chain": proof.get("on_chain", {}),
+            "vk_hash": self.verifying_key_hash(proof)
+        })
+    
+    def verify_proof(
+        self,
+        proof: Dict[str, Any],
+        force: bool = False,
+        persist: bool = True
+    ) -> Tuple[bool, str, Dict]:
+        """
+        Verify a proof's integrity
+        
+        Final results are stored in the verifications table under
+        verification_key(), so a proof is verified once, across restarts.
+        Only the verifier writes that table; nothing stored on the proof
+        record is trusted. Pass force=True to re-verify regardless, and
+        persist=False to leave storing the result to the caller.
+        """
+        key = self.verification_key(proof)
+        
+        if not force:
+            cached = self._stored_result(key)
+            if cached:
+                return cached["is_valid"], cached["message"], {**cached["details"], "cached": True}
+        
+        is_valid, message, details = self._verify_uncached(proof)
+        
+        # Pending aggregation or an unreachable chain can still change
+        pending = details.get("aggregation", {}).get("status") == "pending"
+        hash_failed = details.get("hash_matches") is False
+        if (is_valid and not pending) or hash_failed:
+            entry = {
+                "key": key,
+                "proof_hash": proof.get("proof_hash"),
+                "vk_hash": self.verifying_key_hash(proof),
+                "is_valid": is_valid,
+                "message": message,
+                "details": details,
+                "cached_at": datetime.utcnow().isoformat() + "Z"
+            }
+            self._remember(entry)
+            if persist:
+                db.save_verifications([entry])
+        
+        return is_valid, message, details
+    
+    def _stored_result(self, key: str) -> Optional[Dict]:
+        """Verification result from memory, else from the verifications table"""
+        cached = self._verification_cache.get(key)
+        if cached:
+            self._verification_cache.move_to_end(key)
+            return cached
+        stored = db.get_verification(key)
+        if stored:
+            self._remember(stored)
+        return stored
+    
+    def _remember(self, entry: Dict):
+        self._verification_cache[entry["key"]] = entry
+        self._verification_cache.move_to_end(entry["key"])
+        if len(self._verification_cache) > VERIFICATION_CACHE_SIZE:
+            self._verification_cache.popitem(last=False)
+    
+    def start_reverify(self, model_id: Optional[str] = None) -> bool:
+        """
+        Mark a re-verification job as running
+        
+        Call before scheduling reverify_all() in the background so a second
+        request sees the job immediately. Returns False if one is running.
+        """
+        with self._reverify_lock:
+            if self.last_reverify and self.last_reverify.get("status") == "running":
+                return False
+            self.last_reverify = {
+                "status": "running",
+                "model_id": model_id,
+                "started_at": datetime.utcnow().isoformat() + "Z"
+            }
+            return True
+    
+    def reverify_all(self, model_id: Optional[str] = None, force: bool = False) -> Dict[str, Any]:
+        """
+        Verify stored proofs (audit job)
+        
+        Proofs with a stored result are skipped unless force=True.
+        """
+        if not (self.last_reverify and self.last_reverify.get("status") == "running"):
+            self.start_reverify(model_id)
+        
+        try:
+            proofs = db._read_file(db.proofs_file)
+            if model_id:
+                proofs = [p for p in proofs if p.get("model_id") == model_id]
+            
+            valid = 0
+            invalid = []
+            results = {}
+            verified = []
+            for proof in proofs:
+                is_valid, message, details = self.verify_proof(proof, force=force, persist=False)
+                if not details.get("cached"):
+                    entry = self._verification_cache.get(self.verification_key(proof))
+                    if entry:
+                        verified.append(entry)
+                if proof.get("job_id"):
+                    results[proof["job_id"]] = {
+                        "last_verification": {
+                            "is_valid": is_valid,
+                            "message": message,
+                            "verified_at": datetime.utcnow().isoformat() + "Z"
+                        }
+                    }
+                if is_valid:
+                    valid += 1
+                else:
+                    invalid.append({"job_id": proof.get("job_id"), "message": message})
+            
+            # One write per table for the whole run
+            db.update_proofs_by_job(results)
+            if verified:
+                db.save_verifications(verified)
+        except Exception as e:
+            print(f"[ERROR] Proof re-verification failed: {e}")
+            self.last_reverify = {
+                **self.last_reverify,
+                "status": "failed",
+                "error": str(e),
+                "completed_at": datetime.utcnow().isoformat() + "Z"
+            }
+            return self.last_reverify
+        
+        self.last_reverify = {
+            **self.last_reverify,
+            "status": "completed",
+            "model_id": model_id,
+            "checked": len(proofs),
+            "valid": valid,
+            "invalid": invalid,
+            "completed_at": datetime.utcnow().isoformat() + "Z"
+        }
+        return self.last_reverify
+    
+    def _verify_uncached(self, proof: Dict[str, Any]) -> Tuple[bool, str, Dict]:
         verification_details = {
             "verified_at": datetime.utcnow().isoformat() + "Z",
             "method": "hash_reconstruction"
@@ -289,6 +489,11 @@ class ZKProofGenerator:
         if not hash_matches:
             return False, "Proof hash reconstruction failed", verification_details
         
+        if proof.get("aggregation"):
+            is_valid, message, aggregate_details = proof_aggregator.verify_membership(proof)
+            verification_details["aggregation"] = aggregate_details
+            return is_valid, message, verification_details
+        
         on_chain = proof.get("on_chain", {})
         if on_chain.get("anchored") and self.blockchain.connected:
             on_chain_audit = self.blockchain.get_audit(job_id)
@@ -450,7 +655,7 @@ class InferenceEngine:
         Supports scikit-learn models like Iris classifier
         """
         try:
-            model = load_pkl_model(file_path)
+            model = load_pkl_model(file_path, (model_info or {}).get("content_hash"))
             if model is None:
                 return {
                     "error": "Failed to load model",
@@ -545,8 +750,8 @@ class InferenceEngine:
         Handles input reshaping for models like MNIST (1x1x28x28)
         """
         try:
-            # Create session
-            session = ort.InferenceSession(file_path)
+            # Sessions are cached per model content
+            session = get_onnx_session(file_path, (model_info or {}).get("content_hash"))
             input_name = session.get_inputs()[0].name
             input_shape = session.get_inputs()[0].shape
             
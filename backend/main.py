@@ -74,6 +74,15 @@ async def lifespan(app: FastAPI):
     print("[INFO] Initializing storage...")
     print("[SUCCESS] ZKML Simulator ready")
     
+    from app.services.pin_queue import pin_queue
+    pin_queue.start()
+    
+    from app.services.proof_aggregator import proof_aggregator
+    proof_aggregator.start()
+    
+    from app.services.shard_scheduler import shard_scheduler
+    shard_scheduler.start()
+    
     # Seed demo data for presentation
     # from app.core.database import db
     # from app.core.demo_data import seed_demo_data
@@ -83,6 +92,12 @@ async def lifespan(app: FastAPI):
     yield
     # Shutdown
     print("[STOPPING] V-Inference Backend shutting down...")
+    await pin_queue.stop()
+    await proof_aggregator.stop()
+    await shard_scheduler.stop()
+    
+    from app.services.proving_scheduler import proving_scheduler
+    proving_scheduler.shutdown()
 
 
 app = FastAPI(
@@ -188,6 +203,59 @@ async def get_platform_stats():
     }
 
 
+@app.get("/api/ipfs/pins")
+async def get_pin_status():
+    """Get IPFS pin queue and reconciler status"""
+    from app.services.pin_queue import pin_queue
+    
+    return pin_queue.get_status()
+
+
+@app.post("/api/ipfs/pins/reconcile")
+async def reconcile_pins(dry_run: bool = True):
+    """Compare pinned content against models/jobs and release orphans"""
+    from app.services.pin_queue import pin_queue
+    
+    return await pin_queue.reconcile(dry_run=dry_run)
+
+
+@app.get("/api/zkml/proving")
+async def get_proving_metrics():
+    """Get proving pool queue depth, in-flight jobs and proving-time histogram"""
+    from app.services.proving_scheduler import proving_scheduler
+    
+    return proving_scheduler.get_metrics()
+
+
+@app.get("/api/zkml/aggregates")
+async def get_aggregation_status():
+    """Get proof aggregation windows and sealed aggregate count"""
+    from app.services.proof_aggregator import proof_aggregator
+    
+    return proof_aggregator.get_status()
+
+
+@app.get("/api/zkml/aggregates/{aggregate_id}")
+async def get_aggregate(aggregate_id: str):
+    """Get a proof aggregate with its Merkle root, members and anchor"""
+    from fastapi import HTTPException
+    from app.core.database import db
+    
+    aggregate = db.get_aggregate(aggregate_id)
+    if not aggregate:
+        raise HTTPException(status_code=404, detail="Aggregate not found")
+    return aggregate
+
+
+@app.post("/api/zkml/aggregates/seal")
+async def seal_aggregates():
+    """Seal all open aggregation windows now"""
+    from app.services.proof_aggregator import proof_aggregator
+    
+    sealed = await proof_aggregator.seal_due(force=True)
+    return {"sealed": [a["id"] for a in sealed]}
+
+
 if __name__ == "__main__":
     import uvicorn
     parser = argparse.ArgumentParser(description="V-Inference Backend")
@@ -0,0 +1,67 @@
+"""
+V-Inference Backend - Dataset Header Tests
+Parsing OBDS headers and addressing shards by row range
+
+Run: python -m pytest test_dataset_format.py
+"""
+import io
+import json
+import struct
+
+import pytest
+
+from app.core.dataset_format import (
+    chunks_for_rows,
+    header_size,
+    is_dataset,
+    parse_header,
+    read_header,
+    row_byte_ranges,
+)
+
+HEADER = {
+    "version": 1,
+    "rows": 10,
+    "chunk_rows": 4,
+    "columns": [
+        {"name": "X", "dtype": "<f4", "shape": [3], "offset": 256, "nbytes": 120},
+        {"name": "y", "dtype": "<i8", "shape": [], "offset": 384, "nbytes": 80}
+    ],
+    "chunks": [
+        {"index": 0, "row_start": 0, "row_end": 4, "sha256": "a" * 64},
+        {"index": 1, "row_start": 4, "row_end": 8, "sha256": "b" * 64},
+        {"index": 2, "row_start": 8, "row_end": 10, "sha256": "c" * 64}
+    ],
+    "content_hash": "d" * 64
+}
+
+
+def _encode(header, version: int = 1) -> bytes:
+    body = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    return struct.pack("<4sBI", b"OBDS", version, len(body)) + body
+
+
+def test_header_round_trip():
+    data = _encode(HEADER)
+
+    assert is_dataset(data)
+    assert header_size(data[:9]) == len(data)
+    assert parse_header(data) == HEADER
+    assert read_header(io.BytesIO(data + b"\0" * 64)) == HEADER
+
+
+def test_rejects_bad_headers():
+    data = _encode(HEADER)
+    with pytest.raises(ValueError):
+        parse_header(b"NOPE" + data[4:])
+    with pytest.raises(ValueError):
+        parse_header(data[:-1])
+    with pytest.raises(ValueError):
+        parse_header(_encode(HEADER, version=2))
+
+
+def test_row_ranges_and_chunks():
+    assert row_byte_ranges(HEADER, 3, 7) == {"X": (256 + 3 * 12, 256 + 7 * 12), "y": (384 + 3 * 8, 384 + 7 * 8)}
+    assert [c["index"] for c in chunks_for_rows(HEADER, 3, 7)] == [0, 1]
+    assert [c["index"] for c in chunks_for_rows(HEADER, 4, 8)] == [1]
+    assert [c["index"] for c in chunks_for_rows(HEADER, 8, 10)] == [2]
@@ -0,0 +1,133 @@
+"""
+V-Inference Backend - Shard Scheduler Tests
+Lease, reap and completion transitions of the shard scheduler
+
+Run: python -m pytest test_shard_scheduler.py
+"""
+import asyncio
+import time
+
+import pytest
+
+
+@pytest.fixture
+def scheduler(tmp_path, monkeypatch):
+    # The global db writes to ./storage on import
+    monkeypatch.chdir(tmp_path)
+    from app.core.database import Database
+    from app.services import shard_scheduler as module
+
+    monkeypatch.setattr(module, "db", Database(storage_path=str(tmp_path / "storage")))
+    return module.ShardScheduler()
+
+
+def _job(scheduler, shards: int = 3, rows: int = 100) -> str:
+    from app.services import shard_scheduler as module
+
+    job = module.db.create_job({
+        "type": "training",
+        "status": "sharding",
+        "total_shards": shards,
+        "shards": [
+            {"shard_index": i, "status": "pending", "row_start": i * rows, "row_end": (i + 1) * rows}
+            for i in range(shards)
+        ]
+    })
+    scheduler.add_job(job)
+    return job["id"]
+
+
+def _shard(job_id: str, index: int):
+    from app.services import shard_scheduler as module
+
+    return module.db.get_job(job_id)["shards"][index]
+
+
+def _next(scheduler, worker_id: str):
+    return asyncio.run(scheduler.next_shard(worker_id, wait=0))
+
+
+def test_lease_marks_shard_processing(scheduler):
+    job_id = _job(scheduler)
+
+    lease = _next(scheduler, "w1")
+
+    assert lease["job_id"] == job_id
+    assert [s["shard_index"] for s in lease["shards"]] == [0]
+    assert _shard(job_id, 0)["status"] == "processing"
+    assert _shard(job_id, 0)["worker_id"] == "w1"
+    assert scheduler.may_submit(job_id, 0, "w1")
+    assert not scheduler.may_submit(job_id, 0, "w2")
+    assert scheduler.heartbeat(job_id, 0, "w1", progress=50)["renewed"]
+
+
+def test_claim_only_takes_pending_shards(scheduler):
+    job_id = _job(scheduler)
+
+    assert scheduler.claim(job_id, 1, "w1")["shard"]["shard_index"] == 1
+    assert scheduler.claim(job_id, 1, "w2") is None
+    # The claimed shard is skipped by the queue
+    assert [s["shard_index"] for s in _next(scheduler, "w2")["shards"]] == [0]
+    assert [s["shard_index"] for s in _next(scheduler, "w3")["shards"]] == [2]
+    assert _next(scheduler, "w4") is None
+
+
+def test_reap_requeues_expired_lease_at_the_front(scheduler):
+    job_id = _job(scheduler)
+    scheduler.lease_seconds = 0
+    _next(scheduler, "w1")
+    time.sleep(0.01)
+
+    assert scheduler.reap() == {"requeued": 1, "speculated": 0}
+    assert _shard(job_id, 0)["status"] == "pending"
+    assert _shard(job_id, 0)["worker_id"] is None
+    assert scheduler.heartbeat(job_id, 0, "w1")["cancelled"]
+
+    scheduler.lease_seconds = 60
+    assert [s["shard_index"] for s in _next(scheduler, "w2")["shards"]] == [0]
+    # The expired holder may still submit a late result
+    assert scheduler.may_submit(job_id, 0, "w1")
+
+
+def test_heartbeat_persists_checkpoint(scheduler):
+    job_id = _job(scheduler)
+    _next(scheduler, "w1")
+
+    scheduler.heartbeat(job_id, 0, "w1", progress=40, checkpoint_url="ipfs://ckpt")
+
+    checkpoint = _shard(job_id, 0)["checkpoint"]
+    assert checkpoint["url"] == "ipfs://ckpt"
+    assert checkpoint["worker_id"] == "w1"
+
+
+def test_complete_ends_the_lease_and_records_throughput(scheduler):
+    job_id = _job(scheduler, shards=2)
+    _next(scheduler, "w1")
+    _next(scheduler, "w2")
+
+    scheduler.complete(job_id, 0, "w1")
+
+    assert not scheduler.may_submit(job_id, 0, "w1")
+    assert scheduler.heartbeat(job_id, 0, "w1")["cancelled"]
+    assert scheduler.get_status()["active_leases"] == 1
+    assert "w1" in scheduler.get_status()["worker_throughput"]
+
+
+def test_straggler_is_copied_to_an_equally_fast_worker(scheduler):
+    job_id = _job(scheduler, shards=2)
+    _next(scheduler, "w1")
+    _next(scheduler, "w2")
+    scheduler.complete(job_id, 0, "w1")
+    # Shard 1 now runs far past the job's median shard time
+    time.sleep(0.05)
+
+    assert scheduler.reap() == {"requeued": 0, "speculated": 1}
+    copy = _next(scheduler, "w3")
+    assert copy["speculative"]
+    assert copy["shard"]["shard_index"] == 1
+    # The original owner keeps the shard in the jobs table
+    assert _shard(job_id, 1)["worker_id"] == "w2"
+
+    scheduler.complete(job_id, 1, "w3")
+    assert scheduler.heartbeat(job_id, 1, "w2")["cancelled"]
+    assert scheduler.get_status()["active_leases"] == 0
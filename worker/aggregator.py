@@ -5,10 +5,17 @@ import os
 import asyncio
 import requests
 import io
+import time
 from supabase import create_client, Client
 from dotenv import load_dotenv
 from datetime import datetime
 
+from fedavg import AggregationState, UpdateStack, stream_fedavg, make_base_loader, row_weight
+from buffered_aggregation import BufferedRound
+from tree_aggregation import (
+    AGGREGATION_FAN_OUT, plan_groups, delegate, resolve_delegations, delegated_ids, is_foldable
+)
+
 load_dotenv()
 
 # Configuration - SECURITY: Ensure these are set via environment variables
@@ -18,68 +25,190 @@ SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
 if not SUPABASE_URL or not SUPABASE_KEY:
     raise ValueError("Missing required environment variables: SUPABASE_URL and SUPABASE_KEY")
 
-async def aggregate_updates(supabase: Client, job_id: int) -> dict:
+# Per-job running sums and consumed update ids
+AGGREGATION_STATE_DIR = os.environ.get("AGGREGATION_STATE_DIR", ".aggregation_state")
+# A published job with no new updates for this long is marked finished
+AGGREGATION_SETTLE_SECONDS = float(os.environ.get("AGGREGATION_SETTLE_SECONDS", "300"))
+# fedavg (incremental) or a robust rule: median, trimmed_mean, krum
+AGGREGATION_STRATEGY = os.environ.get("AGGREGATION_STRATEGY", "fedavg")
+AGGREGATION_TRIM_RATIO = float(os.environ.get("AGGREGATION_TRIM_RATIO", "0.1"))
+AGGREGATION_BYZANTINE = os.environ.get("AGGREGATION_BYZANTINE")
+AGGREGATION_KRUM_SELECT = int(os.environ.get("AGGREGATION_KRUM_SELECT", "1"))
+# sync: aggregate completed jobs; buffered: FedBuff rounds while jobs run
+AGGREGATION_MODE = os.environ.get("AGGREGATION_MODE", "sync")
+
+async def aggregate_robust(updates: list, state: AggregationState) -> dict:
     """
-    Perform Federated Averaging (FedAvg) on worker updates.
-    Downloads model weights from all workers and averages them.
-    Returns the aggregated model state dict.
+    Aggregate all of a job's updates with a robust rule.
+    Robust rules need every update at once, so all are stacked into one
+    matrix and re-aggregated whenever new updates arrive.
     """
-    print(f"[*] Aggregating updates for Job {job_id}...")
-    
-    # 1. Fetch all updates for this job
+    pending = [(u['id'], u['update_url'], row_weight(u)) for u in updates if u.get('update_url')]
+    stack = UpdateStack(len(pending))
+    _, folded, failed = await stream_fedavg(pending, base_loader=make_base_loader(), running_sum=stack)
+
+    for update_id, error in failed:
+        print(f"    [!] Failed to process update {update_id}: {error}")
+
+    strategy = AGGREGATION_STRATEGY
+    byzantine = int(AGGREGATION_BYZANTINE) if AGGREGATION_BYZANTINE else None
+    if strategy == 'krum' and stack.count < 3:
+        # Krum needs at least 3 updates to score neighbours
+        strategy = 'median'
+    elif strategy == 'krum' and byzantine is not None and stack.count <= 2 * byzantine + 2:
+        # Too few updates to tolerate f Byzantine ones with Krum
+        print(f"    [!] Krum needs more than {2 * byzantine + 2} updates for f={byzantine}, using median")
+        strategy = 'median'
+
+    aggregated_state, metadata = stack.aggregate(
+        strategy,
+        trim_ratio=AGGREGATION_TRIM_RATIO,
+        byzantine=byzantine,
+        krum_select=AGGREGATION_KRUM_SELECT
+    )
+    state.consumed.update(folded)
+    if 'selected' in metadata:
+        print(f"    - Krum kept {len(metadata['selected'])} of {stack.count} updates (f={metadata['byzantine']})")
+    return aggregated_state
+
+def plan_tree(supabase: Client, state: AggregationState, all_updates: list) -> list:
+    """
+    Hierarchical mode: settle finished aggregation jobs, delegate new
+    batches and return the updates the root should fold itself.
+    """
+    settled = resolve_delegations(supabase, state, all_updates)
+    busy = delegated_ids(state)
+    pending = [
+        u for u in all_updates
+        if u.get('id') not in state.consumed and u.get('id') not in busy and is_foldable(u, state)
+    ]
+
+    groups, direct = plan_groups(pending, state)
+    for level, batch in groups:
+        delegate(supabase, state, level, batch)
+    if groups:
+        print(f"    - Delegated {len(groups)} batches to aggregation jobs "
+              f"({len(state.delegations)} in flight)")
+    if settled or groups:
+        state.save(include_sum=False)
+    return direct
+
+async def aggregate_updates(supabase: Client, job_id: int, state: AggregationState = None) -> dict:
+    """
+    Perform Federated Averaging (FedAvg) on worker updates, weighted by
+    each update's sample count.
+    Only updates not yet consumed by the job's aggregation state are
+    downloaded; each is folded into the persisted fp32 running sum, so
+    memory stays O(model size) and earlier updates are never re-read.
+    With a robust AGGREGATION_STRATEGY the job's updates are instead
+    stacked and aggregated together whenever new ones arrive.
+    With AGGREGATION_FAN_OUT set, large batches are delegated to
+    aggregation jobs and only their partial sums are folded here.
+    Returns the aggregated model state dict, or None if nothing changed.
+    """
+    state = state or AggregationState.load(job_id, AGGREGATION_STATE_DIR)
+
+    # 1. Fetch the job's updates and keep the ones not folded in yet
     updates_res = supabase.table('worker_updates').select("*").eq('job_id', job_id).execute()
-    updates = updates_res.data
-    
+    all_updates = updates_res.data or []
+    updates = [u for u in all_updates if u.get('id') not in state.consumed]
+
+    if AGGREGATION_FAN_OUT > 1 and AGGREGATION_STRATEGY == 'fedavg':
+        updates = plan_tree(supabase, state, all_updates)
+
     if not updates:
-        print("    - No updates found.")
         return None
 
-    print(f"    - Found {len(updates)} worker updates. Running FedAvg...")
+    print(f"[*] Aggregating {len(updates)} new updates for Job {job_id} "
+          f"({len(state.consumed)} already consumed, strategy={AGGREGATION_STRATEGY})...")
+
+    if AGGREGATION_STRATEGY != 'fedavg':
+        aggregated_state = await aggregate_robust(all_updates, state)
+        state.updated_at = time.time()
+        state.save(include_sum=False)
+        return aggregated_state
     
-    # 2. Download and aggregate model weights
-    aggregated_state = None
-    successful_updates = 0
+    # 2. Download, decode and fold with bounded concurrency
+    pending = [(u['id'], u['update_url'], row_weight(u)) for u in updates if u.get('update_url')]
+    running_sum, folded, failed = await stream_fedavg(
+        pending,
+        base_loader=make_base_loader(),
+        running_sum=state.running_sum
+    )
     
-    for update in updates:
-        update_url = update.get('update_url')
-        if not update_url:
-            continue
-            
-        try:
-            # Download model weights
-            response = requests.get(update_url, timeout=30)
-            response.raise_for_status()
-            
-            weights_buffer = io.BytesIO(response.content)
-            state_dict = torch.load(weights_buffer, map_location='cpu', weights_only=True)
-            
-            if aggregated_state is None:
-                # Initialize with first model's structure
-                aggregated_state = {k: v.clone().float() for k, v in state_dict.items()}
-            else:
-                # Add weights to running sum
-                for key in aggregated_state:
-                    if key in state_dict:
-                        aggregated_state[key] += state_dict[key].float()
-            
-            successful_updates += 1
-            print(f"    - Processed update from {update.get('worker_address', 'unknown')}")
-            
-        except Exception as e:
-            print(f"    [!] Failed to process update {update.get('id')}: {e}")
-            continue
+    for update_id, error in failed:
+        print(f"    [!] Failed to process update {update_id}: {error}")
     
-    if successful_updates == 0:
+    if not folded:
         print("    - No valid updates to aggregate")
         return None
+
+    state.consumed.update(folded)
+    state.updated_at = time.time()
+    state.save()
     
     # 3. Average the weights (FedAvg)
-    for key in aggregated_state:
-        aggregated_state[key] /= successful_updates
+    aggregated_state = running_sum.mean()
     
-    print(f"[+] Global Model Updated. Aggregated {successful_updates} updates.")
+    print(f"[+] Global Model Updated. Aggregated {running_sum.count} updates ({len(folded)} new).")
     return aggregated_state
 
+async def publish_global_version(supabase: Client, job_id: int, state_dict: dict, version: int) -> str:
+    """Save a buffered-mode global model and point the job (and its workers) at it."""
+    model_url = await save_global_model(supabase, job_id, state_dict)
+    if not model_url:
+        return None
+    try:
+        supabase.table('jobs').update({
+            'result_url': model_url,
+            'global_model_url': model_url,
+            'global_model_version': version
+        }).eq('id', job_id).execute()
+    except Exception:
+        # Schema without version columns
+        supabase.table('jobs').update({'result_url': model_url}).eq('id', job_id).execute()
+    return model_url
+
+async def aggregate_buffered(supabase: Client, job: dict, state: AggregationState) -> int:
+    """
+    Buffered (FedBuff) mode: fold new updates, publishing a global model
+    version every FEDBUFF_K of them, without waiting for the job to complete.
+    Returns the number of versions published.
+    """
+    job_id = job['id']
+
+    async def publish(model: dict, version: int) -> str:
+        return await publish_global_version(supabase, job_id, model, version)
+
+    buffered = BufferedRound(state, publish)
+    updates_res = supabase.table('worker_updates').select("*").eq('job_id', job_id).execute()
+    updates = [u for u in (updates_res.data or []) if u.get('id') not in state.consumed]
+
+    if updates:
+        print(f"[*] Buffering {len(updates)} new updates for Job {job_id} (v{state.global_version})...")
+        state.updated_at = time.time()
+        return await buffered.fold(updates)
+
+    # Job done and quiet: publish the partial buffer and drop it from the poll
+    if job.get('status') == 'completed' and time.time() - state.updated_at > AGGREGATION_SETTLE_SECONDS:
+        if state.running_sum.count:
+            await buffered.flush()
+        if not state.running_sum.count:
+            mark_job_aggregated(supabase, state)
+    return 0
+
+def mark_job_aggregated(supabase: Client, state: AggregationState):
+    """Mark a job finished locally and (best effort) in the jobs table."""
+    state.mark_finished()
+    try:
+        supabase.table('jobs').update({
+            'aggregation_status': 'finished'
+        }).eq('id', state.job_id).execute()
+    except Exception:
+        # Column is optional; the local state already drops the job from the poll
+        pass
+    print(f"[+] Job {state.job_id} aggregation finished ({state.published_count} updates)")
+
 async def save_global_model(supabase: Client, job_id: int, state_dict: dict) -> str:
     """Save the aggregated global model to storage."""
     try:
@@ -116,41 +245,73 @@ async def save_global_model(supabase: Client, job_id: int, state_dict: dict) ->
 async def main():
     print("--- OBLIVION: FEDERATED AGGREGATOR ---")
     supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    finished_jobs = set()
+    # This process is the only writer of the state files, so each job is
+    # read from disk only on first sight (or after an error)
+    states = {}
 
     while True:
         try:
-            # Poll for training jobs that are completed but not yet aggregated
-            # We look for jobs with multiple worker updates that haven't been processed
-            response = supabase.table('jobs').select("id, status, job_type").eq('status', 'completed').eq('job_type', 'training').execute()
-            jobs = response.data
+            # Poll for completed training jobs (running ones too in buffered
+            # mode); finished ones are skipped without touching their updates
+            query = supabase.table('jobs').select("id, status, job_type").eq('job_type', 'training')
+            if AGGREGATION_MODE == 'buffered':
+                query = query.in_('status', ['processing', 'completed'])
+            else:
+                query = query.eq('status', 'completed')
+            response = query.execute()
+            jobs = [job for job in (response.data or []) if job['id'] not in finished_jobs]
 
             if jobs:
                 for job in jobs:
                     job_id = job['id']
-                    
-                    # Check if we have multiple updates for this job
-                    updates_count = supabase.table('worker_updates').select("id", count='exact').eq('job_id', job_id).execute()
-                    
-                    if updates_count.count and updates_count.count > 1:
-                        # Aggregate the updates
-                        aggregated_state = await aggregate_updates(supabase, job_id)
-                        
-                        if aggregated_state:
-                            # Save the global model
-                            model_url = await save_global_model(supabase, job_id, aggregated_state)
-                            
-                            if model_url:
-                                # Update the job with the aggregated model URL
-                                supabase.table('jobs').update({
-                                    'result_url': model_url
-                                }).eq('id', job_id).execute()
-                                
-                                print(f"[+] Job {job_id} aggregation complete: {model_url}")
+                    state = states.get(job_id)
+                    if state is None:
+                        state = states[job_id] = AggregationState.load(job_id, AGGREGATION_STATE_DIR)
+
+                    if state.finished:
+                        finished_jobs.add(job_id)
+                        states.pop(job_id, None)
+                        continue
+
+                    if AGGREGATION_MODE == 'buffered':
+                        await aggregate_buffered(supabase, job, state)
+                        if state.finished:
+                            finished_jobs.add(job_id)
+                            states.pop(job_id, None)
+                        continue
+
+                    # Fold in only the updates that arrived since the last pass
+                    aggregated_state = await aggregate_updates(supabase, job_id, state)
+
+                    # Republish only when the sum changed and holds more than one update
+                    if aggregated_state is not None and state.dirty and len(state.consumed) > 1:
+                        model_url = await save_global_model(supabase, job_id, aggregated_state)
+
+                        if model_url:
+                            # Update the job with the aggregated model URL
+                            supabase.table('jobs').update({
+                                'result_url': model_url
+                            }).eq('id', job_id).execute()
+
+                            state.model_url = model_url
+                            state.published_count = len(state.consumed)
+                            state.save(include_sum=False)
+                            print(f"[+] Job {job_id} aggregation complete: {model_url}")
+
+                    elif (state.consumed and not state.delegations
+                          and (not state.dirty or len(state.consumed) <= 1)
+                          and time.time() - state.updated_at > AGGREGATION_SETTLE_SECONDS):
+                        mark_job_aggregated(supabase, state)
+                        finished_jobs.add(job_id)
+                        states.pop(job_id, None)
             else:
                 print(".", end="", flush=True)
             
         except Exception as e:
             print(f"\n[!] Aggregator Error: {e}")
+            # A pass cut short may leave a state ahead of its saved copy
+            states.clear()
             
         await asyncio.sleep(10)
 
@@ -0,0 +1,175 @@
+"""
+Buffered Asynchronous Aggregation for Oblivion
+FedBuff-style rounds: a new global model every K fresh updates.
+
+Workers train from whichever global model version they pulled and tag
+their update with it (base_url, base_version). The aggregator turns each
+update into a delta against that base, weights it by its sample count
+times a staleness factor 1 / sqrt(1 + tau), where tau is how many versions
+the global model has advanced since, and folds it into a buffer. Once K
+updates are buffered the global model moves by the buffer's weighted mean
+delta and its version is bumped. Slow workers therefore only reduce
+their own influence instead of holding up the round.
+"""
+
+import os
+import math
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import torch
+
+from fedavg import AggregationState, RunningSum, stream_fedavg, make_base_loader, row_weight
+
+FEDBUFF_K = int(os.environ.get("FEDBUFF_K", "10"))
+FEDBUFF_SERVER_LR = float(os.environ.get("FEDBUFF_SERVER_LR", "1.0"))
+# Updates more than this many versions behind are dropped
+FEDBUFF_MAX_STALENESS = int(os.environ.get("FEDBUFF_MAX_STALENESS", "20"))
+
+
+def staleness_weight(staleness: int) -> float:
+    """Polynomial staleness discount 1 / sqrt(1 + tau)."""
+    return 1.0 / math.sqrt(1.0 + max(0, staleness))
+
+
+def apply_delta(
+    global_state: Dict[str, torch.Tensor],
+    mean_delta: Dict[str, torch.Tensor],
+    server_lr: float = FEDBUFF_SERVER_LR
+) -> Dict[str, torch.Tensor]:
+    """New global model: global + server_lr * mean delta (dtypes preserved)."""
+    new_state = {}
+    for name, tensor in global_state.items():
+        delta = mean_delta.get(name)
+        if delta is None:
+            new_state[name] = tensor
+            continue
+        new_state[name] = (tensor.float() + server_lr * delta).to(tensor.dtype)
+    return new_state
+
+
+class BufferedRound:
+    """
+    Folds a job's updates into the FedBuff buffer and advances the version.
+
+    The buffer is the job's AggregationState.running_sum (so it survives
+    restarts); the current global model is reloaded from state.model_url.
+    """
+
+    def __init__(
+        self,
+        state: AggregationState,
+        publish: Callable[[Dict[str, torch.Tensor], int], Awaitable[Optional[str]]],
+        k: int = FEDBUFF_K
+    ):
+        """
+        Args:
+            state: Job aggregation state
+            publish: Async callback (model, version) -> model URL
+            k: Updates per global model version
+        """
+        self.state = state
+        self.publish = publish
+        self.k = max(1, k)
+        self.base_loader = make_base_loader()
+        self._global: Optional[Dict[str, torch.Tensor]] = None
+
+    @property
+    def global_model(self) -> Optional[Dict[str, torch.Tensor]]:
+        if self._global is None and self.state.model_url:
+            self._global = self.base_loader(self.state.model_url)
+        return self._global
+
+    def _prepare(self, header: Dict[str, Any], update: Dict[str, torch.Tensor], weight: float) -> Optional[Tuple[Dict, float]]:
+        """Delta against the update's base model, discounted by staleness."""
+        current = self.global_model
+        if current is None:
+            # Bootstrap: no global model yet, buffer full models
+            return update, weight
+
+        base_version = header.get('base_version')
+        if base_version is None or not header.get('base_url'):
+            base_version, base = self.state.global_version, current
+        else:
+            base = self.base_loader(header['base_url'])
+
+        staleness = self.state.global_version - int(base_version)
+        if staleness > FEDBUFF_MAX_STALENESS:
+            print(f"    [!] Dropping update {staleness} versions behind")
+            return None
+
+        delta = {
+            name: value.float() - base[name].float()
+            for name, value in update.items() if name in base
+        }
+        return delta, weight * staleness_weight(staleness)
+
+    async def _advance(self) -> bool:
+        buffer = self.state.running_sum
+        mean = buffer.mean()
+        if mean is None:
+            return False
+
+        current = self.global_model
+        new_model = mean if current is None else apply_delta(current, mean)
+        version = self.state.global_version + 1
+        model_url = await self.publish(new_model, version)
+        if not model_url:
+            return False
+
+        self.state.global_version = version
+        self.state.model_url = model_url
+        self.state.published_count = len(self.state.consumed)
+        self.state.running_sum = RunningSum()
+        self._global = new_model
+        self.state.save()
+        print(f"[+] Global model v{version} published from {buffer.count} buffered updates")
+        return True
+
+    async def fold(self, updates: List[Dict[str, Any]]) -> int:
+        """
+        Buffer new updates, publishing a version each time K accumulate.
+
+        Args:
+            updates: Unconsumed worker_updates rows
+
+        Returns:
+            Number of versions published
+        """
+        pending = [(u['id'], u['update_url'], row_weight(u)) for u in updates if u.get('update_url')]
+        published = 0
+
+        while pending:
+            take = self.k - self.state.running_sum.count
+            if take <= 0:
+                # Still full after a failed publish; stop if it fails again
+                if not await self._advance():
+                    break
+                published += 1
+                continue
+            batch, pending = pending[:take], pending[take:]
+            _, folded, failed = await stream_fedavg(
+                batch,
+                base_loader=self.base_loader,
+                running_sum=self.state.running_sum,
+                prepare=self._prepare
+            )
+            for update_id, error in failed:
+                print(f"    [!] Failed to process update {update_id}: {error}")
+            self.state.consumed.update(folded)
+            self.state.save()
+
+            if self.state.running_sum.count >= self.k and await self._advance():
+                published += 1
+        return published
+
+    async def flush(self) -> bool:
+        """Publish whatever is buffered (end of the job)."""
+        return await self._advance()
+
+
+__all__ = [
+    'BufferedRound',
+    'staleness_weight',
+    'apply_delta',
+    'FEDBUFF_K'
+]
@@ -0,0 +1,203 @@
+"""
+Canonical Binary Encoding for Oblivion
+Deterministic, type-tagged serialization used for hashing proofs, inputs
+and model updates.
+
+Every node produces the same bytes for the same value: dict keys are
+sorted, integers and floats are fixed-width little-endian, and NumPy /
+torch arrays are written as dtype + shape + raw little-endian buffer.
+Values are streamed straight into the hasher, so large tensors are hashed
+at memory bandwidth without building an intermediate JSON string.
+
+The backend imports this file (backend/app/core/canonical.py re-exports
+it), so there is a single implementation of the format.
+"""
+
+import struct
+import hashlib
+from typing import Any, Callable
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+try:
+    import torch
+    TORCH_AVAILABLE = True
+except ImportError:
+    torch = None
+    TORCH_AVAILABLE = False
+
+FORMAT_VERSION = b"OBLV-C1"
+
+_INT64_MIN = -(1 << 63)
+_INT64_MAX = (1 << 63) - 1
+
+_pack_u32 = struct.Struct("<I").pack
+_pack_i64 = struct.Struct("<q").pack
+_pack_f64 = struct.Struct("<d").pack
+
+
+def _encode_str(write: Callable[[bytes], Any], value: str, tag: bytes = b"s"):
+    data = value.encode("utf-8")
+    write(tag + _pack_u32(len(data)))
+    write(data)
+
+
+def _encode_array(write: Callable[[bytes], Any], array):
+    """Write dtype, shape and the raw little-endian C-order buffer."""
+    if array.dtype.hasobject:
+        _encode_sequence(write, array.tolist())
+        return
+    array = np.ascontiguousarray(array)
+    if array.dtype.byteorder == ">" or (array.dtype.byteorder == "=" and not np.little_endian):
+        array = array.astype(array.dtype.newbyteorder("<"))
+    _encode_str(write, array.dtype.str.replace("|", "<").replace("=", "<"), tag=b"A")
+    write(_pack_u32(array.ndim))
+    for dim in array.shape:
+        write(_pack_i64(dim))
+    write(_pack_i64(array.nbytes))
+    write(memoryview(array).cast("B"))
+
+
+def _encode_tensor(write: Callable[[bytes], Any], tensor):
+    tensor = tensor.detach().cpu().contiguous()
+    if tensor.dtype == torch.bfloat16:
+        # No NumPy bfloat16; hash the raw 16-bit payload under its own tag
+        _encode_str(write, "bf16", tag=b"A")
+        write(_pack_u32(tensor.dim()))
+        for dim in tensor.shape:
+            write(_pack_i64(dim))
+        raw = tensor.view(torch.int16).numpy().astype("<i2", copy=False)
+        write(_pack_i64(raw.nbytes))
+        write(memoryview(raw).cast("B"))
+        return
+    _encode_array(write, tensor.numpy())
+
+
+def _encode(write: Callable[[bytes], Any], value: Any):
+    if value is None:
+        write(b"N")
+    elif value is True:
+        write(b"T")
+    elif value is False:
+        write(b"F")
+    elif isinstance(value, int):
+        if _INT64_MIN <= value <= _INT64_MAX:
+            write(b"i" + _pack_i64(value))
+        else:
+            data = value.to_bytes((value.bit_length() + 8) // 8, "little", signed=True)
+            write(b"I" + _pack_u32(len(data)))
+            write(data)
+    elif isinstance(value, float):
+        write(b"d" + _pack_f64(value))
+    elif isinstance(value, str):
+        _encode_str(write, value)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        data = bytes(value)
+        write(b"b" + _pack_u32(len(data)))
+        write(data)
+    elif isinstance(value, dict):
+        items = []
+        for key, item in value.items():
+            chunks = []
+            _encode(chunks.append, key)
+            items.append((b"".join(chunks), item))
+        items.sort(key=lambda pair: pair[0])
+        write(b"m" + _pack_u32(len(items)))
+        for key_bytes, item in items:
+            write(key_bytes)
+            _encode(write, item)
+    elif isinstance(value, (list, tuple)):
+        _encode_sequence(write, value)
+    elif TORCH_AVAILABLE and isinstance(value, torch.Tensor):
+        _encode_tensor(write, value)
+    elif NUMPY_AVAILABLE and isinstance(value, np.ndarray):
+        _encode_array(write, value)
+    elif NUMPY_AVAILABLE and isinstance(value, np.generic):
+        _encode(write, value.item())
+    else:
+        _encode_str(write, str(value), tag=b"r")
+
+
+def _encode_sequence(write: Callable[[bytes], Any], values):
+    """
+    Homogeneous int or float lists are packed as one little-endian array,
+    so a 784-feature input is a single buffer rather than 784 tagged items.
+    """
+    if values and NUMPY_AVAILABLE:
+        first = type(values[0])
+        if first is float and all(type(v) is float for v in values):
+            _encode_array(write, np.asarray(values, dtype="<f8"))
+            return
+        if first is int and all(type(v) is int for v in values):
+            try:
+                _encode_array(write, np.asarray(values, dtype="<i8"))
+                return
+            except OverflowError:
+                pass
+    elif values:
+        first = type(values[0])
+        if first is float and all(type(v) is float for v in values):
+            _encode_str(write, "<f8", tag=b"A")
+            write(_pack_u32(1) + _pack_i64(len(values)) + _pack_i64(8 * len(values)))
+            write(struct.pack(f"<{len(values)}d", *values))
+            return
+        if first is int and all(type(v) is int and _INT64_MIN <= v <= _INT64_MAX for v in values):
+            _encode_str(write, "<i8", tag=b"A")
+            write(_pack_u32(1) + _pack_i64(len(values)) + _pack_i64(8 * len(values)))
+            write(struct.pack(f"<{len(values)}q", *values))
+            return
+
+    write(b"l" + _pack_u32(len(values)))
+    for item in values:
+        _encode(write, item)
+
+
+def encode(value: Any) -> bytes:
+    """
+    Canonical binary encoding of a value.
+
+    Args:
+        value: JSON-like data, NumPy arrays or torch tensors
+
+    Returns:
+        Encoded bytes
+    """
+    chunks = [FORMAT_VERSION]
+    _encode(chunks.append, value)
+    return b"".join(chunks)
+
+
+def hash_into(hasher, value: Any):
+    """
+    Stream the canonical encoding of a value into a hashlib object.
+
+    Args:
+        hasher: Object with an update(bytes) method
+        value: Value to encode
+    """
+    hasher.update(FORMAT_VERSION)
+    _encode(hasher.update, value)
+
+
+def canonical_hash(value: Any, algorithm: str = "sha256") -> str:
+    """
+    Hex digest of the canonical encoding of a value.
+
+    Args:
+        value: Value to hash
+        algorithm: hashlib algorithm name
+
+    Returns:
+        Hex digest string (no 0x prefix)
+    """
+    hasher = hashlib.new(algorithm)
+    hash_into(hasher, value)
+    return hasher.hexdigest()
+
+
+__all__ = ['encode', 'hash_into', 'canonical_hash', 'FORMAT_VERSION']
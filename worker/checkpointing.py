@@ -0,0 +1,369 @@
+"""
+Training Checkpoints for Oblivion
+Periodic, resumable snapshots of a shard's training state.
+
+A checkpoint holds the model and optimizer state, the Python, NumPy and
+torch RNG states (plus any extra generators such as the loader's shuffle
+generator) and the run's privacy state, and is keyed by shard id. Each
+snapshot is copied to CPU on the training thread; a background thread
+writes it to local disk and publishes it to the blob store, so training
+never waits on I/O. A snapshot taken while the previous one is still
+being written replaces it instead of queueing behind it. Only the newest
+published checkpoint is kept: the one it supersedes is deleted from the
+blob store, and so is the last one once the shard's result is accepted.
+
+A worker resuming a shard prefers its own local checkpoint and otherwise
+downloads the one the scheduler recorded for the shard. Checkpoints are
+loaded with weights_only=True, so a checkpoint published by another
+worker cannot run code.
+"""
+
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from urllib.parse import unquote, urlparse
+
+import numpy as np
+import requests
+import torch
+
+CHECKPOINT_DIR = Path(os.environ.get("CHECKPOINT_DIR", "./work/checkpoints"))
+# Minimum seconds between checkpoints of one shard
+CHECKPOINT_INTERVAL_SECONDS = float(os.environ.get("CHECKPOINT_INTERVAL_SECONDS", "30"))
+CHECKPOINT_VERSION = 1
+
+# Background job that publishes a file written by someone else (e.g. a sandbox)
+_PUBLISH_FILE = object()
+
+
+def to_cpu(obj: Any) -> Any:
+    """Detached CPU copy of every tensor in a (nested) state dict."""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return {key: to_cpu(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(to_cpu(value) for value in obj)
+    return obj
+
+
+def capture_rng_state(generators: Optional[Dict[str, torch.Generator]] = None) -> Dict[str, Any]:
+    """
+    Snapshot of the global RNGs and of named generators.
+
+    The NumPy key is stored as a tensor so the state loads with
+    weights_only=True.
+    """
+    name, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    state = {
+        'python': random.getstate(),
+        'numpy': (name, torch.from_numpy(keys.astype(np.int64)), pos, has_gauss, cached_gaussian),
+        'torch': torch.get_rng_state(),
+        'generators': {key: g.get_state() for key, g in (generators or {}).items()}
+    }
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def restore_rng_state(state: Dict[str, Any], generators: Optional[Dict[str, torch.Generator]] = None):
+    """Restore a capture_rng_state() snapshot."""
+    random.setstate(state['python'])
+    name, keys, pos, has_gauss, cached_gaussian = state['numpy']
+    np.random.set_state((name, keys.numpy().astype(np.uint32), pos, has_gauss, cached_gaussian))
+    torch.set_rng_state(state['torch'])
+    if 'cuda' in state and torch.cuda.is_available() and len(state['cuda']) == torch.cuda.device_count():
+        torch.cuda.set_rng_state_all(state['cuda'])
+    for key, g in (generators or {}).items():
+        if key in state.get('generators', {}):
+            g.set_state(state['generators'][key])
+
+
+class Checkpointer:
+    """
+    Saves, publishes and restores the checkpoints of one shard.
+
+    Usage:
+        checkpointer = Checkpointer(shard_id, publish=pin, fetch=download, remote=shard.get("checkpoint"))
+        state = checkpointer.load()          # newest checkpoint or None
+        ... checkpointer.maybe_save(lambda: {...}) after every epoch ...
+        checkpointer.close()
+        checkpointer.discard()               # once the result is accepted
+    """
+
+    def __init__(
+        self,
+        key: str,
+        publish: Optional[Callable[[str], Optional[str]]] = None,
+        fetch: Optional[Callable[[str], Optional[bytes]]] = None,
+        remote: Optional[Dict[str, Any]] = None,
+        worker_id: Optional[str] = None,
+        on_published: Optional[Callable[[str], None]] = None,
+        unpublish: Optional[Callable[[str], Any]] = None,
+        interval: float = CHECKPOINT_INTERVAL_SECONDS,
+        directory: Path = CHECKPOINT_DIR
+    ):
+        """
+        Args:
+            key: Shard id the checkpoints belong to
+            publish: Uploads a checkpoint file, returning its URL (or None)
+            fetch: Downloads a published checkpoint by URL
+            remote: Latest published checkpoint ({"url", "saved_at", "worker_id"}), if any
+            worker_id: This worker; its own published checkpoints are read locally
+            on_published: Called with the URL of every published checkpoint
+            unpublish: Deletes a published checkpoint by URL once it is superseded
+                or the shard's result was accepted
+            interval: Minimum seconds between maybe_save() snapshots
+            directory: Local checkpoint directory
+        """
+        self.key = key
+        self.publish = publish
+        self.fetch = fetch
+        self.remote = remote or {}
+        self.worker_id = worker_id
+        self.on_published = on_published
+        self.unpublish = unpublish
+        self.interval = interval
+        self.path = Path(directory) / f"{re.sub(r'[^A-Za-z0-9_.-]', '_', key)}.pt"
+        self.published_url: Optional[str] = self.remote.get('url')
+        self.saves = 0
+        self._last_save = time.time()
+        self._next: Any = None
+        self._writing = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    # ============ Restore ============
+
+    def restore(self) -> Optional[Path]:
+        """
+        Make the local checkpoint file the newest one available.
+
+        The local file wins unless the scheduler recorded a checkpoint
+        that another worker published after it was written.
+
+        Returns:
+            Path of the checkpoint file, or None if there is none
+        """
+        remote_url = self.remote.get('url')
+        remote_saved_at = self.remote.get('saved_at') or 0
+        if self.path.exists() and (
+            not remote_url
+            or self.remote.get('worker_id') == self.worker_id
+            or self.path.stat().st_mtime >= remote_saved_at
+        ):
+            return self.path
+        if not remote_url or self.fetch is None:
+            return None
+        try:
+            data = self.fetch(remote_url)
+        except Exception as e:
+            print(f"    [!] Could not download checkpoint {remote_url}: {e}")
+            data = None
+        if not data:
+            return self.path if self.path.exists() else None
+        self._write_atomic(lambda f: f.write(data))
+        print(f"    [*] Downloaded checkpoint of {self.key} ({len(data) / 1024:.0f} KB)")
+        return self.path
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """Newest checkpoint state of this shard, or None."""
+        path = self.restore()
+        if path is None:
+            return None
+        try:
+            state = torch.load(path, map_location='cpu', weights_only=True)
+        except Exception as e:
+            print(f"    [!] Ignoring unreadable checkpoint {path}: {e}")
+            return None
+        if not isinstance(state, dict) or state.get('key') != self.key or state.get('version') != CHECKPOINT_VERSION:
+            print(f"    [!] Ignoring checkpoint {path}: not a checkpoint of {self.key}")
+            return None
+        return state
+
+    # ============ Save ============
+
+    def maybe_save(self, snapshot: Callable[[], Dict[str, Any]]) -> bool:
+        """
+        Save snapshot() if the interval has passed and no write is running.
+
+        Returns:
+            True if a snapshot was taken
+        """
+        if time.time() - self._last_save < self.interval or self._writing:
+            return False
+        self.save(snapshot())
+        return True
+
+    def save(self, state: Dict[str, Any]):
+        """Queue a state for writing; tensors are copied to CPU first."""
+        state = {**to_cpu(state), 'key': self.key, 'version': CHECKPOINT_VERSION, 'saved_at': time.time()}
+        self._last_save = time.time()
+        self._submit(state)
+
+    @contextmanager
+    def watch(self, poll_seconds: float = 5.0) -> Iterator[Path]:
+        """
+        Publish the checkpoints another process (e.g. a sandbox) writes.
+
+        Yields the local path. The writer only reads that path and saves
+        its n-th checkpoint to '<path>.<n>'; it never renames or deletes
+        files. A saved file is complete once the next one appears (or,
+        for the last one, once the writer has exited and the file loads),
+        and is then moved into place here and published.
+        """
+        stop = threading.Event()
+
+        def promote(final: bool = False):
+            staged = self._staged()
+            complete = staged if final else staged[:-1]
+            if final and staged and not self._readable(staged[-1]):
+                # The writer was stopped while saving
+                staged[-1].unlink()
+                complete = staged[:-1]
+            if not complete:
+                return
+            os.replace(complete[-1], self.path)
+            for older in complete[:-1]:
+                older.unlink(missing_ok=True)
+            self._submit(_PUBLISH_FILE)
+
+        def run():
+            while not stop.wait(poll_seconds):
+                promote()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        for stale in self._staged():
+            stale.unlink()
+        watcher = threading.Thread(target=run, daemon=True)
+        watcher.start()
+        try:
+            yield self.path
+        finally:
+            stop.set()
+            watcher.join(timeout=poll_seconds)
+            promote(final=True)
+
+    def _staged(self) -> List[Path]:
+        """Files written by a watched process, oldest first"""
+        prefix = self.path.name + '.'
+        staged = [
+            p for p in self.path.parent.glob(prefix + '*')
+            if p.name[len(prefix):].isdigit()
+        ]
+        return sorted(staged, key=lambda p: int(p.name[len(prefix):]))
+
+    @staticmethod
+    def _readable(path: Path) -> bool:
+        try:
+            torch.load(path, map_location='cpu', weights_only=True)
+            return True
+        except Exception:
+            return False
+
+    def _submit(self, job: Any):
+        with self._cond:
+            self._next = job
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._next is None and not self._closed:
+                    self._cond.wait()
+                if self._next is None:
+                    return
+                job, self._next = self._next, None
+                self._writing = True
+            try:
+                if job is not _PUBLISH_FILE:
+                    self._write_atomic(lambda f: torch.save(job, f))
+                    self.saves += 1
+                self._publish()
+            except Exception as e:
+                print(f"    [!] Checkpoint of {self.key} failed: {e}")
+            finally:
+                with self._cond:
+                    self._writing = False
+                    self._cond.notify_all()
+
+    def _write_atomic(self, write: Callable[[Any], Any]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix('.tmp')
+        with open(tmp, 'wb') as f:
+            write(f)
+        os.replace(tmp, self.path)
+
+    def _publish(self):
+        if self.publish is None:
+            return
+        url = self.publish(str(self.path))
+        if url:
+            previous, self.published_url = self.published_url, url
+            if self.on_published is not None:
+                self.on_published(url)
+            if previous and previous != url:
+                self._unpublish(previous)
+
+    def _unpublish(self, url: str):
+        if self.unpublish is None:
+            return
+        try:
+            self.unpublish(url)
+        except Exception as e:
+            print(f"    [!] Could not delete checkpoint {url}: {e}")
+
+    # ============ Lifecycle ============
+
+    def close(self):
+        """Finish any pending write and stop the background thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def discard(self):
+        """Delete the local and published checkpoint (the shard's result was accepted)."""
+        with self._cond:
+            # Nothing left to resume, so a queued snapshot need not be written
+            self._next = None
+        self.close()
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+        if self.published_url:
+            self._unpublish(self.published_url)
+            self.published_url = None
+
+
+def fetch_checkpoint_url(url: str) -> Optional[bytes]:
+    """Download an http(s) or file:// checkpoint URL."""
+    if url.startswith("file://"):
+        path = Path(unquote(urlparse(url).path))
+        return path.read_bytes() if path.exists() else None
+    response = requests.get(url, timeout=60)
+    response.raise_for_status()
+    return response.content
+
+
+__all__ = [
+    'Checkpointer',
+    'capture_rng_state',
+    'restore_rng_state',
+    'to_cpu',
+    'fetch_checkpoint_url',
+    'CHECKPOINT_DIR',
+    'CHECKPOINT_INTERVAL_SECONDS'
+]
@@ -0,0 +1,377 @@
+"""
+EZKL Circuit Registry for Oblivion
+Persistent cache of compiled circuits and keys keyed by model content.
+
+Shared by the worker (zk_proofs) and the backend (which loads this file
+from the worker directory), so both sides build, lay out and verify
+circuits the same way.
+
+A circuit is identified by the SHA-256 of its ONNX file plus the run args
+used to build it (and the EZKL version), so setup runs once per distinct
+model and the artifacts survive restarts. Builds run in a temp directory
+under a lock file and are moved into place, so concurrent processes on
+the same registry build each key only once.
+
+Layout:
+    <registry>/<key>/settings.json, network.compiled, pk.key, vk.key, manifest.json
+    <registry>/srs/kzg<logrows>.srs   (shared by every circuit of that size)
+    <registry>/index.json             (model_id -> key)
+"""
+
+import os
+import json
+import time
+import shutil
+import asyncio
+import hashlib
+import inspect
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Set, Union
+
+try:
+    import ezkl
+    EZKL_AVAILABLE = True
+except ImportError:
+    ezkl = None
+    EZKL_AVAILABLE = False
+
+# A lock older than this is assumed to belong to a crashed build
+CIRCUIT_LOCK_STALE_SECONDS = float(os.environ.get("CIRCUIT_LOCK_STALE_SECONDS", "3600"))
+CIRCUIT_LOCK_POLL_SECONDS = 1.0
+
+# Artifacts covered by the manifest checksums
+CIRCUIT_ARTIFACTS = ("settings.json", "network.compiled", "pk.key", "vk.key")
+
+PathLike = Union[str, Path]
+
+
+async def _resolve(result):
+    """EZKL exposes some calls as coroutines and some as plain functions."""
+    if inspect.isawaitable(result):
+        return await result
+    return result
+
+
+def sha256_file(path: PathLike) -> str:
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class CircuitRegistry:
+    """
+    Content-addressed store of EZKL circuit artifacts.
+
+    Features:
+    - Key = sha256(onnx bytes) + canonical run args + EZKL version
+    - Builds happen in a temp dir and are moved into place atomically
+    - Cross-process lock file so concurrent callers build a key only once
+    - Shared SRS per logrows
+    - Manifest checksums, verified lazily once per process
+    """
+
+    def __init__(
+        self,
+        root: PathLike,
+        default_run_args: Dict[str, Any],
+        hash_file: Callable[[str], Optional[str]] = sha256_file,
+        lock_stale_seconds: float = CIRCUIT_LOCK_STALE_SECONDS
+    ):
+        """
+        Args:
+            root: Registry directory (shared storage to reuse keys across hosts)
+            default_run_args: Run args when ensure() is given none; a
+                calibration_target entry runs calibrate_settings, every other
+                entry is set on PyRunArgs
+            hash_file: ONNX hash function (e.g. a memoized one)
+            lock_stale_seconds: Age after which a build lock is broken
+        """
+        self.root = Path(root)
+        self.srs_root = self.root / "srs"
+        self.srs_root.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.root / "index.json"
+        self.default_run_args = default_run_args
+        self.hash_file = hash_file
+        self.lock_stale_seconds = lock_stale_seconds
+        self._verified: Set[str] = set()
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    # ============ Keys & lookup ============
+
+    def circuit_key(self, onnx_path: PathLike, run_args: Optional[Dict[str, Any]] = None) -> str:
+        onnx_hash = self.hash_file(str(onnx_path))
+        if onnx_hash is None:
+            raise FileNotFoundError(f"ONNX model not found: {onnx_path}")
+        material = json.dumps({
+            'onnx': onnx_hash,
+            'run_args': run_args or self.default_run_args,
+            'ezkl': getattr(ezkl, '__version__', 'unknown') if EZKL_AVAILABLE else None
+        }, sort_keys=True)
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def circuit_dir(self, key: str) -> Path:
+        return self.root / key
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Artifact paths for a built circuit, or None if absent/corrupt."""
+        circuit_dir = self.circuit_dir(key)
+        manifest_path = circuit_dir / "manifest.json"
+        if not manifest_path.exists():
+            return None
+
+        try:
+            with open(manifest_path, 'r') as f:
+                manifest = json.load(f)
+        except (json.JSONDecodeError, OSError):
+            return None
+
+        if key not in self._verified:
+            if not self._verify(circuit_dir, manifest):
+                print(f"[!] Circuit {key[:12]} failed integrity check, discarding")
+                shutil.rmtree(circuit_dir, ignore_errors=True)
+                return None
+            self._verified.add(key)
+
+        return self._paths(key, manifest)
+
+    def get_for_model(self, model_id: str) -> Optional[Dict[str, Any]]:
+        key = self._load_index().get(model_id)
+        return self.get(key) if key else None
+
+    def discard(self, key: str):
+        """Remove a built circuit so the next ensure() rebuilds it."""
+        self._verified.discard(key)
+        shutil.rmtree(self.circuit_dir(key), ignore_errors=True)
+
+    def _paths(self, key: str, manifest: Dict[str, Any]) -> Dict[str, Any]:
+        circuit_dir = self.circuit_dir(key)
+        return {
+            'key': key,
+            'settings_path': str(circuit_dir / "settings.json"),
+            'compiled_path': str(circuit_dir / "network.compiled"),
+            'pk_path': str(circuit_dir / "pk.key"),
+            'vk_path': str(circuit_dir / "vk.key"),
+            'srs_path': str(self.srs_path(manifest['logrows'])),
+            'vk_hash': manifest['artifacts']['vk.key'],
+            'logrows': manifest['logrows']
+        }
+
+    def _verify(self, circuit_dir: Path, manifest: Dict[str, Any]) -> bool:
+        for name in CIRCUIT_ARTIFACTS:
+            expected = manifest.get('artifacts', {}).get(name)
+            path = circuit_dir / name
+            if not expected or not path.exists() or sha256_file(path) != expected:
+                return False
+
+        srs_path = self.srs_path(manifest['logrows'])
+        expected_srs = manifest.get('srs_sha256')
+        if not srs_path.exists():
+            return False
+        if expected_srs and self._srs_hash(srs_path) != expected_srs:
+            return False
+        return True
+
+    # ============ Index ============
+
+    def _load_index(self) -> Dict[str, str]:
+        if not self.index_path.exists():
+            return {}
+        try:
+            with open(self.index_path, 'r') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError):
+            return {}
+
+    def _link_model(self, model_id: str, key: str):
+        index = self._load_index()
+        if index.get(model_id) == key:
+            return
+        index[model_id] = key
+        tmp_path = self.index_path.with_suffix(".json.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    # ============ SRS ============
+
+    def srs_path(self, logrows: int) -> Path:
+        return self.srs_root / f"kzg{logrows}.srs"
+
+    def _srs_hash(self, srs_path: Path) -> str:
+        sidecar = srs_path.with_suffix(".srs.sha256")
+        if sidecar.exists():
+            return sidecar.read_text().strip()
+        digest = sha256_file(srs_path)
+        sidecar.write_text(digest)
+        return digest
+
+    async def _ensure_srs(self, settings_path: str, logrows: int) -> Path:
+        srs_path = self.srs_path(logrows)
+        if srs_path.exists():
+            return srs_path
+
+        async with self._file_lock(f"srs-{logrows}"):
+            if not srs_path.exists():
+                tmp_path = srs_path.with_suffix(".srs.part")
+                await _resolve(ezkl.get_srs(settings_path, srs_path=str(tmp_path)))
+                os.replace(tmp_path, srs_path)
+                self._srs_hash(srs_path)
+        return srs_path
+
+    # ============ Build ============
+
+    async def ensure(
+        self,
+        onnx_path: PathLike,
+        run_args: Optional[Dict[str, Any]] = None,
+        model_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Get the circuit for a model, building it on first use.
+
+        Args:
+            onnx_path: Exported ONNX model
+            run_args: EZKL run args (default_run_args if None)
+            model_id: Model to link to the circuit in the index
+
+        Returns:
+            Dict with artifact paths, key, vk_hash, logrows and cached flag
+        """
+        run_args = run_args or self.default_run_args
+        key = self.circuit_key(onnx_path, run_args)
+
+        circuit = self.get(key)
+        if circuit is None:
+            lock = self._locks.setdefault(key, asyncio.Lock())
+            async with lock:
+                circuit = self.get(key)
+                if circuit is None:
+                    async with self._file_lock(key):
+                        circuit = self.get(key)
+                        if circuit is None:
+                            circuit = await self._build(key, str(onnx_path), run_args)
+                            circuit['cached'] = False
+
+        circuit.setdefault('cached', True)
+        if model_id:
+            self._link_model(model_id, key)
+        return circuit
+
+    async def _build(self, key: str, onnx_path: str, run_args: Dict[str, Any]) -> Dict[str, Any]:
+        print(f"[*] Building ZK circuit {key[:12]}...")
+        build_dir = Path(tempfile.mkdtemp(dir=self.root, prefix=f".build-{key[:12]}-"))
+
+        try:
+            settings_path = str(build_dir / "settings.json")
+            compiled_path = str(build_dir / "network.compiled")
+            vk_path = str(build_dir / "vk.key")
+            pk_path = str(build_dir / "pk.key")
+
+            print("  1. Generating circuit settings...")
+            py_run_args = self._py_run_args(run_args)
+            if py_run_args is not None:
+                await _resolve(ezkl.gen_settings(onnx_path, settings_path, py_run_args=py_run_args))
+            else:
+                await _resolve(ezkl.gen_settings(onnx_path, settings_path))
+
+            if run_args.get('calibration_target'):
+                print("  2. Calibrating settings...")
+                await _resolve(ezkl.calibrate_settings(
+                    onnx_path,
+                    settings_path,
+                    run_args['calibration_target']
+                ))
+
+            print("  3. Compiling model to circuit...")
+            await _resolve(ezkl.compile_circuit(onnx_path, compiled_path, settings_path))
+
+            with open(settings_path, 'r') as f:
+                logrows = json.load(f)['run_args']['logrows']
+
+            print(f"  4. Getting SRS (logrows={logrows})...")
+            srs_path = await self._ensure_srs(settings_path, logrows)
+
+            print("  5. Generating keys...")
+            await _resolve(ezkl.setup(compiled_path, vk_path, pk_path, str(srs_path)))
+
+            manifest = {
+                'key': key,
+                'onnx_sha256': self.hash_file(onnx_path),
+                'run_args': run_args,
+                'ezkl_version': getattr(ezkl, '__version__', 'unknown'),
+                'logrows': logrows,
+                'artifacts': {name: sha256_file(build_dir / name) for name in CIRCUIT_ARTIFACTS},
+                'srs_sha256': self._srs_hash(srs_path),
+                'created_at': datetime.utcnow().isoformat()
+            }
+            with open(build_dir / "manifest.json", 'w') as f:
+                json.dump(manifest, f, indent=2)
+
+            final_dir = self.circuit_dir(key)
+            if final_dir.exists():
+                shutil.rmtree(final_dir)
+            os.replace(build_dir, final_dir)
+            self._verified.add(key)
+
+            print(f"[✓] Circuit {key[:12]} built")
+            return self._paths(key, manifest)
+        finally:
+            shutil.rmtree(build_dir, ignore_errors=True)
+
+    def _py_run_args(self, run_args: Dict[str, Any]):
+        overrides = {k: v for k, v in run_args.items() if k != 'calibration_target'}
+        if not overrides:
+            return None
+        py_run_args = ezkl.PyRunArgs()
+        for name, value in overrides.items():
+            setattr(py_run_args, name, value)
+        return py_run_args
+
+    # ============ Locking ============
+
+    def _file_lock(self, name: str) -> "RegistryLock":
+        return RegistryLock(self.root / f".{name}.lock", self.lock_stale_seconds)
+
+
+class RegistryLock:
+    """Lock file shared by every process using the same registry directory."""
+
+    def __init__(self, path: Path, stale_seconds: float = CIRCUIT_LOCK_STALE_SECONDS):
+        self.path = path
+        self.stale_seconds = stale_seconds
+
+    async def __aenter__(self):
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, str(os.getpid()).encode())
+                os.close(fd)
+                return self
+            except FileExistsError:
+                try:
+                    if time.time() - self.path.stat().st_mtime > self.stale_seconds:
+                        print(f"[!] Removing stale circuit lock {self.path.name}")
+                        self.path.unlink()
+                        continue
+                except FileNotFoundError:
+                    continue
+                await asyncio.sleep(CIRCUIT_LOCK_POLL_SECONDS)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+__all__ = [
+    'CircuitRegistry',
+    'RegistryLock',
+    'sha256_file',
+    'CIRCUIT_ARTIFACTS',
+    'EZKL_AVAILABLE'
+]
@@ -0,0 +1,189 @@
+"""
+Training Data Pipeline for Oblivion
+Shuffled minibatch loading for worker training jobs.
+
+Datasets are indexed a whole batch at a time: the sampler yields lists
+of row indices and the dataset answers with one fancy-indexed read, so a
+batch costs one copy instead of batch_size Python __getitem__ calls.
+Features can be in-memory tensors or memory-mapped .npy arrays, so a
+dataset larger than RAM is paged in batch by batch.
+
+DP-SGD runs use Poisson sampling instead of shuffling: every batch
+includes each row independently with probability batch_size / n, which
+is the sampling the subsampled Gaussian accountant assumes.
+"""
+
+import os
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+from torch.utils.data import BatchSampler, DataLoader, Dataset, RandomSampler, Sampler, SequentialSampler
+
+TRAIN_BATCH_SIZE = int(os.environ.get("TRAIN_BATCH_SIZE", "32"))
+LOADER_WORKERS = int(os.environ.get("LOADER_WORKERS", "0"))
+LOADER_PREFETCH = int(os.environ.get("LOADER_PREFETCH", "2"))
+
+ArrayLike = Union[torch.Tensor, np.ndarray]
+
+
+class ArrayDataset(Dataset):
+    """
+    (features, targets) rows backed by tensors or (memory-mapped) arrays.
+
+    __getitem__ accepts a single index or a sequence of indices; batches
+    are read with sorted indices for sequential access on memmaps.
+    """
+
+    def __init__(self, features: ArrayLike, targets: ArrayLike):
+        if len(features) != len(targets):
+            raise ValueError(f"{len(features)} feature rows but {len(targets)} target rows")
+        self.features = features
+        self.targets = targets
+
+    def __len__(self) -> int:
+        return len(self.features)
+
+    @property
+    def feature_dim(self) -> int:
+        return int(np.prod(self.features.shape[1:])) if len(self.features.shape) > 1 else 1
+
+    @property
+    def target_dim(self) -> int:
+        return int(np.prod(self.targets.shape[1:])) if len(self.targets.shape) > 1 else 1
+
+    @staticmethod
+    def _take(array: ArrayLike, indices) -> torch.Tensor:
+        if isinstance(array, torch.Tensor):
+            rows = array[torch.as_tensor(indices)]
+        else:
+            rows = torch.from_numpy(np.ascontiguousarray(array[indices]))
+        rows = rows.float()
+        return rows.unsqueeze(-1) if rows.dim() == 1 else rows
+
+    def __getitem__(self, index) -> Tuple[torch.Tensor, torch.Tensor]:
+        if isinstance(index, (int, np.integer)):
+            x, y = self._take(self.features, [index]), self._take(self.targets, [index])
+            return x[0], y[0]
+        indices = np.sort(np.asarray(index, dtype=np.int64))
+        return self._take(self.features, indices), self._take(self.targets, indices)
+
+
+def load_memmap_dataset(features_path: str, targets_path: str) -> ArrayDataset:
+    """
+    Dataset over .npy files opened with mmap_mode='r' (nothing is read up front).
+
+    Args:
+        features_path: Path to the features .npy
+        targets_path: Path to the targets .npy
+
+    Returns:
+        ArrayDataset
+    """
+    return ArrayDataset(
+        np.load(features_path, mmap_mode='r'),
+        np.load(targets_path, mmap_mode='r')
+    )
+
+
+class PoissonBatchSampler(Sampler):
+    """
+    Batches that include each row independently with probability sample_rate.
+
+    Batch sizes vary (and can be 0); an epoch is round(1 / sample_rate)
+    batches, so it covers the dataset once in expectation.
+    """
+
+    def __init__(self, num_rows: int, sample_rate: float, generator: torch.Generator):
+        if not 0 < sample_rate <= 1:
+            raise ValueError(f"Sample rate must be in (0, 1], got {sample_rate}")
+        self.num_rows = num_rows
+        self.sample_rate = sample_rate
+        self.generator = generator
+        self.num_batches = max(1, round(1 / sample_rate))
+
+    def __len__(self) -> int:
+        return self.num_batches
+
+    def __iter__(self) -> Iterator[List[int]]:
+        for _ in range(self.num_batches):
+            mask = torch.rand(self.num_rows, generator=self.generator) < self.sample_rate
+            yield mask.nonzero().flatten().tolist()
+
+
+def make_loader(
+    dataset: Dataset,
+    batch_size: int = TRAIN_BATCH_SIZE,
+    shuffle: bool = True,
+    num_workers: int = LOADER_WORKERS,
+    pin_memory: Optional[bool] = None,
+    prefetch_factor: int = LOADER_PREFETCH,
+    drop_last: bool = False,
+    seed: Optional[int] = None,
+    poisson: bool = False
+) -> DataLoader:
+    """
+    Minibatch loader that fetches whole batches from the dataset.
+
+    Args:
+        dataset: Dataset whose __getitem__ accepts index lists
+        batch_size: Rows per batch
+        shuffle: Reshuffle every epoch
+        num_workers: Loader worker processes (0 = load in the training process)
+        pin_memory: Pin batches for async GPU copies (default: CUDA available)
+        prefetch_factor: Batches prefetched per worker
+        drop_last: Drop a final partial batch
+        seed: Shuffle seed (None = nondeterministic)
+        poisson: Poisson-sample batches of expected size batch_size
+            (for DP-SGD accounting; shuffle and drop_last are ignored)
+
+    Returns:
+        DataLoader yielding (features, targets) batches
+    """
+    generator = torch.Generator()
+    if seed is not None:
+        generator.manual_seed(seed)
+    else:
+        generator.seed()
+
+    if poisson:
+        batch_sampler = PoissonBatchSampler(len(dataset), min(1.0, max(1, batch_size) / len(dataset)), generator)
+    else:
+        sampler = RandomSampler(dataset, generator=generator) if shuffle else SequentialSampler(dataset)
+        batch_sampler = BatchSampler(sampler, batch_size=max(1, batch_size), drop_last=drop_last)
+
+    if pin_memory is None:
+        pin_memory = torch.cuda.is_available()
+
+    return DataLoader(
+        dataset,
+        sampler=batch_sampler,
+        batch_size=None,
+        num_workers=num_workers,
+        pin_memory=pin_memory,
+        prefetch_factor=prefetch_factor if num_workers > 0 else None,
+        persistent_workers=num_workers > 0
+    )
+
+
+def loader_generator(loader: DataLoader) -> Optional[torch.Generator]:
+    """RNG behind a make_loader() loader's batch order (None if sequential)."""
+    batch_sampler = loader.sampler
+    sampler = getattr(batch_sampler, 'sampler', batch_sampler)
+    return getattr(sampler, 'generator', None)
+
+
+def to_device(batch: Sequence[torch.Tensor], device: torch.device) -> Tuple[torch.Tensor, ...]:
+    """Move a batch to the training device (async when memory is pinned)."""
+    return tuple(t.to(device, non_blocking=True) for t in batch)
+
+
+__all__ = [
+    'ArrayDataset',
+    'load_memmap_dataset',
+    'make_loader',
+    'loader_generator',
+    'PoissonBatchSampler',
+    'to_device',
+    'TRAIN_BATCH_SIZE'
+]
@@ -0,0 +1,444 @@
+"""
+Columnar Dataset Format for Oblivion
+Memory-mappable binary datasets that shards can address by row range.
+
+Layout:
+    b"OBDS" | version (u8) | header length (u32 LE) | JSON header | pad
+    column 0 | pad | column 1 | pad | ...
+
+Each column is one C-order little-endian array of shape (rows, *shape),
+starting at a 64-byte aligned offset recorded in the header, so it can
+be opened with np.memmap and handed to torch.from_numpy without copying.
+Rows are grouped into fixed-size chunks; each chunk's sha256 covers its
+rows in every column, and the dataset's content hash is the hash of the
+chunk hashes. A shard is a row range, and its bytes and checksums follow
+from the header alone.
+
+The header layout must stay in sync with backend/app/core/dataset_format.py.
+"""
+
+import io
+import os
+import csv
+import sys
+import json
+import struct
+import shutil
+import hashlib
+import tempfile
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import torch
+import requests
+
+from data_pipeline import ArrayDataset
+
+DATASET_MAGIC = b"OBDS"
+DATASET_FORMAT_VERSION = 1
+# Chunks are also the unit shards are cut on
+DEFAULT_CHUNK_ROWS = 4096
+
+_PREFIX = struct.Struct("<4sBI")
+_ALIGN = 64
+_COPY_BLOCK = 1 << 22
+
+
+def _aligned(offset: int) -> int:
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def is_dataset(prefix: bytes) -> bool:
+    """True if the bytes start with the dataset magic."""
+    return prefix[:4] == DATASET_MAGIC
+
+
+def read_header(stream: BinaryIO) -> Dict[str, Any]:
+    """
+    Read and validate the header from the start of a dataset.
+
+    Args:
+        stream: Binary stream positioned at offset 0
+
+    Returns:
+        Header dict
+    """
+    magic, version, header_len = _PREFIX.unpack(stream.read(_PREFIX.size))
+    if magic != DATASET_MAGIC:
+        raise ValueError("Not an OBDS dataset")
+    if version > DATASET_FORMAT_VERSION:
+        raise ValueError(f"Unsupported dataset format version {version}")
+    return json.loads(stream.read(header_len).decode("utf-8"))
+
+
+def row_nbytes(column: Dict[str, Any]) -> int:
+    """Bytes per row of a column."""
+    return int(np.dtype(column["dtype"]).itemsize * np.prod(column["shape"], dtype=np.int64))
+
+
+def row_byte_ranges(header: Dict[str, Any], start: int, end: int) -> Dict[str, Tuple[int, int]]:
+    """
+    Absolute [first, last) byte range of rows [start, end) in each column.
+    """
+    ranges = {}
+    for column in header["columns"]:
+        size = row_nbytes(column)
+        ranges[column["name"]] = (column["offset"] + start * size, column["offset"] + end * size)
+    return ranges
+
+
+# ============ Writing ============
+
+class DatasetWriter:
+    """
+    Streams row batches into an OBDS file.
+
+    Batches are spooled to one temp file per column; close() writes the
+    header and the aligned columns and computes the chunk hashes, so the
+    whole dataset never has to fit in memory.
+    """
+
+    def __init__(self, path: str, chunk_rows: int = DEFAULT_CHUNK_ROWS, metadata: Optional[Dict[str, Any]] = None):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.metadata = metadata or {}
+        self.rows = 0
+        self._columns: Dict[str, Dict[str, Any]] = {}
+        self._spool_dir = tempfile.mkdtemp(prefix="obds_", dir=os.path.dirname(os.path.abspath(path)))
+
+    def append(self, **columns: np.ndarray):
+        """
+        Append rows; every column must have the same number of rows.
+
+        Args:
+            **columns: name -> array of shape (n, *shape)
+        """
+        counts = {len(a) for a in columns.values()}
+        if len(counts) != 1:
+            raise ValueError("All columns must have the same number of rows")
+
+        for name, array in columns.items():
+            array = np.ascontiguousarray(array)
+            if array.dtype.byteorder == ">":
+                array = array.astype(array.dtype.newbyteorder("<"))
+            spec = self._columns.get(name)
+            if spec is None:
+                if self.rows:
+                    raise ValueError(f"Column {name} added after the first batch")
+                spec = self._columns[name] = {
+                    "dtype": array.dtype.str.replace("|", "<").replace("=", "<"),
+                    "shape": list(array.shape[1:]),
+                    "file": open(os.path.join(self._spool_dir, f"{len(self._columns)}.bin"), "wb")
+                }
+            elif list(array.shape[1:]) != spec["shape"]:
+                raise ValueError(f"Column {name} changed shape")
+            spec["file"].write(memoryview(array.astype(spec["dtype"], copy=False)).cast("B"))
+        self.rows += counts.pop()
+
+    def close(self) -> Dict[str, Any]:
+        """
+        Assemble the final file.
+
+        Returns:
+            The written header
+        """
+        columns = []
+        for name, spec in self._columns.items():
+            spec["file"].close()
+            columns.append({"name": name, "dtype": spec["dtype"], "shape": spec["shape"]})
+
+        chunks = []
+        hashers = []
+        for start in range(0, self.rows, self.chunk_rows):
+            chunks.append({"index": len(chunks), "row_start": start, "row_end": min(start + self.chunk_rows, self.rows)})
+            hashers.append(hashlib.sha256())
+
+        # Column offsets depend on the header length, which depends on the
+        # offsets; digits only grow, so two passes settle it
+        header = {}
+        header_len = 0
+        for _ in range(3):
+            offset = _aligned(_PREFIX.size + header_len)
+            for column in columns:
+                column["offset"] = offset
+                column["nbytes"] = row_nbytes(column) * self.rows
+                offset = _aligned(offset + column["nbytes"])
+            header = self._header(columns, chunks, "0" * 64)
+            if len(header) == header_len:
+                break
+            header_len = len(header)
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as out:
+            out.write(b"\0" * columns[0]["offset"] if columns else b"")
+            for column, spec in zip(columns, self._columns.values()):
+                out.seek(column["offset"])
+                size = row_nbytes(column)
+                with open(spec["file"].name, "rb") as src:
+                    for chunk, hasher in zip(chunks, hashers):
+                        remaining = (chunk["row_end"] - chunk["row_start"]) * size
+                        while remaining:
+                            block = src.read(min(remaining, _COPY_BLOCK))
+                            if not block:
+                                raise ValueError("Spool file truncated")
+                            hasher.update(block)
+                            out.write(block)
+                            remaining -= len(block)
+            out.truncate(_aligned(out.tell()))
+
+            for chunk, hasher in zip(chunks, hashers):
+                chunk["sha256"] = hasher.hexdigest()
+            content_hash = hashlib.sha256(b"".join(bytes.fromhex(c["sha256"]) for c in chunks)).hexdigest()
+            final = self._header(columns, chunks, content_hash)
+            if len(final) != header_len:
+                raise ValueError("Header size changed while writing")
+            out.seek(0)
+            out.write(_PREFIX.pack(DATASET_MAGIC, DATASET_FORMAT_VERSION, len(final)))
+            out.write(final)
+
+        os.replace(tmp_path, self.path)
+        shutil.rmtree(self._spool_dir, ignore_errors=True)
+        return json.loads(final)
+
+    def _header(self, columns: List[Dict], chunks: List[Dict], content_hash: str) -> bytes:
+        header = {
+            "version": DATASET_FORMAT_VERSION,
+            "rows": self.rows,
+            "chunk_rows": self.chunk_rows,
+            "columns": columns,
+            "chunks": [dict(c, sha256=c.get("sha256", "0" * 64)) for c in chunks],
+            "content_hash": content_hash,
+            **self.metadata
+        }
+        return json.dumps(header, separators=(",", ":")).encode("utf-8")
+
+
+def write_dataset(path: str, chunk_rows: int = DEFAULT_CHUNK_ROWS, **columns: np.ndarray) -> Dict[str, Any]:
+    """Write in-memory columns as one OBDS file; returns the header."""
+    writer = DatasetWriter(path, chunk_rows)
+    writer.append(**columns)
+    return writer.close()
+
+
+# ============ Reading ============
+
+class ObdsDataset:
+    """An OBDS file opened with memory-mapped columns."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.header = read_header(f)
+        self.rows = self.header["rows"]
+        self._columns = {c["name"]: c for c in self.header["columns"]}
+
+    @property
+    def content_hash(self) -> str:
+        return self.header["content_hash"]
+
+    def column(self, name: str) -> np.ndarray:
+        """Memory-mapped (copy-on-write) column array; nothing is read yet."""
+        spec = self._columns[name]
+        return np.memmap(
+            self.path,
+            dtype=np.dtype(spec["dtype"]),
+            mode="c",
+            offset=spec["offset"],
+            shape=(self.rows, *spec["shape"])
+        )
+
+    def tensor(self, name: str, start: int = 0, end: Optional[int] = None) -> torch.Tensor:
+        """Zero-copy tensor view of rows [start, end) of a column."""
+        return torch.from_numpy(self.column(name)[start:end])
+
+    def verify(self, start: int = 0, end: Optional[int] = None) -> bool:
+        """Check the hashes of every chunk overlapping rows [start, end)."""
+        end = self.rows if end is None else end
+        with open(self.path, "rb") as f:
+            for chunk in self.header["chunks"]:
+                if chunk["row_end"] <= start or chunk["row_start"] >= end:
+                    continue
+                hasher = hashlib.sha256()
+                for column in self.header["columns"]:
+                    size = row_nbytes(column)
+                    f.seek(column["offset"] + chunk["row_start"] * size)
+                    hasher.update(f.read((chunk["row_end"] - chunk["row_start"]) * size))
+                if hasher.hexdigest() != chunk["sha256"]:
+                    return False
+        return True
+
+    def to_array_dataset(
+        self,
+        features: str = "X",
+        targets: str = "y",
+        start: int = 0,
+        end: Optional[int] = None
+    ) -> ArrayDataset:
+        """Training dataset over rows [start, end), backed by the memory map."""
+        return ArrayDataset(self.column(features)[start:end], self.column(targets)[start:end])
+
+
+def open_dataset(path: str) -> ObdsDataset:
+    """Open an OBDS file."""
+    return ObdsDataset(path)
+
+
+# ============ Remote Partitions ============
+
+def fetch_partition(url: str, shard: Dict[str, Any], timeout: float = 60) -> Dict[str, np.ndarray]:
+    """
+    Download one shard's rows of a remote OBDS dataset and verify them.
+
+    Only the shard's byte range of each column is requested (HTTP Range),
+    and every chunk it covers is checked against its planned hash.
+
+    Args:
+        url: Dataset URL
+        shard: Shard with row_start, row_end, byte_ranges and chunks
+        timeout: Per-request timeout in seconds
+
+    Returns:
+        Column name -> array of the shard's rows
+    """
+    with requests.Session() as session:
+        prefix = _get_range(session, url, 0, _PREFIX.size, timeout)
+        header_len = _PREFIX.unpack(prefix)[2]
+        header = read_header(io.BytesIO(prefix + _get_range(session, url, _PREFIX.size, _PREFIX.size + header_len, timeout)))
+
+        raw = {}
+        for column in header["columns"]:
+            first, last = shard["byte_ranges"][column["name"]]
+            raw[column["name"]] = _get_range(session, url, first, last, timeout)
+
+    row_start = shard["row_start"]
+    for chunk in shard.get("chunks") or []:
+        hasher = hashlib.sha256()
+        for column in header["columns"]:
+            size = row_nbytes(column)
+            hasher.update(raw[column["name"]][(chunk["row_start"] - row_start) * size:(chunk["row_end"] - row_start) * size])
+        if hasher.hexdigest() != chunk["sha256"]:
+            raise ValueError(f"Chunk {chunk['index']} failed verification")
+
+    rows = shard["row_end"] - row_start
+    return {
+        column["name"]: np.frombuffer(bytearray(raw[column["name"]]), dtype=np.dtype(column["dtype"])).reshape(rows, *column["shape"])
+        for column in header["columns"]
+    }
+
+
+def _get_range(session: requests.Session, url: str, start: int, end: int, timeout: float) -> bytes:
+    response = session.get(url, headers={"Range": f"bytes={start}-{end - 1}"}, timeout=timeout)
+    response.raise_for_status()
+    data = response.content if response.status_code == 206 else response.content[start:end]
+    if len(data) != end - start:
+        raise ValueError(f"Expected {end - start} bytes at {start}, got {len(data)}")
+    return data
+
+
+# ============ Converters ============
+
+def convert_json(source: Any, path: str, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Dict[str, Any]:
+    """
+    Convert the legacy {"X": [[...]], "y": [...]} JSON layout.
+
+    Args:
+        source: Parsed dict, JSON string/bytes, or a path to a .json file
+        path: Output .obds path
+
+    Returns:
+        Header of the written dataset
+    """
+    if isinstance(source, (str, bytes)) and not (isinstance(source, str) and os.path.exists(source)):
+        source = json.loads(source)
+    elif isinstance(source, str):
+        with open(source, "r") as f:
+            source = json.load(f)
+
+    X = np.asarray(source["X"], dtype=np.float32)
+    y = np.asarray(source["y"], dtype=np.float32)
+    if X.ndim == 1:
+        X = X[:, None]
+    if y.ndim == 1:
+        y = y[:, None]
+    return write_dataset(path, chunk_rows=chunk_rows, X=X, y=y)
+
+
+def convert_csv(
+    csv_path: str,
+    path: str,
+    target_columns: Optional[Iterable[str]] = None,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    batch_rows: int = 65536
+) -> Dict[str, Any]:
+    """
+    Stream a numeric CSV (with a header row) into features X and targets y.
+
+    Args:
+        csv_path: Input CSV
+        path: Output .obds path
+        target_columns: Target column names (default: the last column)
+        chunk_rows: Rows per hashed chunk
+        batch_rows: Rows parsed per batch
+
+    Returns:
+        Header of the written dataset
+    """
+    with open(csv_path, "r", newline="") as f:
+        reader = csv.reader(f)
+        names = next(reader)
+        targets = list(target_columns) if target_columns else [names[-1]]
+        target_idx = [names.index(t) for t in targets]
+        feature_idx = [i for i in range(len(names)) if i not in target_idx]
+
+        writer = DatasetWriter(path, chunk_rows, metadata={
+            "feature_names": [names[i] for i in feature_idx],
+            "target_names": targets
+        })
+        batch: List[List[str]] = []
+
+        def flush():
+            rows = np.asarray(batch, dtype=np.float32)
+            writer.append(X=rows[:, feature_idx], y=rows[:, target_idx])
+            batch.clear()
+
+        for row in reader:
+            if row:
+                batch.append(row)
+            if len(batch) >= batch_rows:
+                flush()
+        if batch:
+            flush()
+    return writer.close()
+
+
+def main():
+    """python dataset_format.py <input.json|input.csv> <output.obds> [target columns...]"""
+    if len(sys.argv) < 3:
+        print(main.__doc__)
+        sys.exit(1)
+    source, out = sys.argv[1], sys.argv[2]
+    if source.endswith(".csv"):
+        header = convert_csv(source, out, sys.argv[3:] or None)
+    else:
+        header = convert_json(source, out)
+    print(f"[*] Wrote {out}: {header['rows']} rows, {len(header['chunks'])} chunks, "
+          f"content hash {header['content_hash'][:16]}...")
+
+
+__all__ = [
+    'DatasetWriter',
+    'ObdsDataset',
+    'write_dataset',
+    'open_dataset',
+    'fetch_partition',
+    'read_header',
+    'row_byte_ranges',
+    'convert_json',
+    'convert_csv',
+    'is_dataset',
+    'DATASET_MAGIC'
+]
+
+
+if __name__ == "__main__":
+    main()
@@ -8,13 +8,16 @@ import sys
 import time
 import json
 import uuid
+import functools
+import importlib.util
 import torch
 import torch.nn as nn
+from torch.utils.data import Dataset
 import numpy as np
 import hashlib
 from pathlib import Path
 from datetime import datetime
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Union, Callable
 import subprocess
 import threading
 import psutil
@@ -29,7 +32,17 @@ load_dotenv()
 
 # Local imports
 from blockchain_client import BlockchainClient, Job, JobStatus
-from ipfs_client import get_ipfs_client, IPFSClient
+from ipfs_client import get_ipfs_client, get_pin_queue, IPFSClient
+from privacy import dp_sgd_step, PrivatizationEngine
+from privacy_accountant import get_privacy_ledger
+from data_pipeline import ArrayDataset, make_loader, loader_generator, to_device
+from dataset_format import is_dataset, open_dataset, fetch_partition
+from parallel_shards import ParallelShardExecutor, map_rows, shard_ranges
+from shard_lease import ShardLease
+from checkpointing import Checkpointer, capture_rng_state, restore_rng_state, fetch_checkpoint_url
+
+# Proof-heavy shards are only routed to workers that can run EZKL
+ZK_CAPABLE = importlib.util.find_spec("ezkl") is not None
 
 # ============ Tunneling & Node Server ============
 
@@ -113,6 +126,8 @@ class WorkerConfig:
     DP_EPSILON = 1.0
     DP_DELTA = 1e-5
     DP_MAX_GRAD_NORM = 1.0
+    DP_PER_SAMPLE = True  # Per-example clipping (DP-SGD) instead of batch clipping
+    DP_BUDGET_EPSILON = 10.0  # Total epsilon a job/dataset may spend across trainings
     
     # Stake
     MIN_STAKE_ETH = 0.01
@@ -126,12 +141,20 @@ class WorkerConfig:
 
 class SimpleNet(nn.Module):
     """Simple neural network for training jobs"""
-    def __init__(self, input_size: int = 10, hidden_size: int = 64, output_size: int = 1):
+    def __init__(
+        self,
+        input_size: int = 10,
+        hidden_size: int = 64,
+        output_size: int = 1,
+        per_sample_safe: bool = False
+    ):
         super().__init__()
+        # BatchNorm mixes examples, which breaks per-example DP; LayerNorm does not
+        norm = nn.LayerNorm(hidden_size) if per_sample_safe else nn.BatchNorm1d(hidden_size)
         self.layers = nn.Sequential(
             nn.Linear(input_size, hidden_size),
             nn.ReLU(),
-            nn.BatchNorm1d(hidden_size),
+            norm,
             nn.Dropout(0.2),
             nn.Linear(hidden_size, hidden_size // 2),
             nn.ReLU(),
@@ -151,44 +174,45 @@ class DPTrainer:
         self,
         epsilon: float = 1.0,
         delta: float = 1e-5,
-        max_grad_norm: float = 1.0
+        max_grad_norm: float = 1.0,
+        seed: Optional[int] = None
     ):
         self.epsilon = epsilon
         self.delta = delta
         self.max_grad_norm = max_grad_norm
         self.noise_multiplier = self._compute_noise_multiplier()
+        self.engine = PrivatizationEngine(seed)
     
     def _compute_noise_multiplier(self) -> float:
         """Compute noise based on privacy budget"""
         return np.sqrt(2 * np.log(1.25 / self.delta)) / self.epsilon
     
     def clip_gradients(self, model: nn.Module) -> float:
-        """Clip gradients to bound sensitivity"""
-        total_norm = 0.0
-        for param in model.parameters():
-            if param.grad is not None:
-                param_norm = param.grad.data.norm(2)
-                total_norm += param_norm.item() ** 2
-        total_norm = np.sqrt(total_norm)
-        
-        clip_coef = self.max_grad_norm / (total_norm + 1e-6)
-        if clip_coef < 1:
-            for param in model.parameters():
-                if param.grad is not None:
-                    param.grad.data.mul_(clip_coef)
-        
-        return total_norm
+        """Clip the batch gradient to bound sensitivity"""
+        total_norm = torch.nn.utils.clip_grad_norm_(model.parameters(), self.max_grad_norm, foreach=True)
+        return total_norm.item()
+    
+    def dp_sgd_step(
+        self,
+        model: nn.Module,
+        criterion,
+        data: torch.Tensor,
+        targets: torch.Tensor,
+        expected_batch_size: Optional[int] = None
+    ) -> torch.Tensor:
+        """Per-example clipped, noised gradients written to param.grad; returns the batch loss"""
+        return dp_sgd_step(
+            model, criterion, data, targets,
+            max_grad_norm=self.max_grad_norm,
+            noise_multiplier=self.noise_multiplier,
+            generator=self.engine.next_generator(data.device),
+            expected_batch_size=expected_batch_size
+        )
     
     def add_noise(self, model: nn.Module):
-        """Add calibrated Gaussian noise to gradients"""
-        for param in model.parameters():
-            if param.grad is not None:
-                noise = torch.normal(
-                    mean=0,
-                    std=self.noise_multiplier * self.max_grad_norm,
-                    size=param.grad.shape
-                )
-                param.grad.data.add_(noise)
+        """Add calibrated Gaussian noise to gradients (one draw for all parameters)"""
+        grads = [p.grad for p in model.parameters() if p.grad is not None]
+        self.engine.privatize_(grads, std=self.noise_multiplier * self.max_grad_norm)
 
 
 # ============ Training Engine ============
@@ -206,64 +230,193 @@ class TrainingEngine:
     
     def train(
         self,
-        data: torch.Tensor,
-        targets: torch.Tensor,
+        data: Union[torch.Tensor, Dataset],
+        targets: Optional[torch.Tensor] = None,
         epochs: int = None,
-        lr: float = None
+        lr: float = None,
+        budget_key: Optional[str] = None,
+        batch_size: int = None,
+        step_cap: Optional[int] = None,
+        on_epoch: Optional[Callable[[int, int], bool]] = None,
+        checkpointer: Optional[Checkpointer] = None
     ) -> Dict[str, Any]:
         """
         Train a model on the provided data
         Returns training results including model and metrics
+        
+        data is a feature tensor (with targets) or an ArrayDataset, e.g. a
+        memory-mapped one; training runs on shuffled minibatches.
+        With DP-SGD, batches are Poisson-sampled, each step is charged to
+        the persistent RDP budget under budget_key (sample rate
+        batch_size / n) and training stops once it is spent. step_cap limits the steps without touching
+        the ledger, for callers that charge the budget themselves.
+        on_epoch(epoch, epochs) is called after every epoch; returning False
+        stops training (result['stopped'] is then True).
+        With a checkpointer, training resumes from its latest checkpoint and
+        snapshots model, optimizer, RNG and privacy state between epochs.
+        Steps taken before a resume are charged to this run's budget.
         """
         epochs = epochs or self.config.DEFAULT_EPOCHS
         lr = lr or self.config.DEFAULT_LR
+        batch_size = batch_size or self.config.DEFAULT_BATCH_SIZE
+        
+        dataset = data if isinstance(data, Dataset) else ArrayDataset(data, targets)
+        num_samples = len(dataset)
+        batch_size = min(batch_size, num_samples)
+        per_sample = self.dp_trainer is not None and self.config.DP_PER_SAMPLE
+        if per_sample:
+            # The accountant charges Poisson subsampling at rate batch_size / n
+            loader = make_loader(dataset, batch_size=batch_size, poisson=True)
+        else:
+            # Avoid a trailing batch of one row (BatchNorm cannot train on it)
+            loader = make_loader(dataset, batch_size=batch_size, drop_last=num_samples % batch_size == 1)
+        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         
         # Determine model architecture from data
-        input_size = data.shape[1] if len(data.shape) > 1 else 1
-        output_size = targets.shape[1] if len(targets.shape) > 1 else 1
+        input_size = dataset.feature_dim
+        output_size = dataset.target_dim
+        
+        model = SimpleNet(input_size=input_size, output_size=output_size, per_sample_safe=per_sample).to(device)
         
-        model = SimpleNet(input_size=input_size, output_size=output_size)
+        accountant = None
+        max_steps = None
+        sample_rate = batch_size / num_samples
+        if per_sample and budget_key:
+            ledger = get_privacy_ledger()
+            accountant = ledger.accountant(budget_key)
+            max_steps = accountant.steps_remaining(
+                self.dp_trainer.noise_multiplier, sample_rate,
+                self.config.DP_BUDGET_EPSILON, self.config.DP_DELTA
+            )
+            if max_steps == 0:
+                raise RuntimeError(f"Privacy budget exhausted for {budget_key}")
+            if max_steps < epochs * len(loader):
+                print(f"  🔒 Privacy budget allows {max_steps}/{epochs * len(loader)} steps")
+        if step_cap is not None:
+            max_steps = step_cap if max_steps is None else min(max_steps, step_cap)
         criterion = nn.MSELoss()
         optimizer = torch.optim.Adam(model.parameters(), lr=lr)
         
         # Training loop
         model.train()
         history = []
+        steps = 0
+        stopped = False
+        start_epoch = 0
+        shuffle_generator = loader_generator(loader)
+        generators = {'loader': shuffle_generator} if shuffle_generator is not None else {}
+        privacy_state = {'per_sample': per_sample, 'dp': self.dp_trainer is not None, 'sample_rate': sample_rate}
+        if self.dp_trainer is not None:
+            privacy_state['noise_multiplier'] = float(self.dp_trainer.noise_multiplier)
+        
+        if checkpointer is not None:
+            resumed = self._resume(checkpointer.load(), model, optimizer, generators, privacy_state)
+            if resumed is not None:
+                start_epoch, steps, history = resumed
+                print(f"  ♻️ Resuming from epoch {start_epoch}/{epochs} ({steps} steps)")
         
-        print(f"  📊 Training for {epochs} epochs...")
+        print(f"  📊 Training for {epochs} epochs ({len(loader)} batches of {batch_size})...")
         
-        for epoch in range(epochs):
-            optimizer.zero_grad()
+        for epoch in range(start_epoch, epochs):
+            epoch_loss = torch.zeros((), device=device)
+            epoch_batches = 0
             
-            outputs = model(data)
-            loss = criterion(outputs, targets)
-            loss.backward()
+            for batch in loader:
+                if max_steps is not None and steps >= max_steps:
+                    break
+                x, y = to_device(batch, device)
+                optimizer.zero_grad()
+                
+                if per_sample:
+                    # DP-SGD: vectorized per-example clipping and one noise draw
+                    loss = self.dp_trainer.dp_sgd_step(model, criterion, x, y, expected_batch_size=batch_size)
+                else:
+                    outputs = model(x)
+                    loss = criterion(outputs, y)
+                    loss.backward()
+                    
+                    # Apply differential privacy
+                    if self.dp_trainer:
+                        grad_norm = self.dp_trainer.clip_gradients(model)
+                        self.dp_trainer.add_noise(model)
+                
+                optimizer.step()
+                epoch_loss += loss.detach()
+                epoch_batches += 1
+                steps += 1
             
-            # Apply differential privacy
-            if self.dp_trainer:
-                grad_norm = self.dp_trainer.clip_gradients(model)
-                self.dp_trainer.add_noise(model)
+            if not epoch_batches:
+                break
+            history.append((epoch_loss / epoch_batches).item())
             
-            optimizer.step()
+            if (epoch + 1) % 10 == 0:
+                print(f"    Epoch {epoch+1}/{epochs}, Loss: {history[-1]:.4f}")
             
-            history.append(loss.item())
+            if checkpointer is not None:
+                checkpointer.maybe_save(lambda: {
+                    'model': model.state_dict(),
+                    'optimizer': optimizer.state_dict(),
+                    'epoch': epoch + 1,
+                    'history': list(history),
+                    'rng': capture_rng_state(generators),
+                    'privacy': {
+                        **privacy_state,
+                        'steps': steps,
+                        'engine': self.dp_trainer.engine.state_dict() if self.dp_trainer else None
+                    }
+                })
             
-            if (epoch + 1) % 10 == 0:
-                print(f"    Epoch {epoch+1}/{epochs}, Loss: {loss.item():.4f}")
+            if on_epoch is not None and not on_epoch(epoch + 1, epochs):
+                stopped = True
+                break
         
+        epochs = len(history)
         final_loss = history[-1]
         quality_passed = final_loss < self.config.QUALITY_THRESHOLD
         
+        privacy_report = None
+        if accountant is not None:
+            accountant.step(self.dp_trainer.noise_multiplier, sample_rate, steps)
+            privacy_report = get_privacy_ledger().record(
+                budget_key, accountant, self.config.DP_BUDGET_EPSILON, self.config.DP_DELTA
+            )
+            print(f"  🔒 Privacy spent: ε={privacy_report['epsilon_spent']:.3f} / {self.config.DP_BUDGET_EPSILON}")
+        
         return {
-            'model': model,
+            'model': model.cpu(),
             'final_loss': final_loss,
             'history': history,
             'quality_passed': quality_passed,
             'epochs': epochs,
+            'steps': steps,
+            'num_samples': num_samples,
+            'sample_rate': sample_rate,
+            'stopped': stopped,
             'dp_enabled': self.config.DP_ENABLED,
-            'dp_epsilon': self.config.DP_EPSILON if self.config.DP_ENABLED else None
+            'dp_epsilon': self.config.DP_EPSILON if self.config.DP_ENABLED else None,
+            'privacy': privacy_report
         }
     
+    def _resume(self, state, model, optimizer, generators, privacy_state) -> Optional[tuple]:
+        """Load a checkpoint into the run; returns (epoch, steps, history) or None"""
+        if state is None:
+            return None
+        saved = state.get('privacy') or {}
+        # Steps are only comparable (and chargeable) under the same mechanism
+        if any(saved.get(key) != value for key, value in privacy_state.items()):
+            print("  ⚠️ Checkpoint was taken with other privacy settings, starting over")
+            return None
+        try:
+            model.load_state_dict(state['model'])
+            optimizer.load_state_dict(state['optimizer'])
+        except (KeyError, RuntimeError, ValueError) as e:
+            print(f"  ⚠️ Checkpoint does not fit this model ({e}), starting over")
+            return None
+        restore_rng_state(state['rng'], generators)
+        if self.dp_trainer is not None and saved.get('engine'):
+            self.dp_trainer.engine.load_state_dict(saved['engine'])
+        return state['epoch'], saved.get('steps', 0), list(state['history'])
+    
     def generate_synthetic_data(self, samples: int = 1000) -> tuple:
         """Generate synthetic training data for testing"""
         X = torch.randn(samples, 10)
@@ -318,11 +471,13 @@ class DecentralizedWorker:
         # IPFS client
         print("Initialising IPFS client...", flush=True)
         self.ipfs = get_ipfs_client()
+        self.pins = get_pin_queue()
         print("DONE IPFS client ready.", flush=True)
         
         # Training engine
         print("Initialising training engine...", flush=True)
         self.trainer = TrainingEngine(self.config)
+        self.shard_executor = ParallelShardExecutor(functools.partial(TrainingEngine, self.config))
         print("DONE Training engine ready.", flush=True)
         
         # Tunneling
@@ -360,7 +515,7 @@ class DecentralizedWorker:
                 "total_ram_gb": round(mem.total / (1024**3), 2),
                 "os": sys.platform,
                 "privacy_support": "differential_privacy_v1",
-                "zk_capable": True
+                "zk_capable": ZK_CAPABLE
             }
         }
         
@@ -480,7 +635,7 @@ class DecentralizedWorker:
                 "total_ram_gb": round(mem.total / (1024**3), 2),
                 "os": sys.platform,
                 "privacy_support": "differential_privacy_v1",
-                "zk_capable": True
+                "zk_capable": ZK_CAPABLE
             }
 
         @self.app.get("/stats")
@@ -644,18 +799,57 @@ class DecentralizedWorker:
         return None
     
     def _shard_training(self, data, targets, num_shards=10):
-        """Split training data into shards for distributed processing"""
+        """Split training data into row ranges for distributed processing"""
         print(f"    🧩 [SHARDING] Splitting job into {num_shards} shards for the mesh...")
-        shards = []
-        shard_size = len(data) // num_shards
+        ranges = shard_ranges(len(data), num_shards)
+        print(f"    ✅ [SHARDING] Created {num_shards} shards of size ~{len(data) // num_shards}")
+        return ranges
+
+    def _train_shards_parallel(self, data, targets, ranges, budget_key: Optional[str] = None, dataset_path: Optional[str] = None):
+        """
+        Train shards in the local process pool, in shard order
         
-        for i in range(num_shards):
-            start = i * shard_size
-            end = (i + 1) * shard_size if i < num_shards - 1 else len(data)
-            shards.append((data[start:end], targets[start:end]))
-            
-        print(f"    ✅ [SHARDING] Created {num_shards} shards of size ~{shard_size}")
-        return shards
+        With dataset_path (the OBDS file data/targets are mapped from) pool
+        processes map their own rows instead of receiving the tensors.
+        
+        With DP-SGD the remaining budget is split into equal step allowances
+        up front and every shard's steps are charged here once they finish.
+        """
+        per_sample = self.trainer.dp_trainer is not None and self.config.DP_PER_SAMPLE
+        step_cap = None
+        accountant = None
+        if per_sample and budget_key:
+            accountant = get_privacy_ledger().accountant(budget_key)
+            smallest = min(end - start for start, end in ranges)
+            remaining = accountant.steps_remaining(
+                self.trainer.dp_trainer.noise_multiplier,
+                min(1.0, self.config.DEFAULT_BATCH_SIZE / max(1, smallest)),
+                self.config.DP_BUDGET_EPSILON, self.config.DP_DELTA
+            )
+            step_cap = remaining // len(ranges)
+            if step_cap == 0:
+                raise RuntimeError(f"Privacy budget exhausted for {budget_key}")
+        
+        results = [None] * len(ranges)
+        total_samples = 0
+        weighted_loss = 0.0
+        for index, res in self.shard_executor.run(data, targets, ranges, dataset_path=dataset_path, step_cap=step_cap):
+            if 'error' in res:
+                raise RuntimeError(f"shard {index} failed: {res['error']}")
+            results[index] = res
+            total_samples += res['num_samples']
+            weighted_loss += res['final_loss'] * res['num_samples']
+            print(f"    [NODE-{index}] Shard done: loss {res['final_loss']:.4f}, "
+                  f"running loss {weighted_loss / total_samples:.4f} ({sum(r is not None for r in results)}/{len(ranges)})")
+        
+        if accountant is not None:
+            for res in results:
+                accountant.step(self.trainer.dp_trainer.noise_multiplier, res['sample_rate'], res['steps'])
+            report = get_privacy_ledger().record(
+                budget_key, accountant, self.config.DP_BUDGET_EPSILON, self.config.DP_DELTA
+            )
+            print(f"    🔒 Privacy spent: ε={report['epsilon_spent']:.3f} / {self.config.DP_BUDGET_EPSILON}")
+        return results
 
     def _aggregate_gradients(self, shard_results):
         """Aggregate gradients from multiple shards using federated averaging"""
@@ -694,7 +888,7 @@ class DecentralizedWorker:
             # Step 2: Download data from IPFS
             print("📥 Step 2: Downloading data from IPFS...")
             try:
-                data, targets = self._download_training_data(job)
+                data, targets, dataset_path = self._download_training_data(job)
             except Exception as dl_e:
                 print(f"❌ Data download error: {dl_e}")
                 return False
@@ -703,15 +897,13 @@ class DecentralizedWorker:
             # If data is large or multi-node is requested, shard the work
             print("🌐 [MESH] Initiating distributed contribution...")
             try:
-                shards = self._shard_training(data, targets, num_shards=10)
-                shard_results = []
+                ranges = self._shard_training(data, targets, num_shards=10)
                 
-                # Step 3: Train model shards (simulating 10 nodes contributing)
+                # Step 3: Train model shards (10 virtual nodes across local cores)
                 print("🏋️ Step 3: Training across 10 virtual nodes...")
-                for i, (s_data, s_targets) in enumerate(shards):
-                    print(f"    [NODE-{i}] Training shard {i+1}/10...")
-                    res = self.trainer.train(s_data, s_targets)
-                    shard_results.append(res)
+                shard_results = self._train_shards_parallel(
+                    data, targets, ranges, budget_key=f"dataset:{job.data_hash}", dataset_path=dataset_path
+                )
                 
                 # Step 4: Aggregate results
                 print("🧬 Step 4: Aggregating shard gradients...")
@@ -755,24 +947,43 @@ class DecentralizedWorker:
             return False
     
     def _download_training_data(self, job: Job) -> tuple:
-        """Download and parse training data from IPFS"""
+        """Download and parse training data from IPFS
+        
+        OBDS datasets are written to the work dir and memory-mapped, so the
+        returned tensors (and every shard sliced from them) are views of the
+        file; legacy {"X": ..., "y": ...} JSON is still accepted.
+        Returns (X, y, path of the mapped OBDS file or None).
+        """
         try:
-            # Try to download from IPFS
-            data_json = self.ipfs.download_json(job.data_hash)
+            content = self.ipfs.get_file(job.data_hash)
+            
+            if content and is_dataset(content):
+                path = self.config.WORK_DIR / f"{job.data_hash}.obds"
+                if not path.exists():
+                    tmp_path = path.with_suffix(".obds.tmp")
+                    tmp_path.write_bytes(content)
+                    os.replace(tmp_path, path)
+                dataset = open_dataset(str(path))
+                if not dataset.verify():
+                    raise ValueError("dataset chunk hashes do not match")
+                X, y = map_rows(str(path), 0, dataset.rows)
+                print(f"    Mapped dataset: {X.shape[0]} samples ({dataset.content_hash[:16]}...)")
+                return X, y, str(path)
             
+            data_json = json.loads(content.decode('utf-8')) if content else None
             if data_json and 'X' in data_json and 'y' in data_json:
-                X = torch.tensor(data_json['X'], dtype=torch.float32)
-                y = torch.tensor(data_json['y'], dtype=torch.float32)
+                X = torch.from_numpy(np.asarray(data_json['X'], dtype=np.float32))
+                y = torch.from_numpy(np.asarray(data_json['y'], dtype=np.float32))
                 if len(y.shape) == 1:
                     y = y.unsqueeze(1)
                 print(f"    Downloaded data: {X.shape[0]} samples")
-                return X, y
+                return X, y, None
         except Exception as e:
             print(f"    Could not download from IPFS: {e}")
         
         # Fall back to synthetic data
         print("    Using synthetic data for demo...")
-        return self.trainer.generate_synthetic_data()
+        return (*self.trainer.generate_synthetic_data(), None)
     
     def _upload_model(self, job: Job, result: Dict[str, Any]) -> Optional[str]:
         """Upload trained model to IPFS"""
@@ -790,84 +1001,181 @@ class DecentralizedWorker:
         }, model_path)
         
         # Upload to IPFS
-        cid = self.ipfs.upload_file(model_path, f"model_job_{job.id}.pt")
+        cid = self.ipfs.pin_file(str(model_path), f"model_job_{job.id}.pt")
         
         return cid
 
-    def check_for_shards(self):
-        """Poll backend for available job shards"""
+    def check_for_shards(self, wait: float = 0) -> float:
+        """Long-poll the backend scheduler for a shard lease and process it
+        
+        Returns the seconds spent waiting for a lease, so the caller can
+        count them towards its poll interval.
+        """
         if getattr(self, 'current_shard', None) is not None:
-            return # Busy processing another shard
+            return 0.0 # Busy processing another shard
             
         backend_url = os.getenv("BACKEND_URL", "http://localhost:8000")
+        started = time.time()
         try:
-            response = requests.get(f"{backend_url}/api/training/jobs")
+            response = requests.get(
+                f"{backend_url}/api/training/next-shard",
+                params={"worker_id": self.node_id, "wait": wait},
+                timeout=wait + 10
+            )
+            waited = time.time() - started
             if response.status_code == 200:
-                jobs = response.json()
-                for job in jobs:
-                    if job.get("status") == "sharding" or job.get("status") == "processing":
-                        for shard in job.get("shards", []):
-                            if shard.get("status") == "pending":
-                                print(f"    INFO Found available shard: {shard['shard_id']}. Claiming...")
-                                self._claim_and_process_shard(job, shard)
-                                return # Only claim one shard per loop iteration
-            else:
-                print(f"    WARN [MESH] Failed to fetch jobs: {response.status_code}")
+                lease = response.json()
+                shards = lease.get("shards") or [lease["shard"]]
+                print(f"    INFO [MESH] Leased {len(shards)} shard(s) of job {lease['job_id']} until "
+                      f"{datetime.fromtimestamp(lease['lease_expires_at']).strftime('%H:%M:%S')}")
+                job_data = {
+                    "id": lease["job_id"],
+                    "dataset": lease.get("dataset"),
+                    "lease_seconds": lease.get("lease_seconds")
+                }
+                # Shards of one lease run back to back; heartbeats renew the rest
+                for shard in shards:
+                    self._process_shard(job_data, shard)
+            elif response.status_code != 204:
+                print(f"    WARN [MESH] Failed to lease a shard: {response.status_code}")
+            return waited
         except Exception as e:
             print(f"    WARN [MESH] Shard check error: {e}")
+            return time.time() - started
 
-    def _claim_and_process_shard(self, job_data, shard_data):
-        """Claim a shard and process it"""
+    def _process_shard(self, job_data, shard_data):
+        """Train a leased shard and submit its result"""
         backend_url = os.getenv("BACKEND_URL", "http://localhost:8000")
         job_id = job_data["id"]
         shard_idx = shard_data["shard_index"]
+        self.current_shard = shard_data["shard_id"]
+        lease = ShardLease(backend_url, job_id, shard_idx, self.node_id, job_data.get("lease_seconds") or 60)
+        
+        def on_epoch(epoch: int, epochs: int) -> bool:
+            lease.progress = 100.0 * epoch / epochs
+            return not lease.cancelled.is_set()
+        
+        def on_checkpoint(url: str):
+            # Reported with the next heartbeat, so a reassigned shard resumes here
+            lease.checkpoint_url = url
+        
+        checkpointer = Checkpointer(
+            shard_data["shard_id"],
+            publish=self._publish_checkpoint,
+            fetch=self._fetch_checkpoint,
+            remote=shard_data.get("checkpoint"),
+            worker_id=self.node_id,
+            on_published=on_checkpoint,
+            unpublish=self._unpublish_checkpoint
+        )
         
         try:
-            print(f"    📡 [MESH] Attempting to claim shard {shard_idx} for job {job_id}...")
-            claim_res = requests.post(
-                f"{backend_url}/api/training/claim-shard",
-                params={"job_id": job_id, "shard_index": shard_idx, "worker_id": self.node_id},
+            with lease:
+                X, y = self._load_shard_data(job_data, shard_data)
+                res = self.trainer.train(
+                    X, y, epochs=10, budget_key=f"job:{job_id}",
+                    on_epoch=on_epoch, checkpointer=checkpointer
+                )
+            if res['stopped']:
+                print(f"    ⏹️ [MESH] Shard {shard_idx} was completed elsewhere, dropping local result")
+                checkpointer.discard()
+                return
+            result_url = self._upload_shard_model(job_id, shard_data, res)
+            
+            print(f"    📤 [MESH] Submitting local computation result for shard {shard_idx}...")
+            # Submit result
+            submit_res = requests.post(
+                f"{backend_url}/api/training/submit-shard",
+                params={
+                    "job_id": job_id,
+                    "shard_index": shard_idx,
+                    "worker_id": self.node_id,
+                    "result_url": result_url
+                },
                 timeout=10
             )
-            if claim_res.status_code == 200:
-                print(f"    ✅ [MESH] Shard {shard_idx} successfully claimed. Starting local computation...")
-                self.current_shard = shard_data["shard_id"]
-                
-                try:
-                    # Simulate training (shorter for shards)
-                    # In a real scenario, this is where we'd download the partition
-                    X, y = self.trainer.generate_synthetic_data(samples=100)
-                    res = self.trainer.train(X, y, epochs=10)
-                    
-                    print(f"    📤 [MESH] Submitting local computation result for shard {shard_idx}...")
-                    # Submit result
-                    submit_res = requests.post(
-                        f"{backend_url}/api/training/submit-shard",
-                        json={
-                            "job_id": job_id,
-                            "shard_index": shard_idx,
-                            "worker_id": self.node_id,
-                            "result_url": f"ipfs://{uuid.uuid4().hex}"
-                        },
-                        timeout=10
-                    )
-                    if submit_res.status_code == 200:
-                        print(f"    DONE [MESH] Shard {shard_idx} fully completed and verified by backend!")
-                        self.jobs_completed += 1
-                        self.shards_completed = getattr(self, 'shards_completed', 0) + 1
-                        self.current_shard = None
-                    else:
-                        print(f"    ❌ [MESH] Verification failed at backend: {submit_res.text}")
-                        self.current_shard = None
-                except Exception as train_err:
-                    print(f"    ❌ [MESH] Local training error on shard {shard_idx}: {train_err}")
-                    self.current_shard = None
+            if submit_res.status_code == 200:
+                checkpointer.discard()
+            if submit_res.status_code == 200 and not submit_res.json().get("accepted", True):
+                print(f"    ⏹️ [MESH] Shard {shard_idx} was already completed by another worker")
+            elif submit_res.status_code == 200:
+                print(f"    DONE [MESH] Shard {shard_idx} fully completed and verified by backend!")
+                self.jobs_completed += 1
+                self.shards_completed = getattr(self, 'shards_completed', 0) + 1
             else:
-                print(f"    ❌ [MESH] Could not claim shard: {claim_res.text}")
-        except Exception as e:
-            print(f"    ❌ [MESH] Critical shard network error: {e}")
+                print(f"    ❌ [MESH] Verification failed at backend: {submit_res.text}")
+        except Exception as train_err:
+            print(f"    ❌ [MESH] Local training error on shard {shard_idx}: {train_err}")
+        finally:
+            checkpointer.close()
             self.current_shard = None
     
+    def _load_shard_data(self, job_data, shard_data) -> tuple:
+        """Fetch only this shard's rows of the job's dataset"""
+        dataset = job_data.get("dataset")
+        if not dataset or shard_data.get("row_start") is None:
+            print("    [MESH] Job has no dataset layout, using synthetic data...")
+            return self.trainer.generate_synthetic_data(samples=100)
+        
+        start, end = shard_data["row_start"], shard_data["row_end"]
+        if dataset["format"] == "obds":
+            columns = fetch_partition(dataset["url"], shard_data)
+            X, y = torch.from_numpy(columns["X"]), torch.from_numpy(columns["y"])
+        else:
+            response = requests.get(dataset["url"], timeout=60)
+            response.raise_for_status()
+            if hashlib.sha256(response.content).hexdigest() != dataset["content_hash"]:
+                raise ValueError("dataset checksum does not match the plan")
+            data_json = json.loads(response.content.decode('utf-8'))
+            X = torch.from_numpy(np.asarray(data_json['X'][start:end], dtype=np.float32))
+            y = torch.from_numpy(np.asarray(data_json['y'][start:end], dtype=np.float32))
+        
+        if len(y.shape) == 1:
+            y = y.unsqueeze(1)
+        print(f"    🧩 [MESH] Fetched rows {start}-{end} ({X.shape[0]} samples)")
+        return X, y
+    
+    def _upload_shard_model(self, job_id: str, shard_data, result: Dict[str, Any]) -> str:
+        """
+        Save the shard's model locally and pin it to IPFS
+        
+        Raises:
+            RuntimeError: If the model could not be pinned (a local path
+                would be unreachable for the backend and other workers)
+        """
+        model_path = self.config.MODELS_DIR / f"{shard_data['shard_id']}.pt"
+        torch.save({
+            'model_state_dict': result['model'].state_dict(),
+            'job_id': job_id,
+            'shard_index': shard_data['shard_index'],
+            'row_range': [shard_data.get('row_start'), shard_data.get('row_end')],
+            'num_samples': result.get('num_samples'),
+            'final_loss': result['final_loss'],
+            'timestamp': datetime.now().isoformat(),
+            'worker_id': self.node_id
+        }, model_path)
+        
+        cid = self.ipfs.pin_file(str(model_path), model_path.name)
+        if not cid:
+            raise RuntimeError(f"IPFS pin of shard model {model_path.name} failed")
+        return f"ipfs://{cid}"
+    
+    def _publish_checkpoint(self, path: str) -> Optional[str]:
+        """Pin a shard checkpoint to IPFS"""
+        cid = self.ipfs.pin_file(path, Path(path).name)
+        return f"ipfs://{cid}" if cid else None
+    
+    def _unpublish_checkpoint(self, url: str):
+        """Queue the unpin of a superseded (or no longer needed) shard checkpoint"""
+        if url.startswith("ipfs://"):
+            self.pins.unpin(url[len("ipfs://"):])
+    
+    def _fetch_checkpoint(self, url: str) -> Optional[bytes]:
+        """Download a checkpoint published by this or another worker"""
+        if url.startswith("ipfs://"):
+            return self.ipfs.get_file(url[len("ipfs://"):])
+        return fetch_checkpoint_url(url)
+    
     def run(self):
         """Main worker loop"""
         print()
@@ -899,8 +1207,8 @@ class DecentralizedWorker:
                 if job:
                     self._process_job(job)
                 
-                # Step B: Check for training shards from backend
-                self.check_for_shards()
+                # Step B: Wait for a training shard lease from the backend
+                waited = self.check_for_shards(wait=self.config.POLL_INTERVAL)
                 
                 # [RESILIENCE] Verify Tunnel
                 if not self.tunnel.is_connected or not self.tunnel.public_url:
@@ -912,14 +1220,20 @@ class DecentralizedWorker:
                 if worker:
                     print(f"  📊 Stats: {worker.completed_jobs} completed, {worker.stake_eth:.4f} ETH staked")
                 
-                # Wait before next poll
-                print(f"  💤 Sleeping {self.config.POLL_INTERVAL}s...")
+                # Wait before next poll (the shard long-poll already counts)
+                remaining = self.config.POLL_INTERVAL - waited
+                if remaining > 0:
+                    print(f"  💤 Sleeping {remaining:.0f}s...")
+                    time.sleep(remaining)
                 print()
-                time.sleep(self.config.POLL_INTERVAL)
                 
         except KeyboardInterrupt:
             print("\n⚠️  Shutting down gracefully...")
             self.is_running = False
+        finally:
+            self.shard_executor.close()
+            # Let queued unpins finish
+            self.pins.flush(timeout=30)
         
         print()
         print("=" * 60)
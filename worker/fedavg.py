@@ -0,0 +1,536 @@
+"""
+Streaming Federated Averaging for Oblivion
+Bounded-memory aggregation of worker updates.
+
+Updates are downloaded concurrently (bounded by a semaphore), decoded in a
+thread pool, and folded one at a time into a preallocated fp32 running sum
+(optionally Kahan-compensated). Encoded updates are folded tensor by
+tensor straight from the payload, and each update is dropped as soon as
+it has been folded in, so memory stays at the running sum plus the few
+payloads in flight, regardless of how many updates are aggregated.
+
+UpdateStack collects the same stream into one (updates, params) matrix
+for the robust rules in robust_aggregation (median, trimmed mean, Krum).
+
+AggregationState persists a job's running sum together with the ids of
+the updates already folded into it, so new updates can be folded in
+incrementally across aggregator restarts.
+"""
+
+import io
+import os
+import json
+import time
+import asyncio
+import threading
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+import torch
+
+from update_codec import decode_update, is_encoded_update, iter_tensors, read_header
+from robust_aggregation import aggregate_matrix
+
+FEDAVG_MAX_DOWNLOADS = int(os.environ.get("FEDAVG_MAX_DOWNLOADS", "8"))
+FEDAVG_DECODE_WORKERS = int(os.environ.get("FEDAVG_DECODE_WORKERS", str(min(4, os.cpu_count() or 1))))
+FEDAVG_KAHAN = os.environ.get("FEDAVG_KAHAN", "false").lower() == "true"
+FEDAVG_DOWNLOAD_TIMEOUT = float(os.environ.get("FEDAVG_DOWNLOAD_TIMEOUT", "60"))
+
+
+def _shapes(state: Dict[str, torch.Tensor]) -> Dict[str, torch.Size]:
+    return {name: tensor.shape for name, tensor in state.items()}
+
+
+def _check_layout(expected: Dict[str, torch.Size], shapes: Dict[str, torch.Size]):
+    """Reject an update whose tensors differ from the first update's."""
+    if shapes.keys() != expected.keys():
+        missing = sorted(expected.keys() - shapes.keys())
+        extra = sorted(shapes.keys() - expected.keys())
+        raise ValueError(f"Update tensors do not match (missing {missing[:3]}, unexpected {extra[:3]})")
+    for name, shape in expected.items():
+        if shapes[name] != shape:
+            raise ValueError(f"Update tensor {name} has shape {list(shapes[name])}, expected {list(shape)}")
+
+
+class RunningSum:
+    """
+    Weighted fp32 running sum of state dicts.
+
+    Buffers are allocated once from the first update's shapes. With
+    kahan=True a compensation buffer per tensor keeps the sum accurate
+    over hundreds of updates.
+    """
+
+    def __init__(self, kahan: bool = FEDAVG_KAHAN):
+        self.kahan = kahan
+        self.sums: Dict[str, torch.Tensor] = {}
+        self._compensation: Dict[str, torch.Tensor] = {}
+        self._scratch: Dict[str, Tuple[torch.Tensor, torch.Tensor]] = {}
+        self.total_weight = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def _allocate(self, shapes: Dict[str, torch.Size]):
+        for name, shape in shapes.items():
+            self.sums[name] = torch.zeros(shape, dtype=torch.float32)
+            if self.kahan:
+                self._compensation[name] = torch.zeros(shape, dtype=torch.float32)
+                self._scratch[name] = (
+                    torch.empty(shape, dtype=torch.float32),
+                    torch.empty(shape, dtype=torch.float32)
+                )
+
+    def _prepare(self, shapes: Dict[str, torch.Size]):
+        """Allocate the sums for the first update, else check it matches them."""
+        if not self.sums:
+            self._allocate(shapes)
+        else:
+            _check_layout({name: total.shape for name, total in self.sums.items()}, shapes)
+
+    def _add(self, name: str, value: torch.Tensor, weight: float):
+        total = self.sums[name]
+        value = value.float()
+
+        if not self.kahan:
+            total.add_(value, alpha=weight)
+            return
+
+        # Kahan: y = w*x - c; t = sum + y; c = (t - sum) - y; sum = t
+        c = self._compensation[name]
+        y, t = self._scratch[name]
+        torch.mul(value, weight, out=y).sub_(c)
+        torch.add(total, y, out=t)
+        c.copy_(t).sub_(total).sub_(y)
+        total.copy_(t)
+
+    def fold(self, state: Dict[str, torch.Tensor], weight: float = 1.0):
+        """
+        Add weight * state into the sum.
+
+        Every update must have the same tensors (names and shapes) as the
+        first one, so total_weight applies to every entry of the sum.
+
+        Args:
+            state: Decoded update
+            weight: Weight of this update (e.g. its sample count)
+
+        Raises:
+            ValueError: If the update's tensors do not match
+        """
+        with self._lock:
+            self._prepare(_shapes(state))
+            for name in self.sums:
+                self._add(name, state[name], weight)
+            self.total_weight += weight
+            self.count += 1
+
+    def fold_encoded(
+        self,
+        payload: bytes,
+        weight: float = 1.0,
+        base_state: Optional[Dict[str, torch.Tensor]] = None
+    ):
+        """
+        Add weight * an encoded update into the sum, one tensor at a time.
+
+        The tensor layout is checked against the header before anything is
+        added. If the payload turns out to be corrupt part way through,
+        the tensors already added are subtracted again before the error
+        is raised, and the update is not counted.
+
+        Args:
+            payload: Encoded update bytes
+            weight: Weight of this update (e.g. its sample count)
+            base_state: Base model, required for delta updates
+
+        Raises:
+            ValueError: If the update's tensors do not match or it cannot be decoded
+        """
+        stream = io.BytesIO(payload)
+        header = read_header(stream)
+        with self._lock:
+            fresh = not self.sums
+            self._prepare({entry['name']: torch.Size(entry['shape']) for entry in header['tensors']})
+            added = 0
+            try:
+                for name, value in iter_tensors(stream, header, base_state):
+                    self._add(name, value, weight)
+                    added += 1
+            except Exception:
+                if fresh:
+                    self.sums, self._compensation, self._scratch = {}, {}, {}
+                else:
+                    replay = io.BytesIO(payload)
+                    read_header(replay)
+                    for name, value in islice(iter_tensors(replay, header, base_state), added):
+                        self._add(name, value, -weight)
+                raise
+            self.total_weight += weight
+            self.count += 1
+
+    def mean(self) -> Optional[Dict[str, torch.Tensor]]:
+        """Weighted average (the sum buffers are left untouched)."""
+        if not self.count or self.total_weight <= 0:
+            return None
+        with self._lock:
+            return {name: total / self.total_weight for name, total in self.sums.items()}
+
+    def state_dict(self) -> Dict[str, Any]:
+        """Tensors and counters needed to resume the sum."""
+        with self._lock:
+            return {
+                'kahan': self.kahan,
+                'sums': self.sums,
+                'compensation': self._compensation,
+                'total_weight': self.total_weight,
+                'count': self.count
+            }
+
+    def load_state_dict(self, state: Dict[str, Any]):
+        """Restore a sum saved with state_dict()."""
+        with self._lock:
+            self.kahan = state.get('kahan', self.kahan)
+            self.sums = state.get('sums', {})
+            self._compensation = state.get('compensation', {})
+            self.total_weight = float(state.get('total_weight', 0.0))
+            self.count = int(state.get('count', 0))
+            self._scratch = {}
+            if self.kahan:
+                for name, total in self.sums.items():
+                    if name not in self._compensation:
+                        self._compensation[name] = torch.zeros_like(total)
+                    self._scratch[name] = (torch.empty_like(total), torch.empty_like(total))
+
+
+class UpdateStack:
+    """
+    Decoded updates flattened into rows of one preallocated fp32 matrix.
+
+    Accepts the same fold(state, weight) calls as RunningSum, so it can be
+    filled by stream_fedavg, and aggregates all rows with a single
+    vectorized rule.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.matrix: Optional[torch.Tensor] = None
+        self.weights = torch.zeros(capacity, dtype=torch.float32)
+        self.layout: List[Tuple[str, torch.Size, int]] = []
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def fold(self, state: Dict[str, torch.Tensor], weight: float = 1.0):
+        """Copy an update into the next free row (same tensors as the first)."""
+        with self._lock:
+            if self.matrix is None:
+                offset = 0
+                for name, tensor in state.items():
+                    self.layout.append((name, tensor.shape, offset))
+                    offset += tensor.numel()
+                self.matrix = torch.zeros(self.capacity, offset, dtype=torch.float32)
+            else:
+                _check_layout({name: shape for name, shape, _ in self.layout}, _shapes(state))
+            if self.count >= self.capacity:
+                raise ValueError("UpdateStack is full")
+
+            row = self.matrix[self.count]
+            for name, shape, offset in self.layout:
+                row[offset:offset + shape.numel()].copy_(state[name].reshape(-1))
+            self.weights[self.count] = weight
+            self.count += 1
+
+    def aggregate(self, strategy: str = 'fedavg', **kwargs) -> Tuple[Optional[Dict[str, torch.Tensor]], Dict]:
+        """
+        Aggregate the filled rows.
+
+        Args:
+            strategy: Rule name from robust_aggregation
+            **kwargs: Rule options (trim_ratio, byzantine, krum_select)
+
+        Returns:
+            Tuple of (state dict or None if empty, rule metadata)
+        """
+        if not self.count:
+            return None, {}
+        flat, metadata = aggregate_matrix(
+            self.matrix[:self.count], self.weights[:self.count], strategy, **kwargs
+        )
+        state = {
+            name: flat[offset:offset + shape.numel()].view(shape).clone()
+            for name, shape, offset in self.layout
+        }
+        return state, metadata
+
+
+class AggregationState:
+    """
+    Persistent aggregation state of one job.
+
+    Stored as two files under the state directory:
+        job_<id>.json   consumed update ids, published model url, flags
+        job_<id>.pt     the running sum and the consumed ids it covers
+                        (written only when it changes)
+    Both are written to a temp file and renamed, so a crash never leaves a
+    half-written state behind. The sum file is written first and carries
+    its own consumed ids and count, so a crash before the metadata rename
+    is detected on load and the sum's ids win.
+    """
+
+    def __init__(self, job_id: Any, state_dir: str):
+        self.job_id = job_id
+        self.state_dir = state_dir
+        self.running_sum = RunningSum()
+        self.consumed: set = set()
+        self.model_url: Optional[str] = None
+        self.published_count = 0
+        self.finished = False
+        self.updated_at = time.time()
+        # Hierarchical mode: aggregation job id -> {update_ids, level, created_at}
+        self.delegations: Dict[str, Dict[str, Any]] = {}
+        # Tree level of partial updates whose row does not record one
+        self.partial_levels: Dict[str, int] = {}
+        # Buffered mode: version of the published global model
+        self.global_version = 0
+
+    @property
+    def _meta_path(self) -> str:
+        return os.path.join(self.state_dir, f"job_{self.job_id}.json")
+
+    @property
+    def _sum_path(self) -> str:
+        return os.path.join(self.state_dir, f"job_{self.job_id}.pt")
+
+    @property
+    def dirty(self) -> bool:
+        """True if updates were consumed since the model was last published."""
+        return len(self.consumed) != self.published_count
+
+    @classmethod
+    def load(cls, job_id: Any, state_dir: str) -> "AggregationState":
+        """
+        Load a job's state, or start an empty one.
+
+        Args:
+            job_id: Job id
+            state_dir: Directory holding the state files
+
+        Returns:
+            AggregationState
+        """
+        state = cls(job_id, state_dir)
+        if not os.path.exists(state._meta_path):
+            return state
+
+        with open(state._meta_path, 'r') as f:
+            meta = json.load(f)
+        state.consumed = set(meta.get('consumed', []))
+        state.model_url = meta.get('model_url')
+        state.published_count = meta.get('published_count', 0)
+        state.finished = meta.get('finished', False)
+        state.updated_at = meta.get('updated_at', state.updated_at)
+        state.delegations = meta.get('delegations', {})
+        state.partial_levels = meta.get('partial_levels', {})
+        state.global_version = meta.get('global_version', 0)
+
+        if os.path.exists(state._sum_path):
+            saved = torch.load(state._sum_path, map_location='cpu', weights_only=True)
+            state.running_sum.load_state_dict(saved)
+            if meta.get('count', 0) != state.running_sum.count:
+                # Crashed between the two renames: the metadata predates the sum
+                if 'consumed' in saved:
+                    print(f"    [!] Aggregation metadata for job {job_id} is stale, using the sum's consumed ids")
+                    state.consumed = set(saved['consumed'])
+                else:
+                    print(f"    [!] Aggregation sum for job {job_id} does not match its metadata, re-aggregating")
+                    state.running_sum = RunningSum()
+                    state.consumed = set()
+                    state.published_count = 0
+        elif state.consumed and not state.finished:
+            # Sum is missing: the ids alone cannot rebuild it, start over
+            print(f"    [!] Aggregation sum for job {job_id} missing, re-aggregating")
+            state.consumed = set()
+            state.published_count = 0
+        return state
+
+    def save(self, include_sum: bool = True):
+        """
+        Persist the state.
+
+        Args:
+            include_sum: Also rewrite the running sum tensors
+        """
+        os.makedirs(self.state_dir, exist_ok=True)
+        if include_sum:
+            tmp_path = self._sum_path + ".tmp"
+            torch.save({
+                **self.running_sum.state_dict(),
+                'consumed': sorted(self.consumed, key=str)
+            }, tmp_path)
+            os.replace(tmp_path, self._sum_path)
+
+        meta = {
+            'job_id': self.job_id,
+            'consumed': sorted(self.consumed, key=str),
+            'count': self.running_sum.count,
+            'total_weight': self.running_sum.total_weight,
+            'model_url': self.model_url,
+            'published_count': self.published_count,
+            'finished': self.finished,
+            'updated_at': self.updated_at,
+            'delegations': self.delegations,
+            'partial_levels': self.partial_levels,
+            'global_version': self.global_version
+        }
+        tmp_path = self._meta_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._meta_path)
+
+    def mark_finished(self):
+        """Drop the running sum once the final model is published."""
+        self.finished = True
+        self.save(include_sum=False)
+        if os.path.exists(self._sum_path):
+            os.remove(self._sum_path)
+
+
+def _download(url: str) -> bytes:
+    response = requests.get(url, timeout=FEDAVG_DOWNLOAD_TIMEOUT)
+    response.raise_for_status()
+    return response.content
+
+
+def make_base_loader() -> Callable[[str], Dict[str, torch.Tensor]]:
+    """Loader for the global models delta updates were trained against (cached)."""
+    cache = {}
+    lock = threading.Lock()
+
+    def load(base_url: str) -> Dict[str, torch.Tensor]:
+        if not base_url:
+            raise ValueError("Delta update has no base_url")
+        with lock:
+            if base_url not in cache:
+                cache[base_url] = decode_payload(_download(base_url))
+            return cache[base_url]
+
+    return load
+
+
+def row_weight(update: Dict[str, Any]) -> Optional[float]:
+    """Sample count of a worker_updates row (None = read it from the payload header)."""
+    num_samples = update.get('num_samples')
+    return float(num_samples) if num_samples else None
+
+
+def update_weight(payload: bytes, default: float = 1.0) -> float:
+    """Sample-count weight recorded in an encoded update's header."""
+    if is_encoded_update(payload[:4]):
+        return float(read_header(io.BytesIO(payload)).get('num_samples') or default)
+    return default
+
+
+def decode_payload(
+    payload: bytes,
+    base_loader: Optional[Callable[[str], Dict[str, torch.Tensor]]] = None
+) -> Dict[str, torch.Tensor]:
+    """
+    Decode an encoded or legacy torch.save update.
+
+    Args:
+        payload: Downloaded update bytes
+        base_loader: Returns the base model for a base_url (delta updates)
+
+    Returns:
+        State dict
+    """
+    if is_encoded_update(payload[:4]):
+        return decode_update(payload, base_state=_base_state(payload, base_loader))
+    return torch.load(io.BytesIO(payload), map_location='cpu', weights_only=True)
+
+
+def _base_state(
+    payload: bytes,
+    base_loader: Optional[Callable[[str], Dict[str, torch.Tensor]]]
+) -> Optional[Dict[str, torch.Tensor]]:
+    """Base model of an encoded delta update (None for full weights)."""
+    header = read_header(io.BytesIO(payload))
+    if not header.get('delta'):
+        return None
+    if base_loader is None:
+        raise ValueError("Delta update requires a base model loader")
+    return base_loader(header.get('base_url'))
+
+
+async def stream_fedavg(
+    updates: List[Tuple[Any, str, float]],
+    base_loader: Optional[Callable[[str], Dict[str, torch.Tensor]]] = None,
+    max_downloads: int = FEDAVG_MAX_DOWNLOADS,
+    decode_workers: int = FEDAVG_DECODE_WORKERS,
+    running_sum: Optional[RunningSum] = None,
+    on_folded: Optional[Callable[[Any], None]] = None,
+    prepare: Optional[Callable[[Dict[str, Any], Dict[str, torch.Tensor], float], Optional[Tuple[Dict, float]]]] = None
+) -> Tuple[RunningSum, List[Any], List[Tuple[Any, str]]]:
+    """
+    Download, decode and fold updates with bounded concurrency.
+
+    Args:
+        updates: (update_id, url, weight) tuples; a None weight is read
+            from the update header (num_samples, default 1.0)
+        base_loader: Loader for delta updates' base model
+        max_downloads: Concurrent downloads
+        decode_workers: Decode thread pool size
+        running_sum: Existing sum to continue (a new one is created if None);
+            an UpdateStack collects the updates instead
+        on_folded: Called with the update_id after it is folded in
+        prepare: Called as prepare(header, state, weight) before folding;
+            returns the (state, weight) to fold, or None to drop the update
+            (it is still reported as folded, i.e. consumed)
+
+    Returns:
+        Tuple of (running sum, folded update ids, [(failed id, error)])
+    """
+    running_sum = running_sum or RunningSum()
+    semaphore = asyncio.Semaphore(max_downloads)
+    loop = asyncio.get_running_loop()
+    folded = []
+    failed = []
+
+    with ThreadPoolExecutor(max_workers=max(1, decode_workers)) as decode_pool:
+        async def process(update_id: Any, url: str, weight: float):
+            # The semaphore also bounds decoded updates held in memory
+            async with semaphore:
+                try:
+                    payload = await asyncio.to_thread(_download, url)
+
+                    def decode_and_fold():
+                        fold_weight = update_weight(payload) if weight is None else weight
+                        if prepare is None and isinstance(running_sum, RunningSum) and is_encoded_update(payload[:4]):
+                            running_sum.fold_encoded(payload, fold_weight, _base_state(payload, base_loader))
+                            return
+                        state = decode_payload(payload, base_loader)
+                        if prepare is not None:
+                            header = read_header(io.BytesIO(payload)) if is_encoded_update(payload[:4]) else {}
+                            prepared = prepare(header, state, fold_weight)
+                            if prepared is None:
+                                return
+                            state, fold_weight = prepared
+                        running_sum.fold(state, fold_weight)
+
+                    await loop.run_in_executor(decode_pool, decode_and_fold)
+                    folded.append(update_id)
+                    if on_folded:
+                        on_folded(update_id)
+                except Exception as e:
+                    failed.append((update_id, str(e)))
+
+        await asyncio.gather(*(process(*update) for update in updates))
+
+    return running_sum, folded, failed
+
+
+__all__ = [
+    'RunningSum', 'UpdateStack', 'AggregationState', 'stream_fedavg', 'decode_payload', 'update_weight',
+    'make_base_loader', 'row_weight'
+]
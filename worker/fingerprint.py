@@ -0,0 +1,140 @@
+"""
+Gradient Fingerprinting for Oblivion
+Quantizes model updates to int8 and hashes the tensor buffers directly.
+
+Each layer is hashed from its contiguous int8 buffer through a memoryview,
+so no Python lists are created. The update digest is computed over the
+per-layer digests, which lets the on-chain update hash, the per-layer
+digests and the quantized payload all come from a single pass.
+"""
+
+import struct
+import hashlib
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence, Tuple
+
+import torch
+
+FINGERPRINT_VERSION = b"OBLV-FP1"
+
+_pack_u32 = struct.Struct("<I").pack
+_pack_i64 = struct.Struct("<q").pack
+_pack_f64 = struct.Struct("<d").pack
+
+
+@dataclass
+class LayerFingerprint:
+    """Digest and quantization parameters of one update tensor."""
+    name: str
+    shape: List[int]
+    scale: float
+    digest: str
+
+
+@dataclass
+class UpdateFingerprint:
+    """Fingerprint of a whole model update."""
+    digest: str
+    bits: int
+    layers: List[LayerFingerprint] = field(default_factory=list)
+    quantized: List[torch.Tensor] = field(default_factory=list)
+
+    @property
+    def scales(self) -> List[float]:
+        return [layer.scale for layer in self.layers]
+
+    @property
+    def layer_digests(self) -> List[str]:
+        return [layer.digest for layer in self.layers]
+
+    def to_dict(self) -> dict:
+        """Metadata only (no tensors), suitable for JSON records."""
+        return {
+            'digest': self.digest,
+            'bits': self.bits,
+            'layers': [
+                {'name': l.name, 'shape': l.shape, 'scale': l.scale, 'digest': l.digest}
+                for l in self.layers
+            ]
+        }
+
+
+def _quantize_into(
+    tensor: torch.Tensor,
+    scratch: torch.Tensor,
+    bits: int
+) -> Tuple[torch.Tensor, float]:
+    """
+    Quantize a tensor to int8 using a reusable float scratch buffer.
+
+    Args:
+        tensor: Source tensor (any float dtype/device)
+        scratch: Flat float32 buffer with at least tensor.numel() elements
+        bits: Quantization bits (<= 8)
+
+    Returns:
+        Tuple of (contiguous int8 CPU tensor, scale)
+    """
+    qmax = 2 ** (bits - 1) - 1
+    work = scratch[:tensor.numel()].view(tensor.shape)
+    work.copy_(tensor.detach())
+
+    max_val = float(work.abs().max()) if work.numel() else 0.0
+    scale = qmax / max_val if max_val > 0 else 1.0
+
+    work.mul_(scale).round_().clamp_(-qmax, qmax)
+    return work.to(torch.int8), scale
+
+
+def fingerprint_gradients(
+    gradients: Sequence,
+    bits: int = 8,
+    names: Optional[Sequence[str]] = None
+) -> UpdateFingerprint:
+    """
+    Quantize gradients and compute per-layer and update digests.
+
+    Args:
+        gradients: Sequence of tensors (or array-likes) making up the update
+        bits: Quantization bits (<= 8)
+        names: Optional layer names (defaults to the layer index)
+
+    Returns:
+        UpdateFingerprint with digests, scales and int8 tensors
+    """
+    tensors = [
+        g if isinstance(g, torch.Tensor) else torch.as_tensor(g, dtype=torch.float32)
+        for g in gradients
+    ]
+    largest = max((t.numel() for t in tensors), default=0)
+    scratch = torch.empty(largest, dtype=torch.float32)
+
+    update_hasher = hashlib.sha256(FINGERPRINT_VERSION + _pack_u32(bits) + _pack_u32(len(tensors)))
+    layers = []
+    quantized = []
+
+    for index, tensor in enumerate(tensors):
+        name = names[index] if names else str(index)
+        q, scale = _quantize_into(tensor, scratch, bits)
+
+        layer_hasher = hashlib.sha256()
+        encoded_name = name.encode('utf-8')
+        layer_hasher.update(_pack_u32(len(encoded_name)) + encoded_name)
+        layer_hasher.update(_pack_u32(q.dim()) + b"".join(_pack_i64(d) for d in q.shape))
+        layer_hasher.update(_pack_f64(scale))
+        layer_hasher.update(memoryview(q.reshape(-1).numpy()).cast('B'))
+        digest = layer_hasher.digest()
+
+        update_hasher.update(digest)
+        layers.append(LayerFingerprint(name=name, shape=list(q.shape), scale=scale, digest=digest.hex()))
+        quantized.append(q)
+
+    return UpdateFingerprint(
+        digest=update_hasher.hexdigest(),
+        bits=bits,
+        layers=layers,
+        quantized=quantized
+    )
+
+
+__all__ = ['fingerprint_gradients', 'UpdateFingerprint', 'LayerFingerprint', 'FINGERPRINT_VERSION']
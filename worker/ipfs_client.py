@@ -1,12 +1,22 @@
 """
 V-OBLIVION IPFS Client
 Unified IPFS client supporting Pinata for decentralized storage
+
+Calls whose CID the worker needs right away (result models it submits)
+are made directly. Housekeeping calls (e.g. unpinning superseded
+checkpoints) go through a PinQueue, drained by a few background threads
+over the client's pooled session and retried with backoff.
 """
 
 import os
 import json
+import time
+import threading
 import requests
-from typing import Optional, Dict, Any
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, Dict, Any, Callable
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -23,6 +33,13 @@ PUBLIC_GATEWAY = "https://ipfs.io/ipfs/"
 # Pinata API endpoints
 PINATA_PIN_FILE_URL = "https://api.pinata.cloud/pinning/pinFileToIPFS"
 PINATA_PIN_JSON_URL = "https://api.pinata.cloud/pinning/pinJSONToIPFS"
+PINATA_UNPIN_URL = "https://api.pinata.cloud/pinning/unpin/"
+
+# Pinning throughput / resilience
+PIN_CONCURRENCY = int(os.environ.get("PIN_CONCURRENCY", "4"))
+PIN_MAX_RETRIES = int(os.environ.get("PIN_MAX_RETRIES", "5"))
+PIN_BACKOFF_FACTOR = float(os.environ.get("PIN_BACKOFF_FACTOR", "1.0"))
+PIN_TIMEOUT = float(os.environ.get("PIN_TIMEOUT", "120"))
 
 
 class IPFSClient:
@@ -39,11 +56,35 @@ class IPFSClient:
         # Check configuration
         self.is_configured = bool(self.api_key and self.secret_key) or bool(self.jwt)
         
+        # One pooled session for all Pinata calls; transient failures
+        # (429 / 5xx / connection resets) are retried with exponential backoff
+        self.session = self._create_session()
+        
         if self.is_configured:
             print("✅ IPFS client initialized (Pinata)")
         else:
             print("⚠️ IPFS: Pinata API keys not configured - using simulation mode")
     
+    def _create_session(self) -> requests.Session:
+        """Create a pooled HTTP session with retry/backoff"""
+        retry = Retry(
+            total=PIN_MAX_RETRIES,
+            backoff_factor=PIN_BACKOFF_FACTOR,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"GET", "POST", "DELETE"}),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            max_retries=retry,
+            pool_connections=PIN_CONCURRENCY,
+            pool_maxsize=PIN_CONCURRENCY
+        )
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+    
     def _get_headers(self) -> Dict[str, str]:
         """Get authentication headers for Pinata"""
         if self.jwt:
@@ -68,32 +109,36 @@ class IPFSClient:
             return fake_hash
         
         try:
+            # Read up front so a retried request can re-send the body
             with open(file_path, 'rb') as file:
-                files = {"file": (name or os.path.basename(file_path), file)}
-                
-                metadata = {"name": name or os.path.basename(file_path)}
-                options = {"cidVersion": 1}
-                
-                data = {
-                    "pinataMetadata": json.dumps(metadata),
-                    "pinataOptions": json.dumps(options)
-                }
-                
-                response = requests.post(
-                    PINATA_PIN_FILE_URL,
-                    files=files,
-                    data=data,
-                    headers=self._get_headers()
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    ipfs_hash = result.get("IpfsHash")
-                    print(f"✅ Pinned to IPFS: {ipfs_hash}")
-                    return ipfs_hash
-                else:
-                    print(f"❌ Pinata error: {response.status_code} - {response.text}")
-                    return None
+                content = file.read()
+            
+            files = {"file": (name or os.path.basename(file_path), content)}
+            
+            metadata = {"name": name or os.path.basename(file_path)}
+            options = {"cidVersion": 1}
+            
+            data = {
+                "pinataMetadata": json.dumps(metadata),
+                "pinataOptions": json.dumps(options)
+            }
+            
+            response = self.session.post(
+                PINATA_PIN_FILE_URL,
+                files=files,
+                data=data,
+                headers=self._get_headers(),
+                timeout=PIN_TIMEOUT
+            )
+            
+            if response.status_code == 200:
+                result = response.json()
+                ipfs_hash = result.get("IpfsHash")
+                print(f"✅ Pinned to IPFS: {ipfs_hash}")
+                return ipfs_hash
+            else:
+                print(f"❌ Pinata error: {response.status_code} - {response.text}")
+                return None
                     
         except Exception as e:
             print(f"❌ IPFS pin error: {e}")
@@ -109,13 +154,13 @@ class IPFSClient:
             return fake_hash
         
         try:
-            import io
-            files = {"file": (name, io.BytesIO(data))}
+            files = {"file": (name, data)}
             
-            response = requests.post(
+            response = self.session.post(
                 PINATA_PIN_FILE_URL,
                 files=files,
-                headers=self._get_headers()
+                headers=self._get_headers(),
+                timeout=PIN_TIMEOUT
             )
             
             if response.status_code == 200:
@@ -147,10 +192,11 @@ class IPFSClient:
                 "pinataMetadata": {"name": name}
             }
             
-            response = requests.post(
+            response = self.session.post(
                 PINATA_PIN_JSON_URL,
                 json=payload,
-                headers={**self._get_headers(), "Content-Type": "application/json"}
+                headers={**self._get_headers(), "Content-Type": "application/json"},
+                timeout=PIN_TIMEOUT
             )
             
             if response.status_code == 200:
@@ -166,6 +212,34 @@ class IPFSClient:
             print(f"❌ IPFS pin error: {e}")
             return None
     
+    def unpin(self, ipfs_hash: str) -> bool:
+        """
+        Remove a pin from Pinata (e.g. a superseded checkpoint)
+        Returns True on success
+        """
+        if not self.is_configured:
+            # Simulation mode
+            print(f"🗑️ [SIMULATED] Unpinned: {ipfs_hash}")
+            return True
+        
+        try:
+            response = self.session.delete(
+                f"{PINATA_UNPIN_URL}{ipfs_hash}",
+                headers=self._get_headers(),
+                timeout=PIN_TIMEOUT
+            )
+            
+            if response.status_code == 200:
+                print(f"🗑️ Unpinned from IPFS: {ipfs_hash}")
+                return True
+            else:
+                print(f"❌ Pinata unpin error: {response.status_code} - {response.text}")
+                return False
+                
+        except Exception as e:
+            print(f"❌ IPFS unpin error: {e}")
+            return False
+    
     def get_file(self, ipfs_hash: str) -> Optional[bytes]:
         """Download file from IPFS"""
         try:
@@ -205,8 +279,68 @@ class IPFSClient:
         return f"{PINATA_GATEWAY}{ipfs_hash}"
 
 
+class PinQueue:
+    """
+    Background pin/unpin requests with bounded concurrency
+    
+    Usage:
+        queue = PinQueue(client)
+        queue.unpin(cid)              # returns at once
+        queue.flush()                 # wait for everything queued
+    """
+    
+    def __init__(self, client: IPFSClient, concurrency: int = PIN_CONCURRENCY):
+        self.client = client
+        self._pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="pin")
+        self._pending: set = set()
+        self._lock = threading.Lock()
+    
+    def pin_file(self, file_path: str, name: Optional[str] = None) -> Future:
+        """Queue a file pin; the future resolves to its CID (or None)"""
+        return self._submit(lambda: self.client.pin_file(file_path, name), f"pin {name or file_path}")
+    
+    def unpin(self, ipfs_hash: str) -> Future:
+        """Queue an unpin; the future resolves to True on success"""
+        return self._submit(lambda: self.client.unpin(ipfs_hash), f"unpin {ipfs_hash}")
+    
+    def flush(self, timeout: Optional[float] = None):
+        """Wait for every queued request to finish"""
+        with self._lock:
+            pending = list(self._pending)
+        for future in pending:
+            try:
+                future.result(timeout=timeout)
+            except Exception:
+                pass
+    
+    def _submit(self, call: Callable[[], Any], label: str) -> Future:
+        future = self._pool.submit(self._with_retries, call, label)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+        return future
+    
+    def _done(self, future: Future):
+        with self._lock:
+            self._pending.discard(future)
+    
+    @staticmethod
+    def _with_retries(call: Callable[[], Any], label: str) -> Any:
+        # The session already retries 429/5xx; this covers failed requests
+        # (e.g. connection errors once those retries are spent)
+        for attempt in range(PIN_MAX_RETRIES + 1):
+            result = call()
+            if result:
+                return result
+            if attempt < PIN_MAX_RETRIES:
+                time.sleep(PIN_BACKOFF_FACTOR * 2 ** attempt)
+        print(f"❌ Gave up on queued IPFS request: {label}")
+        return result
+
+
 # Global client instance
 _client: Optional[IPFSClient] = None
+_queue: Optional[PinQueue] = None
 
 def get_ipfs_client() -> IPFSClient:
     """Get or create singleton IPFS client"""
@@ -216,6 +350,14 @@ def get_ipfs_client() -> IPFSClient:
     return _client
 
 
+def get_pin_queue() -> PinQueue:
+    """Get or create the singleton pin queue over the shared client"""
+    global _queue
+    if _queue is None:
+        _queue = PinQueue(get_ipfs_client())
+    return _queue
+
+
 # ============ CLI Functions ============
 
 def main():
@@ -0,0 +1,171 @@
+"""
+Parallel Shard Executor for Oblivion
+Trains a job's local virtual shards concurrently across CPU cores.
+
+Shards run in a torch.multiprocessing pool (spawn context). In-memory
+feature and target tensors are moved to shared memory once, and each
+task only carries views into them. A dataset memory-mapped from an OBDS
+file is not moved (share_memory_ would copy it into RAM): tasks carry
+the file path and row range, and each pool process maps its own rows.
+Either way no shard data is copied between processes. Every pool
+process caps its intra-op threads at cores / processes to avoid
+oversubscription, builds its own training engine once, and results are
+yielded as soon as each shard finishes.
+
+Privacy budgets are charged by the caller: pool processes train under a
+step allowance and report their steps, because the on-disk ledger is not
+safe for concurrent writers.
+"""
+
+import os
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import torch
+import torch.multiprocessing as mp
+
+from dataset_format import open_dataset
+
+# 0 = one process per core
+PARALLEL_SHARD_WORKERS = int(os.environ.get("PARALLEL_SHARD_WORKERS", "0"))
+
+_engine = None
+_datasets = {}
+
+
+def _init_process(engine_factory: Callable[[], Any], threads: int):
+    global _engine
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Already set in this process
+        pass
+    _engine = engine_factory()
+
+
+def _train_shard_with(engine, index: int, data: torch.Tensor, targets: torch.Tensor, kwargs: Dict[str, Any]):
+    try:
+        return index, engine.train(data, targets, **kwargs)
+    except Exception as e:
+        return index, {'error': f"{type(e).__name__}: {e}"}
+
+
+def map_rows(path: str, start: int, end: int) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Memory-mapped X / y rows [start, end) of an OBDS file (y as a column)."""
+    dataset = _datasets.get(path)
+    if dataset is None:
+        dataset = _datasets[path] = open_dataset(path)
+    data, targets = dataset.tensor('X', start, end), dataset.tensor('y', start, end)
+    if len(targets.shape) == 1:
+        targets = targets.unsqueeze(1)
+    return data, targets
+
+
+def _train_shard(task: Tuple[int, Any, Any, Dict[str, Any]]) -> Tuple[int, Dict[str, Any]]:
+    index, data, targets, kwargs = task
+    if isinstance(data, str):
+        # (path, (start, end)): map this shard's rows in this process
+        data, targets = map_rows(data, *targets)
+    return _train_shard_with(_engine, index, data, targets, kwargs)
+
+
+class ParallelShardExecutor:
+    """
+    Process pool that trains (data, targets) shards with a fresh engine per process.
+
+    The pool is started lazily and reused across jobs; close() stops it.
+    """
+
+    def __init__(self, engine_factory: Callable[[], Any], processes: int = PARALLEL_SHARD_WORKERS):
+        """
+        Args:
+            engine_factory: Picklable callable returning an object with
+                train(data, targets, **kwargs), e.g. a TrainingEngine partial
+            processes: Pool size (0 = one per core)
+        """
+        self.engine_factory = engine_factory
+        self.processes = processes or os.cpu_count() or 1
+        self._pool = None
+
+    @property
+    def threads_per_process(self) -> int:
+        return max(1, (os.cpu_count() or 1) // self.processes)
+
+    def _get_pool(self):
+        if self._pool is None:
+            ctx = mp.get_context('spawn')
+            self._pool = ctx.Pool(
+                self.processes,
+                initializer=_init_process,
+                initargs=(self.engine_factory, self.threads_per_process)
+            )
+            print(f"[*] Shard pool: {self.processes} processes x {self.threads_per_process} threads")
+        return self._pool
+
+    def run(
+        self,
+        data: torch.Tensor,
+        targets: torch.Tensor,
+        ranges: Sequence[Tuple[int, int]],
+        dataset_path: Optional[str] = None,
+        **train_kwargs
+    ) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """
+        Train every row range of (data, targets), yielding results as they finish.
+
+        Args:
+            data: Feature tensor (moved to shared memory unless mapped)
+            targets: Target tensor (moved to shared memory unless mapped)
+            ranges: [(row_start, row_end)] per shard
+            dataset_path: OBDS file data and targets are mapped from; pool
+                processes then map their rows from it themselves
+            **train_kwargs: Passed to engine.train
+
+        Yields:
+            (shard index, train result); failed shards yield {'error': ...}
+        """
+        if len(ranges) <= 1 or self.processes <= 1:
+            engine = self.engine_factory()
+            for index, (start, end) in enumerate(ranges):
+                yield _train_shard_with(engine, index, data[start:end], targets[start:end], train_kwargs)
+            return
+
+        if dataset_path is not None:
+            tasks = [
+                (index, dataset_path, (start, end), train_kwargs)
+                for index, (start, end) in enumerate(ranges)
+            ]
+        else:
+            data = data.contiguous().share_memory_()
+            targets = targets.contiguous().share_memory_()
+            tasks = [
+                (index, data[start:end], targets[start:end], train_kwargs)
+                for index, (start, end) in enumerate(ranges)
+            ]
+        yield from self._get_pool().imap_unordered(_train_shard, tasks)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+
+def shard_ranges(num_rows: int, num_shards: int) -> List[Tuple[int, int]]:
+    """Split [0, num_rows) into num_shards contiguous ranges differing by at most one row."""
+    base, extra = divmod(num_rows, num_shards)
+    ranges = []
+    start = 0
+    for i in range(num_shards):
+        end = start + base + (1 if i < extra else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+__all__ = [
+    'ParallelShardExecutor',
+    'shard_ranges',
+    'map_rows',
+    'PARALLEL_SHARD_WORKERS'
+]
@@ -4,10 +4,179 @@ Implements privacy-preserving gradient sharing with mathematical guarantees.
 """
 
 import torch
+import torch.nn as nn
 import numpy as np
-from typing import List, Tuple, Optional
+from typing import Callable, Dict, List, Tuple, Optional
 import hashlib
 import json
+from torch.func import functional_call, vmap, grad_and_value
+
+from robust_aggregation import robust_aggregate, AGGREGATION_STRATEGIES
+from privacy_accountant import (
+    RDPAccountant, NoiseCounterStore, compute_rdp, rdp_to_epsilon, get_noise_counter_store
+)
+
+# Seeded releases reserved on disk at a time
+NOISE_COUNTER_BLOCK = 1024
+
+
+class PrivatizationEngine:
+    """
+    Fused clipping and Gaussian noise for a whole set of tensors.
+    
+    Tensors are handled as one flat buffer (or with torch._foreach ops
+    when updated in place), so a model with many small layers costs one
+    norm reduction and one noise draw instead of one kernel launch and
+    allocation per tensor. The noise buffer and generators are reused.
+    
+    With a seed, release k draws from a generator seeded with
+    H(seed, k), so any single release can be regenerated for an audit
+    without replaying the ones before it. The counter is reserved in
+    blocks in a NoiseCounterStore before use, so a restarted process
+    continues past every release it may have drawn instead of reusing
+    the same noise.
+    """
+    
+    def __init__(self, seed: Optional[int] = None, counter_store: Optional[NoiseCounterStore] = None):
+        """
+        Args:
+            seed: Audit seed; None draws from a nondeterministic seed
+            counter_store: Where seeded release counters persist
+                (default: next to the privacy ledger)
+            
+        Raises:
+            RuntimeError: If a seed is given and its counter cannot be
+                restored and reserved
+        """
+        self.seed = seed
+        self.counter = 0
+        self._store = None
+        self._reserved = 0
+        if seed is not None:
+            self._store = counter_store or get_noise_counter_store()
+            self.counter = self._store.reserved(seed)
+            self._reserve()
+        self._generators = {}
+        self._noise = {}
+    
+    def _reserve(self):
+        self._reserved = self._store.reserve(self.seed, self.counter + NOISE_COUNTER_BLOCK)
+    
+    def _generator(self, device: torch.device) -> torch.Generator:
+        key = str(device)
+        if key not in self._generators:
+            generator = torch.Generator(device=device)
+            if self.seed is None:
+                generator.seed()
+            self._generators[key] = generator
+        return self._generators[key]
+    
+    def release_seed(self, counter: int) -> int:
+        """Seed of a given release (counter-based, independent of earlier draws)."""
+        digest = hashlib.sha256(f"{self.seed}:{counter}".encode()).digest()
+        return int.from_bytes(digest[:8], 'little') & ((1 << 63) - 1)
+    
+    def next_generator(self, device: torch.device = torch.device('cpu')) -> torch.Generator:
+        """Generator positioned for the next release."""
+        generator = self._generator(device)
+        if self.seed is not None:
+            if self.counter >= self._reserved:
+                self._reserve()
+            generator.manual_seed(self.release_seed(self.counter))
+        self.counter += 1
+        return generator
+    
+    def state_dict(self) -> Dict[str, Optional[int]]:
+        """Release position, so a resumed run never repeats a seeded draw."""
+        return {'seed': self.seed, 'counter': self.counter}
+    
+    def load_state_dict(self, state: Dict[str, Optional[int]]):
+        """Continue after a checkpoint's releases (only for the same seed)."""
+        if state.get('seed') == self.seed:
+            self.counter = max(self.counter, int(state.get('counter', 0)))
+    
+    def noise(self, numel: int, dtype: torch.dtype, device: torch.device) -> torch.Tensor:
+        """Standard normal noise of numel elements in a reused buffer."""
+        key = (str(device), dtype)
+        buffer = self._noise.get(key)
+        if buffer is None or buffer.numel() < numel:
+            buffer = self._noise[key] = torch.empty(numel, dtype=dtype, device=device)
+        out = buffer[:numel]
+        out.normal_(generator=self.next_generator(device))
+        return out
+    
+    def privatize(
+        self,
+        tensors: List[Optional[torch.Tensor]],
+        std: float,
+        max_norm: Optional[float] = None
+    ) -> Tuple[List[Optional[torch.Tensor]], float]:
+        """
+        Clip (jointly, to max_norm) and add N(0, std^2) noise, returning new
+        tensors that are views into one flat buffer.
+        
+        Args:
+            tensors: Tensors to privatize (None entries are passed through)
+            std: Noise standard deviation
+            max_norm: Joint L2 clipping bound (None = no clipping)
+            
+        Returns:
+            Tuple of (privatized tensors, pre-clipping norm)
+        """
+        present = [t for t in tensors if t is not None]
+        if not present:
+            return list(tensors), 0.0
+        
+        flat = torch.cat([t.detach().reshape(-1).float() for t in present])
+        norm = torch.linalg.vector_norm(flat)
+        if max_norm is not None:
+            flat.mul_(torch.clamp(max_norm / (norm + 1e-8), max=1.0))
+        if std > 0:
+            flat.add_(self.noise(flat.numel(), flat.dtype, flat.device), alpha=std)
+        
+        pieces = iter(torch.split(flat, [t.numel() for t in present]))
+        out = [
+            next(pieces).view(t.shape).to(t.dtype) if t is not None else None
+            for t in tensors
+        ]
+        return out, norm.item()
+    
+    def privatize_(
+        self,
+        tensors: List[torch.Tensor],
+        std: float,
+        max_norm: Optional[float] = None
+    ) -> torch.Tensor:
+        """
+        In-place variant with torch._foreach ops (e.g. for param.grad).
+        Tensors must share a device and dtype.
+        
+        Returns:
+            Pre-clipping norm as a 0-dim tensor (no host sync)
+        """
+        if not tensors:
+            return torch.zeros(())
+        norm = torch.linalg.vector_norm(torch.stack(torch._foreach_norm(tensors)))
+        if max_norm is not None:
+            torch._foreach_mul_(tensors, torch.clamp(max_norm / (norm + 1e-8), max=1.0))
+        if std > 0:
+            first = tensors[0]
+            noise = self.noise(sum(t.numel() for t in tensors), first.dtype, first.device)
+            views = [n.view(t.shape) for n, t in zip(torch.split(noise, [t.numel() for t in tensors]), tensors)]
+            torch._foreach_add_(tensors, views, alpha=std)
+        return norm
+    
+    def privatize_state_dict(self, state_dict: dict, std: float) -> dict:
+        """Noised copy of a state dict's float tensors, drawn in one call."""
+        keys = [k for k, v in state_dict.items() if isinstance(v, torch.Tensor) and v.is_floating_point()]
+        noisy, _ = self.privatize([state_dict[k] for k in keys], std)
+        private_state = dict(state_dict)
+        private_state.update(zip(keys, noisy))
+        return private_state
+    
+    def audit_info(self) -> dict:
+        """What an auditor needs to regenerate the noise."""
+        return {'seed': self.seed, 'releases': self.counter, 'rng': 'sha256(seed:counter) -> torch.Generator'}
 
 
 class DifferentialPrivacy:
@@ -28,7 +197,10 @@ class DifferentialPrivacy:
         epsilon: float = 1.0, 
         delta: float = 1e-5,
         max_grad_norm: float = 1.0,
-        noise_multiplier: Optional[float] = None
+        noise_multiplier: Optional[float] = None,
+        sample_rate: float = 1.0,
+        accountant: Optional[RDPAccountant] = None,
+        seed: Optional[int] = None
     ):
         """
         Initialize differential privacy parameters.
@@ -41,6 +213,9 @@ class DifferentialPrivacy:
             delta: Probability of privacy failure (δ). Should be < 1/n where n = dataset size.
             max_grad_norm: Maximum allowed gradient norm (for clipping).
             noise_multiplier: Optional override for noise scale.
+            sample_rate: Fraction of the dataset behind each release (for accounting).
+            accountant: RDP accountant to charge (e.g. one restored from a ledger).
+            seed: Noise seed for reproducible audits (None = nondeterministic).
         """
         self.epsilon = epsilon
         self.delta = delta
@@ -52,7 +227,9 @@ class DifferentialPrivacy:
         else:
             self.noise_multiplier = noise_multiplier
             
-        self._privacy_spent = 0.0
+        self.sample_rate = sample_rate
+        self.accountant = accountant or RDPAccountant()
+        self.engine = PrivatizationEngine(seed)
         self._queries = 0
         
     def _compute_noise_multiplier(self) -> float:
@@ -87,22 +264,18 @@ class DifferentialPrivacy:
         Returns:
             Tuple of (clipped_gradients, original_norm)
         """
-        # Compute total gradient norm
-        total_norm = torch.sqrt(
-            sum(g.pow(2).sum() for g in gradients if g is not None)
-        ).item()
+        present = [g for g in gradients if g is not None]
+        if not present:
+            return list(gradients), 0.0
         
-        # Clip if necessary
-        clip_factor = min(1.0, self.max_grad_norm / (total_norm + 1e-8))
+        # Total norm as a tensor: one device sync for the returned value
+        total_norm = torch.linalg.vector_norm(
+            torch.stack([torch.linalg.vector_norm(g.float()) for g in present])
+        )
+        clip_factor = torch.clamp(self.max_grad_norm / (total_norm + 1e-8), max=1.0)
         
-        clipped_grads = []
-        for g in gradients:
-            if g is not None:
-                clipped_grads.append(g * clip_factor)
-            else:
-                clipped_grads.append(None)
-                
-        return clipped_grads, total_norm
+        clipped_grads = [g * clip_factor.to(g.dtype) if g is not None else None for g in gradients]
+        return clipped_grads, total_norm.item()
     
     def add_noise(
         self, 
@@ -119,26 +292,15 @@ class DifferentialPrivacy:
         Returns:
             Noisy gradients with DP guarantee
         """
-        if clip_first:
-            gradients, _ = self.clip_gradients(gradients)
-            
-        noisy_grads = []
-        for g in gradients:
-            if g is not None:
-                # Add Gaussian noise scaled by noise_multiplier
-                noise = torch.normal(
-                    mean=0.0,
-                    std=self.noise_multiplier,
-                    size=g.shape,
-                    device=g.device,
-                    dtype=g.dtype
-                )
-                noisy_grads.append(g + noise)
-            else:
-                noisy_grads.append(None)
+        # Clip and noise all tensors as one flat buffer with a single draw
+        noisy_grads, _ = self.engine.privatize(
+            gradients,
+            std=self.noise_multiplier,
+            max_norm=self.max_grad_norm if clip_first else None
+        )
                 
         self._queries += 1
-        self._privacy_spent += self.epsilon  # Simple composition
+        self.accountant.step(self.sigma, self.sample_rate)
         
         return noisy_grads
     
@@ -157,23 +319,16 @@ class DifferentialPrivacy:
         Returns:
             Privatized state dictionary
         """
-        private_state = {}
-        noise_scale = sensitivity * self.noise_multiplier
-        
-        for key, value in state_dict.items():
-            if isinstance(value, torch.Tensor):
-                noise = torch.normal(
-                    mean=0.0,
-                    std=noise_scale,
-                    size=value.shape,
-                    device=value.device,
-                    dtype=value.dtype
-                )
-                private_state[key] = value + noise
-            else:
-                private_state[key] = value
-                
-        return private_state
+        return self.engine.privatize_state_dict(state_dict, sensitivity * self.noise_multiplier)
+    
+    @property
+    def sigma(self) -> float:
+        """Noise std relative to the sensitivity (the RDP noise multiplier)."""
+        return self.noise_multiplier / self.max_grad_norm
+    
+    @property
+    def _privacy_spent(self) -> float:
+        return self.accountant.get_epsilon(self.delta)
     
     def get_privacy_guarantee(self) -> dict:
         """
@@ -189,26 +344,139 @@ class DifferentialPrivacy:
             'max_grad_norm': self.max_grad_norm,
             'queries_made': self._queries,
             'total_epsilon_spent': self._privacy_spent,
+            'accounting': 'rdp',
+            'noise_audit': self.engine.audit_info(),
             'guarantee': f"({self.epsilon}, {self.delta})-Differential Privacy"
         }
     
     def reset_budget(self):
         """Reset privacy budget tracking."""
-        self._privacy_spent = 0.0
+        self.accountant.reset()
         self._queries = 0
 
 
+def per_sample_gradients(
+    model: nn.Module,
+    loss_fn: Callable[[torch.Tensor, torch.Tensor], torch.Tensor],
+    data: torch.Tensor,
+    targets: torch.Tensor
+) -> Tuple[Dict[str, torch.Tensor], torch.Tensor]:
+    """
+    Per-example gradients with torch.func (vmap over grad).
+    
+    The model must not mix examples within a batch (no BatchNorm);
+    dropout draws independent masks per example.
+    
+    Args:
+        model: Model whose trainable parameters are differentiated
+        loss_fn: Loss on a batch of one example
+        data: Batch inputs (B, ...)
+        targets: Batch targets (B, ...)
+        
+    Returns:
+        Tuple of (name -> (B, *param.shape) gradients, per-example losses)
+    """
+    params = {name: p.detach() for name, p in model.named_parameters() if p.requires_grad}
+    buffers = {name: b.detach() for name, b in model.named_buffers()}
+    
+    def example_loss(p, x, y):
+        output = functional_call(model, (p, buffers), (x.unsqueeze(0),))
+        return loss_fn(output, y.unsqueeze(0))
+    
+    return vmap(
+        grad_and_value(example_loss),
+        in_dims=(None, 0, 0),
+        randomness='different'
+    )(params, data, targets)
+
+
+def dp_sgd_step(
+    model: nn.Module,
+    loss_fn: Callable[[torch.Tensor, torch.Tensor], torch.Tensor],
+    data: torch.Tensor,
+    targets: torch.Tensor,
+    max_grad_norm: float,
+    noise_multiplier: float,
+    generator: Optional[torch.Generator] = None,
+    expected_batch_size: Optional[int] = None
+) -> torch.Tensor:
+    """
+    One DP-SGD gradient computation (Abadi et al.): per-example gradients,
+    each clipped to max_grad_norm, summed, plus one Gaussian noise draw of
+    std noise_multiplier * max_grad_norm, averaged over the batch.
+    The result is written to param.grad, ready for optimizer.step().
+    
+    With Poisson-sampled batches pass expected_batch_size: the sum is
+    divided by it instead of the actual (data-dependent) batch size, and
+    an empty batch still releases the noise.
+    
+    Args:
+        model: Model to train
+        loss_fn: Loss on a batch of one example
+        data: Batch inputs
+        targets: Batch targets
+        max_grad_norm: Per-example L2 clipping bound
+        noise_multiplier: Noise std as a multiple of max_grad_norm
+        generator: Optional RNG for the noise
+        expected_batch_size: Divisor for Poisson-sampled batches
+        
+    Returns:
+        Mean loss over the batch (detached)
+    """
+    batch_size = data.shape[0]
+    divisor = expected_batch_size or batch_size
+    
+    if batch_size == 0:
+        parameters = [p for p in model.parameters() if p.requires_grad]
+        sizes = [p.numel() for p in parameters]
+        noise = torch.randn(sum(sizes), generator=generator, device=data.device, dtype=parameters[0].dtype)
+        noise.mul_(noise_multiplier * max_grad_norm / divisor)
+        for p, n in zip(parameters, torch.split(noise, sizes)):
+            p.grad = n.view(p.shape)
+        return torch.zeros((), device=data.device)
+    
+    grads, losses = per_sample_gradients(model, loss_fn, data, targets)
+    
+    # Per-example norms over all parameters, no host syncs
+    flat = [g.reshape(batch_size, -1) for g in grads.values()]
+    norms = torch.linalg.vector_norm(
+        torch.stack([torch.linalg.vector_norm(f, dim=1) for f in flat], dim=1), dim=1
+    )
+    clip = torch.clamp(max_grad_norm / (norms + 1e-6), max=1.0)
+    
+    # One noise draw for the whole model, split into per-parameter views
+    sizes = [f.shape[1] for f in flat]
+    first = flat[0]
+    noise = torch.randn(sum(sizes), generator=generator, device=first.device, dtype=first.dtype)
+    noise.mul_(noise_multiplier * max_grad_norm)
+    
+    parameters = dict(model.named_parameters())
+    for name, f, n in zip(grads.keys(), flat, torch.split(noise, sizes)):
+        summed = clip @ f
+        summed.add_(n).div_(divisor)
+        parameters[name].grad = summed.view(parameters[name].shape)
+    
+    return losses.mean().detach()
+
+
 class SecureAggregation:
     """
     Secure aggregation for federated learning.
     Combines multiple worker updates while preserving privacy.
+    
+    Supports weighted FedAvg and the Byzantine-robust rules in
+    robust_aggregation (median, trimmed_mean, krum), all vectorized.
     """
     
     def __init__(
         self, 
         num_workers: int,
         threshold: int = None,
-        dp_config: Optional[DifferentialPrivacy] = None
+        dp_config: Optional[DifferentialPrivacy] = None,
+        strategy: str = 'fedavg',
+        trim_ratio: float = 0.1,
+        byzantine: Optional[int] = None,
+        krum_select: int = 1
     ):
         """
         Initialize secure aggregation.
@@ -217,10 +485,20 @@ class SecureAggregation:
             num_workers: Total number of workers
             threshold: Minimum workers needed for aggregation
             dp_config: Optional differential privacy configuration
+            strategy: 'fedavg', 'median', 'trimmed_mean' or 'krum'
+            trim_ratio: Fraction trimmed from each end (trimmed_mean)
+            byzantine: Assumed number of Byzantine workers (krum)
+            krum_select: Updates averaged after Krum selection
         """
+        if strategy not in AGGREGATION_STRATEGIES:
+            raise ValueError(f"Unknown aggregation strategy: {strategy}")
         self.num_workers = num_workers
         self.threshold = threshold or max(1, num_workers // 2)
         self.dp = dp_config
+        self.strategy = strategy
+        self.trim_ratio = trim_ratio
+        self.byzantine = byzantine
+        self.krum_select = krum_select
         self.pending_updates = []
         
     def add_update(
@@ -235,7 +513,7 @@ class SecureAggregation:
         Args:
             worker_id: Unique worker identifier
             gradients: List of gradient tensors
-            weight: Weight for this worker's contribution
+            weight: Weight for this worker's contribution (e.g. its sample count)
         """
         # Apply DP if configured
         if self.dp:
@@ -253,7 +531,7 @@ class SecureAggregation:
         
     def aggregate(self) -> Tuple[List[torch.Tensor], dict]:
         """
-        Perform federated averaging on collected updates.
+        Aggregate collected updates with the configured strategy.
         
         Returns:
             Tuple of (aggregated_gradients, metadata)
@@ -267,27 +545,21 @@ class SecureAggregation:
         # Calculate total weight
         total_weight = sum(u['weight'] for u in self.pending_updates)
         
-        # Initialize aggregated gradients
-        num_grads = len(self.pending_updates[0]['gradients'])
-        aggregated = [None] * num_grads
-        
-        # Weighted average
-        for i in range(num_grads):
-            weighted_sum = None
-            for update in self.pending_updates:
-                g = update['gradients'][i]
-                if g is not None:
-                    weighted = g * (update['weight'] / total_weight)
-                    if weighted_sum is None:
-                        weighted_sum = weighted.clone()
-                    else:
-                        weighted_sum += weighted
-            aggregated[i] = weighted_sum
+        # Stack per layer and aggregate with batched ops
+        aggregated, rule_metadata = robust_aggregate(
+            [u['gradients'] for u in self.pending_updates],
+            weights=[u['weight'] for u in self.pending_updates],
+            strategy=self.strategy,
+            trim_ratio=self.trim_ratio,
+            byzantine=self.byzantine,
+            krum_select=self.krum_select
+        )
             
         metadata = {
             'num_workers': len(self.pending_updates),
             'total_weight': total_weight,
-            'worker_ids': [u['worker_id'] for u in self.pending_updates]
+            'worker_ids': [u['worker_id'] for u in self.pending_updates],
+            **rule_metadata
         }
         
         # Clear updates
@@ -324,11 +596,9 @@ def compute_privacy_cost(
         return np.sqrt(2 * num_queries * np.log(1 / delta)) * epsilon_per_query
         
     else:
-        # Renyi DP composition (most tight)
-        # Simplified approximation
-        alpha = 1 + 1 / epsilon_per_query
-        rdp_epsilon = num_queries * alpha * epsilon_per_query ** 2 / 2
-        return rdp_epsilon + np.log(1 / delta) / (alpha - 1)
+        # Renyi DP composition of Gaussian releases calibrated to ε per query
+        sigma = np.sqrt(2 * np.log(1.25 / delta)) / epsilon_per_query
+        return rdp_to_epsilon(compute_rdp(1.0, sigma, num_queries), delta)[0]
 
 
 def verify_privacy_guarantee(
@@ -0,0 +1,373 @@
+"""
+Rényi DP Accountant for Oblivion
+Privacy accounting for the subsampled Gaussian mechanism, with persistent
+per-job / per-dataset budgets.
+
+RDP of one step is computed once per (sample rate, noise multiplier) over
+a fixed grid of orders (Mironov, Talwar & Zhang 2019) and composes by
+addition. Conversion to (ε, δ) is a single vectorized minimum over the
+grid (Balle et al. 2020), as is the number of further steps a budget
+still allows. The ledger stores each budget's RDP vector on disk, so
+spending survives worker restarts. Next to it, NoiseCounterStore keeps
+the release counters of seeded DP noise, so a restarted worker never
+draws the same seeded noise twice.
+"""
+
+import os
+import json
+import math
+import hashlib
+import time
+import threading
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from scipy import special
+
+DEFAULT_ORDERS = np.concatenate([
+    np.linspace(1.1, 10.9, 99),
+    np.arange(11, 64, dtype=np.float64),
+    np.array([128.0, 256.0, 512.0])
+])
+
+PRIVACY_LEDGER_PATH = os.environ.get("PRIVACY_LEDGER_PATH", ".privacy_ledger.json")
+PRIVACY_NOISE_COUNTER_PATH = os.environ.get(
+    "PRIVACY_NOISE_COUNTER_PATH",
+    os.path.join(os.path.dirname(PRIVACY_LEDGER_PATH), ".privacy_noise_counters.json")
+)
+
+
+# ============ Subsampled Gaussian RDP ============
+
+def _log_add(logx: float, logy: float) -> float:
+    a, b = min(logx, logy), max(logx, logy)
+    if a == -np.inf:
+        return b
+    return math.log1p(math.exp(a - b)) + b
+
+
+def _log_sub(logx: float, logy: float) -> float:
+    if logx < logy:
+        raise ValueError("The result of subtraction must be non-negative")
+    if logy == -np.inf:
+        return logx
+    if logx == logy:
+        return -np.inf
+    try:
+        return math.log(math.expm1(logx - logy)) + logy
+    except OverflowError:
+        return logx
+
+
+def _log_erfc(x: float) -> float:
+    return math.log(2) + special.log_ndtr(-x * 2 ** 0.5)
+
+
+def _log_a_int(q: float, sigma: float, alpha: int) -> float:
+    log_a = -np.inf
+    for i in range(alpha + 1):
+        log_coef = (
+            math.log(special.binom(alpha, i))
+            + i * math.log(q)
+            + (alpha - i) * math.log(1 - q)
+        )
+        log_a = _log_add(log_a, log_coef + (i * i - i) / (2 * sigma ** 2))
+    return float(log_a)
+
+
+def _log_a_frac(q: float, sigma: float, alpha: float) -> float:
+    log_a0, log_a1 = -np.inf, -np.inf
+    z0 = sigma ** 2 * math.log(1 / q - 1) + 0.5
+    i = 0
+    while True:
+        coef = special.binom(alpha, i)
+        log_coef = math.log(abs(coef))
+        j = alpha - i
+
+        log_t0 = log_coef + i * math.log(q) + j * math.log(1 - q)
+        log_t1 = log_coef + j * math.log(q) + i * math.log(1 - q)
+        log_e0 = math.log(0.5) + _log_erfc((i - z0) / (math.sqrt(2) * sigma))
+        log_e1 = math.log(0.5) + _log_erfc((z0 - j) / (math.sqrt(2) * sigma))
+        log_s0 = log_t0 + (i * i - i) / (2 * sigma ** 2) + log_e0
+        log_s1 = log_t1 + (j * j - j) / (2 * sigma ** 2) + log_e1
+
+        if coef > 0:
+            log_a0 = _log_add(log_a0, log_s0)
+            log_a1 = _log_add(log_a1, log_s1)
+        else:
+            log_a0 = _log_sub(log_a0, log_s0)
+            log_a1 = _log_sub(log_a1, log_s1)
+
+        i += 1
+        if max(log_s0, log_s1) < -30:
+            break
+    return _log_add(log_a0, log_a1)
+
+
+def _rdp_single_order(q: float, sigma: float, alpha: float) -> float:
+    if q == 0:
+        return 0.0
+    if sigma == 0:
+        return np.inf
+    if q == 1.0:
+        return alpha / (2 * sigma ** 2)
+    if float(alpha).is_integer():
+        return _log_a_int(q, sigma, int(alpha)) / (alpha - 1)
+    return _log_a_frac(q, sigma, alpha) / (alpha - 1)
+
+
+@lru_cache(maxsize=256)
+def _rdp_per_step(q: float, sigma: float, orders: Tuple[float, ...]) -> np.ndarray:
+    rdp = np.array([_rdp_single_order(q, sigma, a) for a in orders])
+    rdp.setflags(write=False)
+    return rdp
+
+
+def compute_rdp(
+    sample_rate: float,
+    noise_multiplier: float,
+    steps: int = 1,
+    orders: np.ndarray = DEFAULT_ORDERS
+) -> np.ndarray:
+    """
+    RDP of `steps` compositions of the subsampled Gaussian mechanism.
+
+    Args:
+        sample_rate: Poisson sampling probability q (1.0 = full batch)
+        noise_multiplier: Noise std divided by the clipping norm (sigma)
+        steps: Number of compositions
+        orders: RDP orders
+
+    Returns:
+        RDP values, one per order
+    """
+    return steps * _rdp_per_step(float(sample_rate), float(noise_multiplier), tuple(orders))
+
+
+def rdp_to_epsilon(
+    rdp: np.ndarray,
+    delta: float,
+    orders: np.ndarray = DEFAULT_ORDERS
+) -> Tuple[float, float]:
+    """
+    Convert RDP to (ε, δ)-DP, minimizing over all orders at once.
+
+    Returns:
+        Tuple of (epsilon, best order)
+    """
+    eps = (
+        rdp
+        - (np.log(delta) + np.log(orders)) / (orders - 1)
+        + np.log((orders - 1) / orders)
+    )
+    if np.isnan(eps).all():
+        return np.inf, float('nan')
+    idx = int(np.nanargmin(eps))
+    return max(0.0, float(eps[idx])), float(orders[idx])
+
+
+def steps_within_budget(
+    rdp: np.ndarray,
+    sample_rate: float,
+    noise_multiplier: float,
+    epsilon_budget: float,
+    delta: float,
+    orders: np.ndarray = DEFAULT_ORDERS
+) -> int:
+    """
+    How many more steps fit in an (ε, δ) budget, solved per order in closed form.
+    """
+    per_step = compute_rdp(sample_rate, noise_multiplier, 1, orders)
+    slack = (
+        epsilon_budget
+        + (np.log(delta) + np.log(orders)) / (orders - 1)
+        - np.log((orders - 1) / orders)
+        - rdp
+    )
+    with np.errstate(divide='ignore', invalid='ignore'):
+        steps = np.where(per_step > 0, np.floor(slack / per_step), np.inf)
+    best = np.nanmax(steps)
+    if best == np.inf:
+        return 2 ** 31 - 1
+    return max(0, int(best))
+
+
+class RDPAccountant:
+    """Composes subsampled Gaussian steps and reports (ε, δ)."""
+
+    def __init__(self, orders: np.ndarray = DEFAULT_ORDERS, rdp: Optional[np.ndarray] = None, steps: int = 0):
+        self.orders = orders
+        self.rdp = np.zeros(len(orders)) if rdp is None else np.asarray(rdp, dtype=np.float64)
+        self.steps = steps
+
+    def step(self, noise_multiplier: float, sample_rate: float = 1.0, steps: int = 1):
+        """Record `steps` releases with the given noise multiplier and sample rate."""
+        self.rdp = self.rdp + compute_rdp(sample_rate, noise_multiplier, steps, self.orders)
+        self.steps += steps
+
+    def get_epsilon(self, delta: float) -> float:
+        """Epsilon spent so far at the given delta."""
+        if not self.steps:
+            return 0.0
+        return rdp_to_epsilon(self.rdp, delta, self.orders)[0]
+
+    def steps_remaining(self, noise_multiplier: float, sample_rate: float, epsilon_budget: float, delta: float) -> int:
+        """Further steps that keep epsilon within the budget."""
+        return steps_within_budget(self.rdp, sample_rate, noise_multiplier, epsilon_budget, delta, self.orders)
+
+    def reset(self):
+        self.rdp = np.zeros(len(self.orders))
+        self.steps = 0
+
+
+# ============ Persistent Budgets ============
+
+class PrivacyLedger:
+    """
+    Per-job / per-dataset privacy budgets stored as RDP vectors on disk.
+
+    Entries: {key: {rdp, steps, epsilon_budget, delta, updated_at}}
+    """
+
+    def __init__(self, path: str = PRIVACY_LEDGER_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self) -> Dict[str, dict]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _write(self, entries: Dict[str, dict]):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.path)
+
+    def accountant(self, key: str) -> RDPAccountant:
+        """Accountant holding everything already spent under a key."""
+        with self._lock:
+            entry = self._read().get(key)
+        if not entry or len(entry.get('rdp', [])) != len(DEFAULT_ORDERS):
+            return RDPAccountant()
+        return RDPAccountant(rdp=np.array(entry['rdp']), steps=entry.get('steps', 0))
+
+    def record(self, key: str, accountant: RDPAccountant, epsilon_budget: float, delta: float) -> dict:
+        """
+        Persist a key's accountant and return its budget report.
+        """
+        report = self.report(key, accountant, epsilon_budget, delta)
+        with self._lock:
+            entries = self._read()
+            entries[key] = {
+                'rdp': accountant.rdp.tolist(),
+                'steps': accountant.steps,
+                'epsilon_budget': epsilon_budget,
+                'delta': delta,
+                'epsilon_spent': report['epsilon_spent'],
+                'updated_at': time.time()
+            }
+            self._write(entries)
+        return report
+
+    @staticmethod
+    def report(key: str, accountant: RDPAccountant, epsilon_budget: float, delta: float) -> dict:
+        spent = accountant.get_epsilon(delta)
+        return {
+            'budget_key': key,
+            'epsilon_spent': spent,
+            'epsilon_budget': epsilon_budget,
+            'delta': delta,
+            'steps': accountant.steps,
+            'exhausted': spent >= epsilon_budget
+        }
+
+
+class NoiseCounterStore:
+    """
+    High-water marks of seeded noise release counters, stored on disk.
+
+    Entries: {sha256(seed)[:16]: first release not yet reserved}
+
+    Counters are reserved in blocks before use, so after a crash the
+    engine resumes past every release it may have drawn. Unlike the
+    ledger, an unreadable file is an error: silently starting over would
+    reuse noise.
+    """
+
+    def __init__(self, path: str = PRIVACY_NOISE_COUNTER_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(seed: int) -> str:
+        return hashlib.sha256(str(seed).encode()).hexdigest()[:16]
+
+    def _read(self) -> Dict[str, int]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            raise RuntimeError(f"Cannot restore noise release counters from {self.path}: {e}")
+
+    def reserve(self, seed: int, until: int) -> int:
+        """
+        Reserve releases of a seed up to (not including) until.
+
+        Returns:
+            The seed's high-water mark after the reservation
+        """
+        with self._lock:
+            entries = self._read()
+            key = self._key(seed)
+            entries[key] = max(int(entries.get(key, 0)), until)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+            return entries[key]
+
+    def reserved(self, seed: int) -> int:
+        """First release of a seed that was never reserved."""
+        with self._lock:
+            return int(self._read().get(self._key(seed), 0))
+
+
+_ledger = None
+_noise_counters = None
+
+
+def get_privacy_ledger() -> PrivacyLedger:
+    """Process-wide ledger at PRIVACY_LEDGER_PATH."""
+    global _ledger
+    if _ledger is None:
+        _ledger = PrivacyLedger()
+    return _ledger
+
+
+def get_noise_counter_store() -> NoiseCounterStore:
+    """Process-wide noise counter store at PRIVACY_NOISE_COUNTER_PATH."""
+    global _noise_counters
+    if _noise_counters is None:
+        _noise_counters = NoiseCounterStore()
+    return _noise_counters
+
+
+__all__ = [
+    'RDPAccountant',
+    'PrivacyLedger',
+    'get_privacy_ledger',
+    'NoiseCounterStore',
+    'get_noise_counter_store',
+    'compute_rdp',
+    'rdp_to_epsilon',
+    'steps_within_budget',
+    'DEFAULT_ORDERS'
+]
@@ -0,0 +1,96 @@
+"""
+Shard Lease Keeper for Oblivion
+Heartbeats that keep a leased training shard assigned to this worker.
+
+The backend scheduler reclaims a shard whose lease is not renewed, and
+cancels the lease of every copy once one worker's result has been
+accepted. ShardLease renews the lease from a background thread at a
+third of the lease period, reports training progress with each
+heartbeat along with the URL of its latest published checkpoint, and
+sets `cancelled` when the backend says the shard is no longer ours so
+training can stop early.
+"""
+
+import threading
+from typing import Optional
+
+import requests
+
+
+class ShardLease:
+    """
+    Renews a shard lease in the background while the shard is trained.
+
+    Usage:
+        with ShardLease(backend_url, job_id, shard_index, worker_id, 60) as lease:
+            ... train, setting lease.progress and lease.checkpoint_url ...
+            if lease.cancelled.is_set(): stop
+    """
+
+    def __init__(
+        self,
+        backend_url: str,
+        job_id: str,
+        shard_index: int,
+        worker_id: str,
+        lease_seconds: float = 60
+    ):
+        self.backend_url = backend_url
+        self.job_id = job_id
+        self.shard_index = shard_index
+        self.worker_id = worker_id
+        self.interval = max(1.0, lease_seconds / 3)
+        self.progress = 0.0
+        self.checkpoint_url: Optional[str] = None
+        self.cancelled = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def heartbeat(self) -> bool:
+        """Renew once; returns False if the lease was cancelled."""
+        params = {
+            "job_id": self.job_id,
+            "shard_index": self.shard_index,
+            "worker_id": self.worker_id,
+            "progress": round(self.progress, 1)
+        }
+        if self.checkpoint_url:
+            params["checkpoint_url"] = self.checkpoint_url
+        try:
+            response = requests.post(
+                f"{self.backend_url}/api/training/heartbeat",
+                params=params,
+                timeout=10
+            )
+            if response.status_code == 200 and response.json().get("cancelled"):
+                self.cancelled.set()
+                return False
+        except Exception as e:
+            # Transient: the lease only lapses if heartbeats keep failing
+            print(f"    [!] Heartbeat failed for shard {self.shard_index}: {e}")
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if not self.heartbeat():
+                print(f"    [!] Lease on shard {self.shard_index} cancelled by the scheduler")
+                return
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+
+    def __enter__(self) -> "ShardLease":
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+__all__ = ['ShardLease']
@@ -19,6 +19,12 @@ from datetime import datetime
 import io
 import hashlib
 
+from fingerprint import fingerprint_gradients
+from update_codec import encode_update, decode_update, is_encoded_update
+from tree_aggregation import run_partial_aggregation
+from data_pipeline import ArrayDataset, make_loader, TRAIN_BATCH_SIZE
+from checkpointing import Checkpointer, fetch_checkpoint_url
+
 # Import network configuration
 try:
     from network_config import (
@@ -34,6 +40,7 @@ except ImportError:
 # Import Oblivion security and privacy modules
 try:
     from privacy import DifferentialPrivacy, privatize_gradients
+    from privacy_accountant import get_privacy_ledger
     PRIVACY_AVAILABLE = True
 except ImportError:
     PRIVACY_AVAILABLE = False
@@ -129,13 +136,31 @@ contract = w3.eth.contract(address=CONTRACT_ADDRESS, abi=CONTRACT_ABI) if CONTRA
 # Privacy configuration (can be overridden per-job)
 PRIVACY_EPSILON = float(os.environ.get("PRIVACY_EPSILON", "1.0"))
 PRIVACY_DELTA = float(os.environ.get("PRIVACY_DELTA", "1e-5"))
+# Total epsilon one dataset (or job) may spend across all released updates
+PRIVACY_BUDGET_EPSILON = float(os.environ.get("PRIVACY_BUDGET_EPSILON", "10.0"))
+# Optional DP noise seed for reproducible audits (releases are counter-seeded;
+# the counter persists at PRIVACY_NOISE_COUNTER_PATH and the worker refuses
+# to start with a seed if it cannot be restored)
+PRIVACY_NOISE_SEED = os.environ.get("PRIVACY_NOISE_SEED")
 ENABLE_PRIVACY = os.environ.get("ENABLE_PRIVACY", "true").lower() == "true"
 ENABLE_ZK_PROOFS = os.environ.get("ENABLE_ZK_PROOFS", "true").lower() == "true"
 
+# Update upload format: auto / int8 / fp16 / fp32, optional top-k deltas vs the global model
+# ("auto" quantizes top-k deltas to int8 and keeps full weights lossless)
+UPDATE_CODEC = os.environ.get("UPDATE_CODEC", "auto")
+UPDATE_TOPK_RATIO = float(os.environ.get("UPDATE_TOPK_RATIO", "0"))
+
+# Rows of synthetic data for the default model (minibatch size: TRAIN_BATCH_SIZE)
+TRAIN_SAMPLES = int(os.environ.get("TRAIN_SAMPLES", "1024"))
+
 # Initialize privacy module if available
 dp_module = None
 if PRIVACY_AVAILABLE and ENABLE_PRIVACY:
-    dp_module = DifferentialPrivacy(epsilon=PRIVACY_EPSILON, delta=PRIVACY_DELTA)
+    dp_module = DifferentialPrivacy(
+        epsilon=PRIVACY_EPSILON,
+        delta=PRIVACY_DELTA,
+        seed=int(PRIVACY_NOISE_SEED) if PRIVACY_NOISE_SEED else None
+    )
     print(f"[*] Differential Privacy enabled: epsilon={PRIVACY_EPSILON}, delta={PRIVACY_DELTA}")
 
 # Initialize ZK proof generator if available
@@ -150,19 +175,107 @@ if QUALITY_VERIFICATION_AVAILABLE:
     quality_verifier = ModelQualityVerifier(QualityThresholds(max_loss=10.0))
     print("[*] Model quality verification enabled")
 
+def pull_global_model(supabase: Client, job):
+    """
+    Latest global model of a job, pulled right before training so buffered
+    (asynchronous) rounds always start from the newest version.
+    Returns (base_state, header metadata); (None, {}) if there is none yet.
+    """
+    base_url = job.get('global_model_url')
+    base_version = job.get('global_model_version')
+    try:
+        latest = supabase.table('jobs').select("global_model_url, global_model_version").eq('id', job['id']).single().execute()
+        if latest.data and latest.data.get('global_model_url'):
+            base_url = latest.data['global_model_url']
+            base_version = latest.data.get('global_model_version')
+    except Exception:
+        pass  # Schema without version columns
+    if not base_url:
+        return None, {}
+    try:
+        response = requests.get(base_url, timeout=60)
+        response.raise_for_status()
+        if is_encoded_update(response.content[:4]):
+            base_state = decode_update(response.content)
+        else:
+            base_state = torch.load(io.BytesIO(response.content), map_location='cpu', weights_only=True)
+        meta = {'base_url': base_url}
+        if base_version is not None:
+            meta['base_version'] = base_version
+        return base_state, meta
+    except Exception as e:
+        print(f"    [!] Could not load global model, training from scratch: {e}")
+        return None, {}
+
+def load_global_into(module, base_state):
+    """Start training from the global model when its shapes match the module."""
+    if not base_state:
+        return
+    try:
+        module.load_state_dict(base_state)
+        print("    [⬇] Starting from the latest global model")
+    except Exception as e:
+        print(f"    [!] Global model does not fit this architecture: {e}")
+
+def upload_model_bytes(supabase: Client, data: bytes, file_name: str, bucket_name: str = 'trained-models'):
+    """Upload model bytes to storage (creating the bucket if needed); returns the public URL."""
+    try:
+        supabase.storage.from_(bucket_name).upload(
+            path=file_name,
+            file=data,
+            file_options={"content-type": "application/octet-stream"}
+        )
+        return supabase.storage.from_(bucket_name).get_public_url(file_name)
+    except Exception as upload_err:
+        print(f"    [!] Upload failed: {upload_err}")
+        try:
+            supabase.storage.create_bucket(bucket_name, options={"public": True})
+            supabase.storage.from_(bucket_name).upload(path=file_name, file=data)
+            return supabase.storage.from_(bucket_name).get_public_url(file_name)
+        except:
+            return None
+
+def upload_checkpoint(supabase: Client, job_id, path: str):
+    """Publish a training checkpoint file; returns its public URL."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    file_name = f"job_{job_id}/checkpoint_{int(datetime.now().timestamp())}.pt"
+    return upload_model_bytes(supabase, data, file_name, bucket_name='checkpoints')
+
+def remove_checkpoint(supabase: Client, url: str):
+    """Delete a published checkpoint once it is superseded or the job is done."""
+    marker = '/checkpoints/'
+    if marker not in url:
+        return
+    file_name = url.split(marker, 1)[1].split('?', 1)[0]
+    supabase.storage.from_('checkpoints').remove([file_name])
+
+def record_checkpoint(supabase: Client, job_id, url: str):
+    """Store a job's latest checkpoint so a reassigned job resumes from it."""
+    try:
+        supabase.table('jobs').update({'checkpoint_url': url}).eq('id', job_id).execute()
+    except Exception as e:
+        print(f"    [!] Could not record checkpoint for job {job_id}: {e}")
+
 def quantize_gradients(gradients, bits=8):
     """Quantize gradients to reduce bandwidth for federated learning."""
-    q_grads = []
-    for g in gradients:
-        if not isinstance(g, torch.Tensor):
-            g = torch.tensor(g, dtype=torch.float32)
-        max_val = torch.max(torch.abs(g))
-        scale = (2**(bits-1) - 1) / (max_val if max_val > 0 else 1)
-        q_g = torch.round(g * scale).to(torch.int8)
-        q_grads.append(q_g.numpy().tolist())
-    return q_grads
-
-def apply_differential_privacy(gradients, epsilon=None, delta=None):
+    return fingerprint_gradients(gradients, bits).quantized
+
+def privacy_budget_key(job):
+    """Budgets are tracked per dataset when known, otherwise per job."""
+    dataset = job.get('dataset_url') or job.get('data_hash')
+    return f"dataset:{dataset}" if dataset else f"job:{job['id']}"
+
+def privacy_budget_exhausted(budget_key):
+    """True if the persistent RDP budget cannot cover one more release."""
+    if not PRIVACY_AVAILABLE or not ENABLE_PRIVACY or dp_module is None:
+        return False
+    accountant = get_privacy_ledger().accountant(budget_key)
+    return accountant.steps_remaining(
+        dp_module.sigma, dp_module.sample_rate, PRIVACY_BUDGET_EPSILON, dp_module.delta
+    ) == 0
+
+def apply_differential_privacy(gradients, epsilon=None, delta=None, budget_key=None):
     """Apply differential privacy to gradients if enabled."""
     if not PRIVACY_AVAILABLE or not ENABLE_PRIVACY or dp_module is None:
         return gradients, None
@@ -172,11 +285,27 @@ def apply_differential_privacy(gradients, epsilon=None, delta=None):
         if epsilon and delta:
             local_dp = DifferentialPrivacy(epsilon=epsilon, delta=delta)
             private_grads, report = privatize_gradients(gradients, epsilon, delta)
+        elif budget_key:
+            # Charge the release to the persistent per-dataset RDP budget
+            ledger = get_privacy_ledger()
+            local_dp = DifferentialPrivacy(
+                epsilon=dp_module.epsilon,
+                delta=dp_module.delta,
+                max_grad_norm=dp_module.max_grad_norm,
+                accountant=ledger.accountant(budget_key)
+            )
+            # Share the worker's noise engine so audit counters keep advancing
+            local_dp.engine = dp_module.engine
+            private_grads = local_dp.add_noise(gradients)
+            report = local_dp.get_privacy_guarantee()
+            report['budget'] = ledger.record(budget_key, local_dp.accountant, PRIVACY_BUDGET_EPSILON, dp_module.delta)
         else:
             private_grads = dp_module.add_noise(gradients)
             report = dp_module.get_privacy_guarantee()
         
         print(f"    - Applied DP: epsilon={report['epsilon']}, noise_multiplier={report['noise_multiplier']:.4f}")
+        if report.get('budget'):
+            print(f"    - Privacy budget: ε={report['budget']['epsilon_spent']:.3f} / {PRIVACY_BUDGET_EPSILON} spent")
         return private_grads, report
     except Exception as e:
         print(f"    [!] DP failed, using raw gradients: {e}")
@@ -594,10 +723,21 @@ def atomic_claim_job(supabase: Client, job_id: int) -> bool:
     
     return False
 
-def execute_training_sandboxed(script_code: str, dataset_url: str, timeout: int = 300) -> dict:
+def execute_training_sandboxed(script_code: str, dataset_url: str, timeout: int = 300, checkpoint_path: str = None) -> dict:
     """
     Execute training script in a sandboxed subprocess for security.
-    Returns dict with gradients, loss, and weights.
+    Returns dict with gradients, loss, weights and sample count.
+    
+    train() returns (grads, loss, weights, num_samples); num_samples (the
+    number of training examples) is required whenever weights are
+    returned, since it is the update's FedAvg weight.
+    
+    train() can call save_checkpoint(state) and load_checkpoint() to make
+    long runs resumable; load_checkpoint() reads checkpoint_path and each
+    save lands in '<checkpoint_path>.<n>', which the caller (see
+    Checkpointer.watch) moves into place, publishes and restores on
+    whichever worker runs the job next. The script is given no way to
+    rename or delete files.
     """
     # Create a wrapper script that executes safely
     wrapper_script = f'''
@@ -608,6 +748,29 @@ import torch.nn as nn
 import torch.optim as optim
 import numpy as np
 
+# Checkpoint helpers for train(). Only the path is bound: each save goes
+# to a new numbered file, which the worker moves into place and publishes
+def _checkpoint_io(path):
+    saved = [0]
+    
+    def save_checkpoint(state):
+        if path is None:
+            return
+        torch.save(state, f"{{path}}.{{saved[0]}}")
+        saved[0] += 1
+    
+    def load_checkpoint():
+        if path is None:
+            return None
+        try:
+            return torch.load(path, map_location='cpu', weights_only=True)
+        except FileNotFoundError:
+            return None
+    
+    return save_checkpoint, load_checkpoint
+
+save_checkpoint, load_checkpoint = _checkpoint_io({checkpoint_path!r})
+
 # Disable dangerous operations
 import builtins
 original_import = builtins.__import__
@@ -655,13 +818,20 @@ try:
     if isinstance(result, tuple) and len(result) >= 2:
         grads, loss = result[0], result[1]
         weights = result[2] if len(result) > 2 else None
+        num_samples = result[3] if len(result) > 3 else None
     else:
-        grads, loss, weights = result, 0.0, None
+        grads, loss, weights, num_samples = result, 0.0, None, None
+    
+    # The sample count weights the update in FedAvg, so it cannot be guessed
+    num_samples = int(num_samples) if num_samples is not None else None
+    if weights and not (num_samples and num_samples > 0):
+        raise ValueError("train() must return (grads, loss, weights, num_samples) with num_samples > 0")
     
     # Serialize results
     output = {{
         'success': True,
         'loss': float(loss) if loss else 0.0,
+        'num_samples': num_samples,
         'grads_shape': [list(g.shape) if hasattr(g, 'shape') else len(g) for g in grads] if grads else [],
     }}
     
@@ -909,6 +1079,11 @@ async def main():
 
                     try:
                         if job_type == 'training':
+                            # Don't train for an update whose privacy cost can't be paid
+                            budget_key = privacy_budget_key(job)
+                            if privacy_budget_exhausted(budget_key):
+                                raise Exception(f"Privacy budget exhausted for {budget_key}")
+                            
                             # 1. Execute Training (SECURE)
                             script_url = job.get('script_url') or job.get('model_hash')
                             dataset_url = job.get('dataset_url') or job.get('data_hash', '')
@@ -916,29 +1091,35 @@ async def main():
                             # Check if script_url is a valid HTTP URL
                             is_valid_url = script_url and script_url.startswith('http')
                             
+                            # Pull the newest global model version (also the delta base)
+                            base_state, update_meta = pull_global_model(supabase, job)
+                            
                             if not script_url or script_url.startswith('ipfs://') or not is_valid_url:
                                 # Use default model for IPFS, missing scripts, or invalid URLs
                                 print("    [⚙] Using default neural network architecture")
                                 print("    [⚙] Model: Linear(10,32) -> ReLU -> Linear(32,1)")
                                 module = nn.Sequential(nn.Linear(10, 32), nn.ReLU(), nn.Linear(32, 1))
+                                load_global_into(module, base_state)
                                 
-                                # Simple training loop
+                                # Shuffled minibatch training loop
                                 optimizer = torch.optim.SGD(module.parameters(), lr=0.01)
-                                data = torch.randn(16, 10)
-                                target = torch.randn(16, 1)
+                                dataset = ArrayDataset(torch.randn(TRAIN_SAMPLES, 10), torch.randn(TRAIN_SAMPLES, 1))
+                                loader = make_loader(dataset, batch_size=TRAIN_BATCH_SIZE)
                                 
-                                print("    [⚙] Training for 10 epochs...")
+                                print(f"    [⚙] Training for 10 epochs ({len(loader)} batches of {TRAIN_BATCH_SIZE})...")
                                 for epoch in range(10):
-                                    optimizer.zero_grad()
-                                    loss = nn.MSELoss()(module(data), target)
-                                    loss.backward()
-                                    optimizer.step()
+                                    for data, target in loader:
+                                        optimizer.zero_grad()
+                                        loss = nn.MSELoss()(module(data), target)
+                                        loss.backward()
+                                        optimizer.step()
                                     if epoch % 3 == 0:
                                         print(f"        Epoch {epoch+1}/10 - Loss: {loss.item():.4f}")
                                 
                                 grads = [p.grad for p in module.parameters() if p.grad is not None]
                                 loss_val = loss.item()
                                 weights = module.state_dict()
+                                num_samples = len(dataset)
                                 print(f"    [✓] Training complete! Final loss: {loss_val:.4f}")
                             else:
                                 # Download and execute script in sandbox
@@ -956,12 +1137,29 @@ async def main():
                                 print("        - Import restrictions: ACTIVE")
                                 print("        - File access: BLOCKED")
                                 print("        - Network access: BLOCKED")
-                                sandbox_result = execute_training_sandboxed(script_code, dataset_url)
+                                # Resume from the job's last checkpoint and publish new ones as they are written
+                                checkpointer = Checkpointer(
+                                    f"job_{job_id}",
+                                    publish=lambda path: upload_checkpoint(supabase, job_id, path),
+                                    fetch=fetch_checkpoint_url,
+                                    remote={'url': job['checkpoint_url']} if job.get('checkpoint_url') else None,
+                                    on_published=lambda url: record_checkpoint(supabase, job_id, url),
+                                    unpublish=lambda url: remove_checkpoint(supabase, url)
+                                )
+                                if checkpointer.restore():
+                                    print("        - Resuming from checkpoint")
+                                with checkpointer.watch() as checkpoint_path:
+                                    sandbox_result = execute_training_sandboxed(
+                                        script_code, dataset_url, checkpoint_path=str(checkpoint_path)
+                                    )
+                                checkpointer.close()
                                 
                                 if not sandbox_result.get('success'):
                                     raise Exception(f"Sandbox execution failed: {sandbox_result.get('error')}")
+                                checkpointer.discard()
                                 
                                 loss_val = sandbox_result.get('loss', 0.0)
+                                num_samples = sandbox_result.get('num_samples')
                                 grads = [torch.randn(10, 32)]  # Placeholder gradients
                                 
                                 # Load weights if saved
@@ -973,39 +1171,39 @@ async def main():
                                     module = nn.Sequential(nn.Linear(10, 32), nn.ReLU(), nn.Linear(32, 1))
                                     weights = module.state_dict()
 
-                            # 2. Handle Weights Upload
+                            # 2. Handle Weights Upload (compact quantized update format)
                             result_url = None
                             try:
                                 buffer = io.BytesIO()
-                                torch.save(weights if weights else {"info": "Final state dict"}, buffer)
+                                if weights:
+                                    # Sample count weights this update in FedAvg
+                                    update_meta['num_samples'] = num_samples
+                                    payload, _ = encode_update(
+                                        weights,
+                                        codec=UPDATE_CODEC,
+                                        base_state=base_state,
+                                        topk_ratio=UPDATE_TOPK_RATIO,
+                                        metadata=update_meta
+                                    )
+                                    buffer.write(payload)
+                                    file_ext = "obu"
+                                else:
+                                    torch.save({"info": "Final state dict"}, buffer)
+                                    file_ext = "pt"
                                 buffer.seek(0)
                                 
-                                bucket_name = 'trained-models'
-                                file_name = f"model_job_{job_id}_{int(datetime.now().timestamp())}.pt"
+                                file_name = f"model_job_{job_id}_{int(datetime.now().timestamp())}.{file_ext}"
                                 
                                 print(f"    [⬆] Uploading trained weights...")
-                                try:
-                                    supabase.storage.from_(bucket_name).upload(
-                                        path=file_name,
-                                        file=buffer.getvalue(),
-                                        file_options={"content-type": "application/octet-stream"}
-                                    )
-                                    result_url = supabase.storage.from_(bucket_name).get_public_url(file_name)
+                                result_url = upload_model_bytes(supabase, buffer.getvalue(), file_name)
+                                if result_url:
                                     print(f"    [✓] Weights uploaded successfully!")
-                                except Exception as upload_err:
-                                    print(f"    [!] Upload failed: {upload_err}")
-                                    try:
-                                        supabase.storage.create_bucket(bucket_name, options={"public": True})
-                                        supabase.storage.from_(bucket_name).upload(path=file_name, file=buffer.getvalue())
-                                        result_url = supabase.storage.from_(bucket_name).get_public_url(file_name)
-                                    except:
-                                        pass
 
                             except Exception as ue:
                                 print(f"    [!] Weight processing failed: {ue}")
 
                             # 3. Apply Differential Privacy to gradients
-                            private_grads, dp_report = apply_differential_privacy(grads)
+                            private_grads, dp_report = apply_differential_privacy(grads, budget_key=budget_key)
                             if dp_report:
                                 print(f"    - Privacy guarantee: ({dp_report['epsilon']}, {dp_report['delta']})-DP")
 
@@ -1030,13 +1228,16 @@ async def main():
                                     module, input_tensor, module(input_tensor)
                                 )
 
-                            # 6. Create update hash and record
-                            u_hash = hashlib.sha256(json.dumps(quantize_gradients(private_grads)).encode()).hexdigest()
+                            # 6. Create update hash and record (int8 buffers hashed in place)
+                            fingerprint = fingerprint_gradients(private_grads)
+                            u_hash = fingerprint.digest
                             
                             update_record = {
                                 'job_id': job_id,
                                 'worker_address': NODE_ID,
-                                'update_hash': u_hash
+                                'update_hash': u_hash,
+                                'update_url': result_url,
+                                'num_samples': num_samples
                             }
                             
                             # Try to insert worker update (may fail if schema missing privacy columns)
@@ -1045,6 +1246,9 @@ async def main():
                                 if dp_report:
                                     update_record['privacy_epsilon'] = dp_report['epsilon']
                                     update_record['privacy_delta'] = dp_report['delta']
+                                    if dp_report.get('budget'):
+                                        update_record['privacy_epsilon_spent'] = dp_report['budget']['epsilon_spent']
+                                        update_record['privacy_budget_key'] = dp_report['budget']['budget_key']
                                 supabase.table('worker_updates').insert(update_record).execute()
                             except Exception as db_err:
                                 # Try without privacy columns
@@ -1052,7 +1256,8 @@ async def main():
                                     basic_record = {
                                         'job_id': job_id,
                                         'worker_address': NODE_ID,
-                                        'update_hash': u_hash
+                                        'update_hash': u_hash,
+                                        'update_url': result_url
                                     }
                                     supabase.table('worker_updates').insert(basic_record).execute()
                                 except:
@@ -1078,6 +1283,18 @@ async def main():
     ==================================================
 """)
 
+                        elif job_type == 'aggregation':
+                            # Intermediate node of the aggregation tree
+                            def upload_partial(data, file_name):
+                                url = upload_model_bytes(supabase, data, file_name)
+                                if not url:
+                                    raise Exception("Partial aggregate upload failed")
+                                return url
+
+                            result_url = await run_partial_aggregation(supabase, job, NODE_ID, upload_partial)
+                            complete_job_with_stats(supabase, job_id, 'completed', result_url)
+                            print(f"[+] Aggregation Job {job_id} Complete: {result_url}")
+
                         elif job_type == 'inference':
                             # Real Inference Job logic
                             input_raw = job.get('input_data') or "{}"
@@ -0,0 +1,80 @@
+"""
+Columnar Dataset Format Tests
+Header layout and chunk hashes of OBDS files.
+
+Run: python -m pytest test_dataset_format.py
+"""
+
+import hashlib
+import json
+import struct
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("torch")
+pytest.importorskip("requests")
+
+from dataset_format import DATASET_MAGIC, DATASET_FORMAT_VERSION, open_dataset, row_byte_ranges, write_dataset
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    X = np.arange(30, dtype=np.float32).reshape(10, 3)
+    y = np.arange(10, dtype=np.int64)
+    path = str(tmp_path / "data.obds")
+    return path, write_dataset(path, chunk_rows=4, X=X, y=y), X, y
+
+
+def test_header_layout(dataset):
+    path, header, X, y = dataset
+    with open(path, "rb") as f:
+        magic, version, header_len = struct.unpack("<4sBI", f.read(9))
+        assert json.loads(f.read(header_len)) == header
+
+    assert (magic, version) == (DATASET_MAGIC, DATASET_FORMAT_VERSION)
+    assert header["rows"] == 10
+    assert [(c["row_start"], c["row_end"]) for c in header["chunks"]] == [(0, 4), (4, 8), (8, 10)]
+    columns = {c["name"]: c for c in header["columns"]}
+    assert columns["X"]["dtype"] == "<f4" and columns["X"]["shape"] == [3]
+    assert columns["y"]["dtype"] == "<i8" and columns["y"]["shape"] == []
+    for column in header["columns"]:
+        assert column["offset"] % 64 == 0
+        assert column["offset"] >= 9 + header_len
+    assert columns["y"]["offset"] >= columns["X"]["offset"] + columns["X"]["nbytes"]
+
+
+def test_chunk_hashes_cover_every_column(dataset):
+    path, header, X, y = dataset
+    for chunk in header["chunks"]:
+        rows = slice(chunk["row_start"], chunk["row_end"])
+        expected = hashlib.sha256(X[rows].tobytes() + y[rows].tobytes()).hexdigest()
+        assert chunk["sha256"] == expected
+
+    digests = b"".join(bytes.fromhex(c["sha256"]) for c in header["chunks"])
+    assert header["content_hash"] == hashlib.sha256(digests).hexdigest()
+
+
+def test_rows_read_back_by_range(dataset):
+    path, header, X, y = dataset
+    ds = open_dataset(path)
+    assert np.array_equal(ds.column("X"), X)
+    assert np.array_equal(ds.tensor("y", 2, 5).numpy(), y[2:5])
+
+    with open(path, "rb") as f:
+        for name, (first, last) in row_byte_ranges(header, 3, 7).items():
+            f.seek(first)
+            assert f.read(last - first) == {"X": X, "y": y}[name][3:7].tobytes()
+
+
+def test_verify_detects_corrupted_chunk(dataset):
+    path, header, X, y = dataset
+    y_column = next(c for c in header["columns"] if c["name"] == "y")
+    with open(path, "r+b") as f:
+        f.seek(y_column["offset"] + 9 * 8)
+        f.write(b"\xff")
+
+    ds = open_dataset(path)
+    assert ds.verify(0, 8)
+    assert not ds.verify(8, 10)
+    assert not ds.verify()
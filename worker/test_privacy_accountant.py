@@ -0,0 +1,49 @@
+"""
+Privacy Accountant Tests
+RDP of the subsampled Gaussian and its (ε, δ) conversion.
+
+Run: python -m pytest test_privacy_accountant.py
+"""
+
+import math
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+
+from privacy_accountant import DEFAULT_ORDERS, compute_rdp, rdp_to_epsilon
+
+
+def test_compute_rdp_matches_reference_values():
+    # Reference values of the TensorFlow Privacy RDP accountant
+    assert compute_rdp(0.1, 2, 10, np.array([5.0]))[0] == pytest.approx(0.07737, rel=1e-4)
+    rdp = compute_rdp(0.01, 2.5, 50, np.array([1.5, 2.5, 5.0, 50.0, 100.0]))
+    assert rdp == pytest.approx([0.00065, 0.001085, 0.00218075, 0.023846, 167.416307], rel=1e-3)
+
+
+def test_full_batch_is_the_gaussian_mechanism():
+    rdp = compute_rdp(1.0, 2.0, 3)
+    assert rdp == pytest.approx(3 * DEFAULT_ORDERS / (2 * 2.0 ** 2))
+
+
+def test_rdp_to_epsilon_minimizes_the_conversion_over_orders():
+    orders = np.arange(2, 33, dtype=np.float64)
+    rdp = compute_rdp(0.01, 4, 10000, orders)
+    epsilon, order = rdp_to_epsilon(rdp, 1e-5, orders)
+
+    # Classic conversion (ε = rdp - log δ / (α - 1)) gives 1.258575 here;
+    # the tighter one used by the accountant must not exceed it
+    assert epsilon == pytest.approx(1.03549, rel=1e-4)
+    assert epsilon < 1.258575
+    assert order == 17.0
+
+    alpha = order
+    expected = rdp[orders == alpha][0] - (math.log(1e-5) + math.log(alpha)) / (alpha - 1) + math.log((alpha - 1) / alpha)
+    assert epsilon == pytest.approx(expected)
+
+
+def test_rdp_to_epsilon_edge_cases():
+    assert rdp_to_epsilon(np.zeros(len(DEFAULT_ORDERS)), 1e-5)[0] >= 0.0
+    epsilon, order = rdp_to_epsilon(np.full(len(DEFAULT_ORDERS), np.nan), 1e-5)
+    assert epsilon == math.inf and math.isnan(order)
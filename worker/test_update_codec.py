@@ -0,0 +1,103 @@
+"""
+Model Update Codec Tests
+Round trips of the update wire format.
+
+Run: python -m pytest test_update_codec.py
+"""
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("numpy")
+pytest.importorskip("requests")
+
+from fedavg import RunningSum
+from update_codec import decode_update, encode_update
+
+
+def _state():
+    torch.manual_seed(0)
+    return {
+        'layer.weight': torch.randn(16, 8),
+        'layer.bias': torch.randn(16),
+        'empty': torch.empty(0),
+        'bn.num_batches_tracked': torch.tensor(7, dtype=torch.long)
+    }
+
+
+@pytest.mark.parametrize("codec", ["auto", "fp32"])
+def test_full_weights_round_trip_exactly(codec):
+    state = _state()
+    payload, header = encode_update(state, codec=codec)
+    decoded = decode_update(payload)
+
+    assert header['delta'] is False
+    assert decoded.keys() == state.keys()
+    for name, tensor in state.items():
+        assert decoded[name].dtype == (tensor.dtype if not tensor.is_floating_point() else torch.float32)
+        assert torch.equal(decoded[name], tensor)
+
+
+def test_int8_round_trip_within_one_step():
+    state = _state()
+    payload, header = encode_update(state, codec="int8")
+    decoded = decode_update(payload)
+
+    assert header['fingerprint']
+    for entry in header['tensors']:
+        if entry['encoding'] == 'dense' and entry['shape'] != [0]:
+            error = (decoded[entry['name']] - state[entry['name']]).abs().max()
+            assert error <= 0.5 / entry['scale'] + 1e-6
+
+
+def test_topk_delta_applies_to_base_and_keeps_empty_dense():
+    base = _state()
+    state = {name: tensor.clone() for name, tensor in base.items()}
+    state['layer.weight'][3, 4] += 5.0
+    state['layer.bias'][0] -= 2.0
+
+    payload, header = encode_update(state, base_state=base, topk_ratio=0.01)
+    encodings = {entry['name']: entry for entry in header['tensors']}
+    assert encodings['layer.weight']['encoding'] == 'topk'
+    assert encodings['layer.weight']['codec'] == 'int8'
+    assert encodings['empty']['encoding'] == 'dense'
+
+    decoded = decode_update(payload, base_state=base)
+    assert torch.allclose(decoded['layer.weight'], state['layer.weight'], atol=0.05)
+    assert torch.allclose(decoded['layer.bias'], state['layer.bias'], atol=0.05)
+    assert decoded['empty'].numel() == 0
+
+
+@pytest.mark.parametrize("kahan", [False, True])
+def test_running_sum_folds_encoded_updates(kahan):
+    a, b = _state(), {name: tensor * 2 if tensor.is_floating_point() else tensor for name, tensor in _state().items()}
+    running_sum = RunningSum(kahan=kahan)
+    for state, weight in ((a, 1.0), (b, 3.0)):
+        running_sum.fold_encoded(encode_update(state, codec="fp32")[0], weight=weight)
+
+    expected = a['layer.weight'] + 3.0 * b['layer.weight']
+    assert torch.allclose(running_sum.sums['layer.weight'], expected)
+    assert running_sum.count == 2 and running_sum.total_weight == 4.0
+
+
+def test_running_sum_rejects_mismatched_or_corrupt_updates():
+    state = _state()
+    payload, _ = encode_update(state, codec="fp32")
+    running_sum = RunningSum()
+    running_sum.fold_encoded(payload)
+    before = {name: total.clone() for name, total in running_sum.sums.items()}
+
+    other = dict(state, **{'layer.bias': torch.randn(4)})
+    with pytest.raises(ValueError):
+        running_sum.fold_encoded(encode_update(other, codec="fp32")[0])
+    with pytest.raises(Exception):
+        running_sum.fold_encoded(payload[:-64])
+
+    assert running_sum.count == 1
+    for name, total in running_sum.sums.items():
+        assert torch.allclose(total, before[name])
+
+
+def test_rejects_unknown_payload():
+    with pytest.raises(ValueError):
+        decode_update(b"NOPE" + bytes(16))
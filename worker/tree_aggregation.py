@@ -0,0 +1,279 @@
+"""
+Hierarchical Aggregation for Oblivion
+Aggregation tree that spreads FedAvg ingress across the worker fleet.
+
+The root aggregator groups a job's pending updates into batches of
+AGGREGATION_FAN_OUT and posts each batch as an 'aggregation' job. Any
+worker can claim one: it folds the batch into a weighted mean and uploads
+it in the normal update format, with num_samples set to the batch's total
+weight and tree_level one above its inputs. Because FedAvg weighted by
+num_samples over partial means equals FedAvg over the leaves, partials
+can themselves be grouped again, and the root only ever downloads about
+fan_out updates per level.
+
+A partial is folded only after the root has settled its aggregation job
+as completed. Partials are tagged with the id of the job that produced
+them, so a late partial from a job that failed or timed out (whose inputs
+went back to the pool) is never folded on top of those inputs.
+"""
+
+import os
+import re
+import json
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fedavg import AggregationState, stream_fedavg, make_base_loader, row_weight
+from fingerprint import fingerprint_gradients
+from update_codec import encode_update
+
+# 0 = flat aggregation (the root downloads every update)
+AGGREGATION_FAN_OUT = int(os.environ.get("AGGREGATION_FAN_OUT", "0"))
+# Delegated batches not aggregated within this time go back to the pool
+AGGREGATION_TREE_TIMEOUT = float(os.environ.get("AGGREGATION_TREE_TIMEOUT", "600"))
+# Partial sums are re-aggregated, so they default to full precision
+TREE_PARTIAL_CODEC = os.environ.get("TREE_PARTIAL_CODEC", "fp32")
+
+# File name of an uploaded partial: partial_job_<parent>_<aggregation job>_<ts>.obu
+_PARTIAL_FILE = re.compile(r"partial_job_[^_/]+_([^_/]+)_\d+\.obu")
+
+
+def update_level(update: Dict[str, Any], state: AggregationState) -> int:
+    """Tree level of an update row (0 = a worker's own update)."""
+    level = update.get('tree_level')
+    if level is None:
+        level = state.partial_levels.get(str(update.get('id')), 0)
+    return int(level)
+
+
+def partial_job_id(update: Dict[str, Any]) -> Optional[str]:
+    """
+    Aggregation job that produced an update row, or None for a worker's
+    own update. Rows without an aggregation_job_id column are recognized
+    by the partial's file name.
+    """
+    job_id = update.get('aggregation_job_id')
+    if job_id is None:
+        match = _PARTIAL_FILE.search(update.get('update_url') or '')
+        job_id = match.group(1) if match else None
+    return str(job_id) if job_id is not None else None
+
+
+def is_foldable(update: Dict[str, Any], state: AggregationState) -> bool:
+    """False for partials whose aggregation job was not settled as completed."""
+    return partial_job_id(update) is None or str(update.get('id')) in state.partial_levels
+
+
+def plan_groups(
+    updates: List[Dict[str, Any]],
+    state: AggregationState,
+    fan_out: int = AGGREGATION_FAN_OUT
+) -> Tuple[List[Tuple[int, List[Dict]]], List[Dict]]:
+    """
+    Split pending updates into batches to delegate and updates to fold directly.
+
+    A level with more than fan_out pending updates is cut into full
+    batches of fan_out; the remainder (and any level with at most fan_out
+    updates) is folded by the root.
+
+    Args:
+        updates: Pending worker_updates rows
+        state: Job aggregation state
+        fan_out: Batch size
+
+    Returns:
+        Tuple of ([(level, batch)], direct updates)
+    """
+    by_level: Dict[int, List[Dict]] = {}
+    for update in updates:
+        by_level.setdefault(update_level(update, state), []).append(update)
+
+    groups = []
+    direct = []
+    for level, level_updates in sorted(by_level.items()):
+        if fan_out < 2 or len(level_updates) <= fan_out:
+            direct.extend(level_updates)
+            continue
+        full = len(level_updates) - len(level_updates) % fan_out
+        for start in range(0, full, fan_out):
+            groups.append((level, level_updates[start:start + fan_out]))
+        direct.extend(level_updates[full:])
+    return groups, direct
+
+
+def delegate(supabase, state: AggregationState, level: int, batch: List[Dict]) -> Any:
+    """
+    Post an aggregation job for a batch of updates.
+
+    Returns:
+        The new job id, or None if it could not be created
+    """
+    spec = {
+        'parent_job_id': state.job_id,
+        'update_ids': [u['id'] for u in batch],
+        'tree_level': level + 1
+    }
+    try:
+        result = supabase.table('jobs').insert({
+            'job_type': 'aggregation',
+            'status': 'pending',
+            'reward': 0,
+            'input_data': json.dumps(spec)
+        }).execute()
+    except Exception as e:
+        print(f"    [!] Could not create aggregation job: {e}")
+        return None
+
+    agg_job_id = result.data[0]['id']
+    state.delegations[str(agg_job_id)] = {
+        'update_ids': spec['update_ids'],
+        'level': spec['tree_level'],
+        'created_at': time.time()
+    }
+    return agg_job_id
+
+
+def resolve_delegations(supabase, state: AggregationState, updates: List[Dict[str, Any]]) -> int:
+    """
+    Settle finished, failed and expired aggregation jobs.
+
+    A completed job's inputs become consumed (its partial update replaces
+    them); failed or expired jobs release their inputs back to the pool,
+    and any partial they upload later is ignored (see is_foldable).
+
+    Args:
+        supabase: Supabase client
+        state: Job aggregation state
+        updates: All worker_updates rows of the job
+
+    Returns:
+        Number of delegations settled
+    """
+    if not state.delegations:
+        return 0
+
+    try:
+        response = supabase.table('jobs').select("id, status, result_url").in_(
+            'id', list(state.delegations.keys())
+        ).execute()
+        jobs = {str(job['id']): job for job in response.data or []}
+    except Exception as e:
+        print(f"    [!] Could not check aggregation jobs: {e}")
+        return 0
+
+    by_url = {u.get('update_url'): u for u in updates if u.get('update_url')}
+    by_job = {partial_job_id(u): u for u in updates if partial_job_id(u) is not None}
+    settled = 0
+    for agg_job_id, delegation in list(state.delegations.items()):
+        job = jobs.get(agg_job_id, {})
+        status = job.get('status')
+        partial = None
+        if status == 'completed':
+            partial = by_job.get(agg_job_id) or by_url.get(job.get('result_url'))
+
+        if partial is not None:
+            state.consumed.update(delegation['update_ids'])
+            state.partial_levels[str(partial['id'])] = delegation['level']
+        elif status == 'failed' or time.time() - delegation['created_at'] > AGGREGATION_TREE_TIMEOUT:
+            print(f"    [!] Aggregation job {agg_job_id} {status or 'missing'}, releasing its updates")
+        else:
+            continue
+
+        del state.delegations[agg_job_id]
+        settled += 1
+    return settled
+
+
+def delegated_ids(state: AggregationState) -> set:
+    """Update ids currently assigned to an aggregation job."""
+    return {uid for d in state.delegations.values() for uid in d['update_ids']}
+
+
+async def run_partial_aggregation(
+    supabase,
+    job: Dict[str, Any],
+    worker_address: str,
+    upload: Callable[[bytes, str], str]
+) -> str:
+    """
+    Worker side of an aggregation job: fold the batch and upload the partial.
+
+    The batch is all-or-nothing: if any input cannot be folded the job
+    fails and the root reassigns the inputs.
+
+    Args:
+        supabase: Supabase client
+        job: The claimed aggregation job row
+        worker_address: This worker's id
+        upload: Uploads payload bytes under a file name, returns its URL
+
+    Returns:
+        URL of the uploaded partial update
+    """
+    spec = json.loads(job.get('input_data') or "{}")
+    update_ids = spec.get('update_ids') or []
+    if not update_ids:
+        raise ValueError("Aggregation job has no inputs")
+
+    rows = supabase.table('worker_updates').select("*").in_('id', update_ids).execute().data or []
+    pending = [(r['id'], r['update_url'], row_weight(r)) for r in rows if r.get('update_url')]
+    if len(pending) != len(update_ids):
+        raise ValueError(f"Only {len(pending)} of {len(update_ids)} inputs are available")
+
+    print(f"    - Aggregating {len(pending)} updates (tree level {spec.get('tree_level')})...")
+    running_sum, folded, failed = await stream_fedavg(pending, base_loader=make_base_loader())
+    if failed:
+        raise ValueError(f"Failed to fold {len(failed)} inputs: {failed[0][1]}")
+
+    mean = running_sum.mean()
+    # The codec only fingerprints int8 records, so hash the partial itself
+    update_hash = fingerprint_gradients(
+        [tensor for tensor in mean.values() if tensor.is_floating_point()]
+    ).digest
+    payload, _ = encode_update(
+        mean,
+        codec=TREE_PARTIAL_CODEC,
+        metadata={
+            'num_samples': running_sum.total_weight,
+            'tree_level': spec.get('tree_level', 1),
+            'partial': True,
+            'update_count': running_sum.count
+        }
+    )
+    file_name = f"partial_job_{spec.get('parent_job_id')}_{job['id']}_{int(datetime.now().timestamp())}.obu"
+    result_url = upload(payload, file_name)
+
+    record = {
+        'job_id': spec.get('parent_job_id'),
+        'worker_address': worker_address,
+        'update_hash': update_hash,
+        'update_url': result_url,
+        'num_samples': running_sum.total_weight,
+        'tree_level': spec.get('tree_level', 1),
+        'aggregation_job_id': job['id']
+    }
+    try:
+        supabase.table('worker_updates').insert(record).execute()
+    except Exception:
+        # Schema without tree columns: the root knows the level from the job
+        # and the aggregation job id from the file name
+        for key in ('num_samples', 'tree_level', 'aggregation_job_id'):
+            record.pop(key)
+        supabase.table('worker_updates').insert(record).execute()
+
+    print(f"    [✓] Partial aggregate of {running_sum.count} updates (weight {running_sum.total_weight:.0f}) uploaded")
+    return result_url
+
+
+__all__ = [
+    'plan_groups',
+    'delegate',
+    'resolve_delegations',
+    'delegated_ids',
+    'partial_job_id',
+    'is_foldable',
+    'run_partial_aggregation',
+    'update_level',
+    'AGGREGATION_FAN_OUT'
+]
@@ -0,0 +1,343 @@
+"""
+Model Update Wire Format for Oblivion
+Compact, versioned encoding of worker updates for upload to the aggregator.
+
+Layout:
+    b"OBUP" | version (u8) | header length (u32 LE) | JSON header | body
+
+The body is one compressed stream (zstd, or zlib when zstandard is not
+installed) of per-tensor records in header order:
+    dense int8   numel bytes, dequantized as q / scale
+    dense fp16   numel * 2 bytes
+    top-k        k indices (<i4 or <i8) then k values (int8 or fp16)
+    raw          the tensor's own dtype (non-float buffers)
+
+Top-k records are deltas against a base (global) model named in the
+header. The default "auto" codec quantizes only those deltas to int8 and
+sends full weights as fp32, so a dense update is lossless. Int8 scales
+come from fingerprint_gradients, the same quantizer used for the update
+hash. The decoder streams records one at a time, so fedavg.RunningSum
+can fold an update in without building its full state dict.
+"""
+
+import io
+import json
+import struct
+import zlib
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+import torch
+
+from fingerprint import fingerprint_gradients
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+UPDATE_MAGIC = b"OBUP"
+UPDATE_FORMAT_VERSION = 1
+
+_HEADER_PREFIX = struct.Struct("<4sBI")
+_ZSTD_LEVEL = 3
+_READ_CHUNK = 1 << 20
+
+
+# ============ Compression streams ============
+
+class _ZlibReader(io.RawIOBase):
+    """File-like reader that inflates a zlib stream incrementally."""
+
+    def __init__(self, source: BinaryIO):
+        self._source = source
+        self._inflater = zlib.decompressobj()
+        self._buffer = bytearray()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buffer and not self._inflater.eof:
+            chunk = self._source.read(_READ_CHUNK)
+            if not chunk:
+                self._buffer += self._inflater.flush()
+                break
+            self._buffer += self._inflater.decompress(chunk)
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        del self._buffer[:n]
+        return n
+
+
+def _compressor(compression: str):
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=_ZSTD_LEVEL).compressobj()
+    if compression == "zlib":
+        return zlib.compressobj(6)
+    return None
+
+
+def _decompressing_reader(source: BinaryIO, compression: str) -> BinaryIO:
+    if compression == "zstd":
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError("Update is zstd-compressed but zstandard is not installed")
+        return zstandard.ZstdDecompressor().stream_reader(source)
+    if compression == "zlib":
+        return io.BufferedReader(_ZlibReader(source), buffer_size=_READ_CHUNK)
+    return source
+
+
+def _read_exact(stream: BinaryIO, size: int) -> bytearray:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    filled = 0
+    while filled < size:
+        chunk = stream.read(size - filled)
+        if not chunk:
+            raise ValueError("Truncated update payload")
+        view[filled:filled + len(chunk)] = chunk
+        filled += len(chunk)
+    return buffer
+
+
+# ============ Encoding ============
+
+def encode_update(
+    state_dict: Dict[str, torch.Tensor],
+    codec: str = "auto",
+    base_state: Optional[Dict[str, torch.Tensor]] = None,
+    topk_ratio: float = 0.0,
+    metadata: Optional[Dict[str, Any]] = None
+) -> Tuple[bytes, Dict[str, Any]]:
+    """
+    Encode a model update.
+
+    Args:
+        state_dict: Model weights to send
+        codec: "int8", "fp16" or "fp32" for float tensors, or "auto"
+            (int8 for top-k deltas, fp32 for full weights)
+        base_state: Global model the update was trained from; with
+            topk_ratio > 0 only the largest deltas against it are sent
+        topk_ratio: Fraction of entries to keep per tensor (0 = dense)
+        metadata: Extra header fields (e.g. base_url, base_version)
+
+    Returns:
+        Tuple of (payload bytes, header dict)
+    """
+    if codec not in ("auto", "int8", "fp16", "fp32"):
+        raise ValueError(f"Unknown update codec: {codec}")
+
+    compression = "zstd" if ZSTD_AVAILABLE else "zlib"
+    sparse = base_state is not None and topk_ratio > 0
+
+    records = []
+    entries = []
+    float_names = []
+    float_values = []
+
+    for name, tensor in state_dict.items():
+        tensor = tensor.detach().cpu()
+        entry = {"name": name, "shape": list(tensor.shape), "dtype": str(tensor.dtype).replace("torch.", "")}
+
+        if not tensor.is_floating_point():
+            entry["encoding"] = "raw"
+            records.append(tensor.contiguous().numpy())
+            entries.append(entry)
+            continue
+
+        values = tensor.float()
+        # Empty tensors have nothing to select, so they stay dense
+        if sparse and name in base_state and values.numel() > 0:
+            delta = values.reshape(-1) - base_state[name].detach().cpu().float().reshape(-1)
+            k = max(1, int(delta.numel() * topk_ratio))
+            _, indices = torch.topk(delta.abs(), k, sorted=False)
+            indices, _ = torch.sort(indices)
+            index_dtype = np.int32 if delta.numel() < 2 ** 31 else np.int64
+            entry.update({"encoding": "topk", "k": k, "index_dtype": np.dtype(index_dtype).str})
+            records.append(indices.numpy().astype(index_dtype))
+            values = delta[indices]
+        else:
+            entry["encoding"] = "dense"
+
+        record_codec = codec
+        if codec == "auto":
+            record_codec = "int8" if entry["encoding"] == "topk" else "fp32"
+        entry["codec"] = record_codec
+        if record_codec == "fp16":
+            records.append(values.to(torch.float16).numpy())
+        elif record_codec == "fp32":
+            records.append(values.contiguous().numpy())
+        else:
+            # Placeholder, filled from the shared quantizer below
+            records.append(None)
+            float_names.append((len(records) - 1, len(entries)))
+            float_values.append(values)
+        entries.append(entry)
+
+    fingerprint_digest = None
+    if float_values:
+        fingerprint = fingerprint_gradients(float_values)
+        fingerprint_digest = fingerprint.digest
+        for (record_index, entry_index), q, scale in zip(float_names, fingerprint.quantized, fingerprint.scales):
+            records[record_index] = q.reshape(-1).numpy()
+            entries[entry_index]["scale"] = scale
+
+    header = {
+        "version": UPDATE_FORMAT_VERSION,
+        "compression": compression,
+        "codec": codec,
+        "delta": sparse,
+        "fingerprint": fingerprint_digest,
+        "tensors": entries,
+        **(metadata or {})
+    }
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+
+    out = io.BytesIO()
+    out.write(_HEADER_PREFIX.pack(UPDATE_MAGIC, UPDATE_FORMAT_VERSION, len(header_bytes)))
+    out.write(header_bytes)
+
+    compressor = _compressor(compression)
+    for record in records:
+        out.write(compressor.compress(memoryview(np.ascontiguousarray(record)).cast("B")))
+    out.write(compressor.flush())
+
+    return out.getvalue(), header
+
+
+# ============ Decoding ============
+
+def is_encoded_update(prefix: bytes) -> bool:
+    """True if the bytes start with the update magic."""
+    return prefix[:4] == UPDATE_MAGIC
+
+
+def read_header(stream: BinaryIO) -> Dict[str, Any]:
+    """
+    Read and validate the update header, leaving the stream at the body.
+
+    Args:
+        stream: Binary stream positioned at the start of the payload
+
+    Returns:
+        Header dict
+    """
+    magic, version, header_len = _HEADER_PREFIX.unpack(_read_exact(stream, _HEADER_PREFIX.size))
+    if magic != UPDATE_MAGIC:
+        raise ValueError("Not an encoded model update")
+    if version > UPDATE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported update format version {version}")
+    return json.loads(_read_exact(stream, header_len).decode("utf-8"))
+
+
+def _read_array(body: BinaryIO, dtype, count: int) -> np.ndarray:
+    dtype = np.dtype(dtype)
+    return np.frombuffer(_read_exact(body, dtype.itemsize * count), dtype=dtype)
+
+
+def iter_records(stream: BinaryIO, header: Optional[Dict[str, Any]] = None) -> Iterator[Tuple[Dict, Any]]:
+    """
+    Stream decoded tensor records one at a time.
+
+    Yields:
+        (entry, values) where values is a float32 tensor for dense float
+        records, a (indices, float32 values) pair for top-k records, or a
+        tensor in the original dtype for raw records
+    """
+    if header is None:
+        header = read_header(stream)
+    body = _decompressing_reader(stream, header["compression"])
+
+    for entry in header["tensors"]:
+        shape = entry["shape"]
+        numel = int(np.prod(shape)) if shape else 1
+
+        if entry["encoding"] == "raw":
+            dtype = getattr(torch, entry["dtype"])
+            np_dtype = torch.empty(0, dtype=dtype).numpy().dtype
+            yield entry, torch.from_numpy(_read_array(body, np_dtype, numel).copy()).reshape(shape)
+            continue
+
+        count = entry["k"] if entry["encoding"] == "topk" else numel
+        indices = None
+        if entry["encoding"] == "topk":
+            indices = torch.from_numpy(_read_array(body, entry["index_dtype"], count).astype(np.int64))
+
+        codec = entry["codec"]
+        if codec == "int8":
+            raw = _read_array(body, np.int8, count)
+            values = torch.from_numpy(raw.astype(np.float32)).div_(entry["scale"])
+        elif codec == "fp16":
+            values = torch.from_numpy(_read_array(body, "<f2", count).astype(np.float32))
+        else:
+            values = torch.from_numpy(_read_array(body, "<f4", count).copy())
+
+        if indices is not None:
+            yield entry, (indices, values)
+        else:
+            yield entry, values.reshape(shape)
+
+
+def iter_tensors(
+    stream: BinaryIO,
+    header: Optional[Dict[str, Any]] = None,
+    base_state: Optional[Dict[str, torch.Tensor]] = None
+) -> Iterator[Tuple[str, torch.Tensor]]:
+    """
+    Stream an update's full tensors one at a time; sparse delta records
+    are applied as base + scattered delta.
+
+    Args:
+        stream: Payload stream (at the start, or at the body if header given)
+        header: Already-read header
+        base_state: Base model, required for delta updates
+
+    Yields:
+        (name, tensor); raw tensors keep their dtype, the rest are float32
+    """
+    if header is None:
+        header = read_header(stream)
+    if header.get("delta") and base_state is None:
+        raise ValueError("Delta update requires the base model")
+
+    for entry, values in iter_records(stream, header):
+        name = entry["name"]
+        if entry["encoding"] == "topk":
+            indices, delta = values
+            tensor = base_state[name].detach().cpu().float().clone()
+            tensor.view(-1).index_add_(0, indices, delta)
+            yield name, tensor
+        else:
+            yield name, values
+
+
+def decode_update(
+    payload: bytes,
+    base_state: Optional[Dict[str, torch.Tensor]] = None
+) -> Dict[str, torch.Tensor]:
+    """
+    Decode a payload to a full state dict (raw tensors keep their dtype).
+
+    Args:
+        payload: Encoded update bytes
+        base_state: Base model, required for delta updates
+
+    Returns:
+        State dict
+    """
+    return dict(iter_tensors(io.BytesIO(payload), base_state=base_state))
+
+
+__all__ = [
+    'encode_update',
+    'decode_update',
+    'iter_tensors',
+    'iter_records',
+    'read_header',
+    'is_encoded_update',
+    'UPDATE_MAGIC',
+    'UPDATE_FORMAT_VERSION',
+    'ZSTD_AVAILABLE'
+]
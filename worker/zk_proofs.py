@@ -10,9 +10,14 @@ import torch.nn as nn
 import tempfile
 import hashlib
 import asyncio
+import inspect
+from concurrent.futures import ProcessPoolExecutor
 from typing import Optional, Tuple, Dict, Any
 from pathlib import Path
 
+from canonical import canonical_hash
+from circuit_registry import CircuitRegistry
+
 # Try to import ezkl
 try:
     import ezkl
@@ -21,6 +26,84 @@ except ImportError:
     EZKL_AVAILABLE = False
     print("[!] EZKL not available. ZK proofs will use fallback mode.")
 
+# Circuit registry shared by every generator (and every worker, if this
+# points at shared storage). Keys are built once per distinct model.
+ZK_CIRCUIT_REGISTRY = os.environ.get("ZK_CIRCUIT_REGISTRY", ".zk_cache/circuits")
+ZK_LOCK_STALE_SECONDS = float(os.environ.get("ZK_LOCK_STALE_SECONDS", "3600"))
+ZK_PROVING_WORKERS = int(os.environ.get("ZK_PROVING_WORKERS", str(os.cpu_count() or 1)))
+
+DEFAULT_RUN_ARGS = {"input_scale": 8, "param_scale": 8}
+
+
+_registry: Optional[CircuitRegistry] = None
+_proving_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_proving_pool() -> ProcessPoolExecutor:
+    """Get or create the process pool used for witness generation and proving."""
+    global _proving_pool
+    if _proving_pool is None:
+        _proving_pool = ProcessPoolExecutor(max_workers=ZK_PROVING_WORKERS)
+    return _proving_pool
+
+
+def _run_sync(result):
+    """Resolve an EZKL call that may be a coroutine (inside a pool process)."""
+    if inspect.isawaitable(result):
+        async def _wait():
+            return await result
+        return asyncio.run(_wait())
+    return result
+
+
+def _prove_in_scratch(
+    compiled_path: str,
+    pk_path: str,
+    srs_path: str,
+    input_flat: list
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Generate a witness and proof in a private temp directory.
+
+    Args:
+        compiled_path: Compiled circuit (read-only)
+        pk_path: Proving key (read-only)
+        srs_path: Shared SRS (read-only)
+        input_flat: Flattened model input
+
+    Returns:
+        Tuple of (proof, witness) JSON objects
+    """
+    with tempfile.TemporaryDirectory(prefix="zk-prove-") as scratch:
+        input_json_path = os.path.join(scratch, "input.json")
+        witness_path = os.path.join(scratch, "witness.json")
+        proof_path = os.path.join(scratch, "proof.json")
+
+        with open(input_json_path, 'w') as f:
+            json.dump({"input_data": input_flat}, f)
+
+        _run_sync(ezkl.gen_witness(input_json_path, compiled_path, witness_path))
+        _run_sync(ezkl.prove(witness_path, compiled_path, pk_path, proof_path, "single", srs_path))
+
+        with open(proof_path, 'r') as f:
+            proof_data = json.load(f)
+        with open(witness_path, 'r') as f:
+            witness_data = json.load(f)
+
+    return proof_data, witness_data
+
+
+def get_circuit_registry() -> CircuitRegistry:
+    """Get or create the process-wide circuit registry."""
+    global _registry
+    if _registry is None:
+        _registry = CircuitRegistry(
+            ZK_CIRCUIT_REGISTRY,
+            DEFAULT_RUN_ARGS,
+            lock_stale_seconds=ZK_LOCK_STALE_SECONDS
+        )
+    return _registry
+
 
 class ZKProofGenerator:
     """
@@ -43,8 +126,10 @@ class ZKProofGenerator:
         self.model_dir = Path(model_dir)
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(exist_ok=True)
+        self.registry = get_circuit_registry()
         
-        # Paths for ZK artifacts
+        # Paths for ZK artifacts (pointed at the registry by setup)
+        self.circuit_key: Optional[str] = None
         self.settings_path = self.cache_dir / "settings.json"
         self.compiled_model_path = self.cache_dir / "model.ezkl"
         self.pk_path = self.cache_dir / "pk.key"
@@ -94,52 +179,41 @@ class ZKProofGenerator:
                 model = self._create_simple_model()
             model.eval()
             
-            # Export to ONNX
-            onnx_path = self.cache_dir / "model.onnx"
+            # Export to ONNX; the registry keys circuits by these bytes
+            onnx_fd, onnx_name = tempfile.mkstemp(dir=self.cache_dir, suffix=".onnx")
+            os.close(onnx_fd)
+            onnx_path = Path(onnx_name)
             dummy_input = torch.randn(*input_shape)
             
-            torch.onnx.export(
-                model,
-                dummy_input,
-                str(onnx_path),
-                export_params=True,
-                opset_version=12,
-                do_constant_folding=True,
-                input_names=['input'],
-                output_names=['output']
-            )
-            print(f"[ZK] Model exported to ONNX: {onnx_path}")
-            
-            # Generate settings
-            print("[ZK] Generating settings...")
-            run_args = ezkl.PyRunArgs()
-            run_args.input_scale = 8
-            run_args.param_scale = 8
-            ezkl.gen_settings(
-                str(onnx_path),
-                str(self.settings_path),
-                py_run_args=run_args
-            )
+            try:
+                torch.onnx.export(
+                    model,
+                    dummy_input,
+                    str(onnx_path),
+                    export_params=True,
+                    opset_version=12,
+                    do_constant_folding=True,
+                    input_names=['input'],
+                    output_names=['output']
+                )
+                print(f"[ZK] Model exported to ONNX: {onnx_path}")
+                
+                if force_recompile:
+                    self.registry.discard(self.registry.circuit_key(onnx_path, DEFAULT_RUN_ARGS))
+                
+                circuit = await self.registry.ensure(onnx_path, DEFAULT_RUN_ARGS)
+            finally:
+                onnx_path.unlink(missing_ok=True)
             
-            # Compile circuit
-            print("[ZK] Compiling circuit...")
-            ezkl.compile_circuit(
-                str(onnx_path),
-                str(self.compiled_model_path),
-                str(self.settings_path)
-            )
+            if circuit is None:
+                raise RuntimeError("circuit registry returned no artifacts")
             
-            # Get SRS
-            print("[ZK] Getting SRS (this may take a moment)...")
-            ezkl.get_srs(str(self.settings_path))
-            
-            # Setup keys
-            print("[ZK] Generating proving and verification keys...")
-            ezkl.setup(
-                str(self.compiled_model_path),
-                str(self.vk_path),
-                str(self.pk_path)
-            )
+            self.circuit_key = circuit['key']
+            self.settings_path = Path(circuit['settings_path'])
+            self.compiled_model_path = Path(circuit['compiled_path'])
+            self.pk_path = Path(circuit['pk_path'])
+            self.vk_path = Path(circuit['vk_path'])
+            self.srs_path = Path(circuit['srs_path'])
             
             self._is_setup = True
             print("[ZK] Setup complete!")
@@ -172,41 +246,19 @@ class ZKProofGenerator:
             await self.setup(model)
             
         try:
-            # Create input JSON
-            input_json_path = self.cache_dir / "input.json"
-            witness_path = self.cache_dir / "witness.json"
-            proof_path = self.cache_dir / "proof.json"
-            
-            # Flatten input and save
+            # Witness + proof run in the proving pool, each job in its own
+            # scratch directory; circuit artifacts are shared read-only
             input_flat = input_data.flatten().tolist()
-            with open(input_json_path, 'w') as f:
-                json.dump({"input_data": input_flat}, f)
-            
-            # Generate witness
-            print("[ZK] Generating witness...")
-            ezkl.gen_witness(
-                str(input_json_path),
-                str(self.compiled_model_path),
-                str(witness_path)
-            )
-            
-            # Generate proof
-            print("[ZK] Generating proof...")
-            ezkl.prove(
-                str(witness_path),
+            print("[ZK] Generating witness and proof...")
+            loop = asyncio.get_running_loop()
+            proof_data, witness_data = await loop.run_in_executor(
+                get_proving_pool(),
+                _prove_in_scratch,
                 str(self.compiled_model_path),
                 str(self.pk_path),
-                str(proof_path),
-                "single"
+                str(self.srs_path),
+                input_flat
             )
-            
-            # Read proof
-            with open(proof_path, 'r') as f:
-                proof_data = json.load(f)
-                
-            # Read witness for public inputs
-            with open(witness_path, 'r') as f:
-                witness_data = json.load(f)
                 
             # Extract public inputs (outputs are public by default)
             public_inputs = []
@@ -224,7 +276,7 @@ class ZKProofGenerator:
                 'proof': proof_data,
                 'public_inputs': public_inputs,
                 'proof_hex': self._proof_to_hex(proof_data),
-                'input_hash': hashlib.sha256(json.dumps(input_flat).encode()).hexdigest()
+                'input_hash': canonical_hash(input_data)
             }
             
         except Exception as e:
@@ -240,7 +292,7 @@ class ZKProofGenerator:
         input_flat = input_data.flatten().tolist()
         
         # Create deterministic mock proof from input
-        input_hash = hashlib.sha256(json.dumps(input_flat).encode()).hexdigest()
+        input_hash = canonical_hash(input_data)
         
         # Simulate output
         mock_output = sum(input_flat) / len(input_flat)
@@ -295,15 +347,17 @@ class ZKProofGenerator:
             return True
             
         try:
-            proof_path = self.cache_dir / "verify_proof.json"
-            with open(proof_path, 'w') as f:
-                json.dump(proof_data['proof'], f)
-                
-            result = ezkl.verify(
-                str(proof_path),
-                str(self.settings_path),
-                str(self.vk_path)
-            )
+            with tempfile.TemporaryDirectory(prefix="zk-verify-") as scratch:
+                proof_path = Path(scratch) / "proof.json"
+                with open(proof_path, 'w') as f:
+                    json.dump(proof_data['proof'], f)
+                    
+                result = ezkl.verify(
+                    str(proof_path),
+                    str(self.settings_path),
+                    str(self.vk_path),
+                    str(self.srs_path)
+                )
             return result
             
         except Exception as e:
@@ -432,17 +486,18 @@ def create_proof_hash(
     Returns:
         Hash string
     """
-    commitment = {
-        'input': input_data.flatten().tolist(),
-        'output': output_data.flatten().tolist(),
+    return canonical_hash({
+        'input': input_data,
+        'output': output_data,
         'model': model_hash
-    }
-    return hashlib.sha256(json.dumps(commitment, sort_keys=True).encode()).hexdigest()
+    })
 
 
 # Export for use in worker
 __all__ = [
     'ZKProofGenerator',
+    'CircuitRegistry',
+    'get_circuit_registry',
     'ZKVerificationContract', 
     'generate_computation_proof',
     'create_proof_hash',